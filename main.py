@@ -1,13 +1,75 @@
-from pipeline import pipeline_wrapper
-from pipeline.utils.config import load_config
+import argparse
+import os
+import sys
 
-def main() -> None:
+def main(argv: list = None) -> int:
     """
-    Runs the pipeline in production or test mode
+    Runs the pipeline from the command line:
+
+        python -m main dq          runs the registers and DQ checks and prints the DQ report
+        python -m main process     runs the pipeline, leaving the inputs in Input\\Current
+        python -m main publish     runs the pipeline and archives the inputs (what
+                                   'python -m main' does on its own)
+        python -m main backfill    restates archived months (see pipeline.backfill)
+        python -m main bench       runs the benchmarks (see pipeline.benchmarks.run_benchmarks)
+        python -m main export-dq   writes the DQ history store out as the DQ check results 
+                                   workbook (see pipeline.output.dq_history)
+        python -m main export-participation
+                                   writes the participation totals store out as the 
+                                   participation totals workbook
+
+    Each command only imports the modules it uses, e.g. dq doesn't import the mapping,
+    suppression or output modules. Arguments after backfill and bench are passed on to those
+    commands, e.g. 'python -m main backfill 2022-04 2023-03 --workers 4'.
     """
-    config_file = load_config.load_config("config.json")
-    pipeline_wrapper.run(config_file)
+    config_parser = argparse.ArgumentParser(add_help=False)
+    config_parser.add_argument("--config", default="config.json", help="Path to the config file")
+    parser = argparse.ArgumentParser(description="LDHC publication pipeline")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("dq", parents=[config_parser], help="Run the registers and DQ checks and print the DQ report, without writing anything")
+    commands.add_parser("process", parents=[config_parser], help="Run the pipeline and write the outputs without archiving the inputs")
+    commands.add_parser("publish", parents=[config_parser], help="Run the pipeline, write the outputs and archive the inputs")
+    commands.add_parser("backfill", add_help=False, help="Restate a range of archived months")
+    commands.add_parser("bench", add_help=False, help="Time each pipeline stage on synthetic data")
+    export_dq_parser = commands.add_parser("export-dq", parents=[config_parser], help="Write the DQ history store out as the DQ check results workbook")
+    export_dq_parser.add_argument("--output", help="Where to write the workbook, defaults to Checks\\DQ_check_results.xlsx")
+    export_dq_parser.add_argument("--ach-dates", nargs="+", help="Achievement dates (YYYY-MM-DD) to export, defaults to all")
+    export_participation_parser = commands.add_parser("export-participation", parents=[config_parser], help="Write the participation totals store out as the participation totals workbook")
+    export_participation_parser.add_argument("--output", help="Where to write the workbook, defaults to Checks\\LDHC_participation_totals.xlsx")
+    args, command_args = parser.parse_known_args(argv)
+    command = args.command or "publish"
+    if command == "backfill":
+        from pipeline import backfill
+        return backfill.main(command_args) or 0
+    if command == "bench":
+        from pipeline.benchmarks import run_benchmarks
+        return run_benchmarks.main(command_args)
+    if command_args:
+        parser.error(f"unrecognized arguments: {' '.join(command_args)}")
+    from pipeline.utils.config import load_config
+    config_file = load_config.load_config(getattr(args, "config", "config.json"))
+    if command == "dq":
+        from pipeline import dq
+        dq.run(config_file)
+        return 0
+    if command == "export-dq":
+        from pipeline.output import dq_history
+        store_path = dq_history.get_DQ_history_path(config_file)
+        if not os.path.exists(store_path):
+            parser.error(f"There is no DQ history store at {store_path}")
+        print(f"DQ history written to {dq_history.export_DQ_workbook(config_file, args.output, args.ach_dates)}")
+        return 0
+    if command == "export-participation":
+        from pipeline.output import participation_history
+        store_path = participation_history.get_participation_store_path(config_file)
+        if not os.path.exists(store_path):
+            parser.error(f"There is no participation totals store at {store_path}")
+        print(f"Participation totals written to {participation_history.export_participation_workbook(config_file, args.output)}")
+        return 0
+    from pipeline import pipeline_wrapper
+    pipeline_wrapper.run(config_file, archive_inputs=command == "publish")
+    return 0
 
 
 if __name__=="__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,179 @@
+import argparse
+import os
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from .data import load, collection_schema
+from .processing import original_mapping, measure_matrix
+from .processing.participation import participation_table
+from .output import write_DQ_checks, write_LDHC_monthly, dq_history, participation_history, archive
+from .utils.config import load_config
+from .utils.scheduler.stages import run_stages
+from .utils.dates import dates
+from . import pipeline_wrapper
+
+# State loaded once by each backfill worker process (see init_worker)
+_worker_state = {}
+
+def run_backfill(config_file: dict, first_month: str, last_month: str, max_workers: int = None) -> list:
+    """Restates a range of archived months. Each month's archived LDHC input and
+    participation report (the latest archived for the month, see archive.archive) are
+    processed as in a normal run, with the months running in parallel on a process pool,
+    and each month's output is written to the output folder. The inputs are left in the archive.
+
+    The workers don't write to the DQ history or participation totals stores. They return
+    their DQ results and participation totals, which are added to the stores once every
+    month has been processed, in month order, so the stores end up the same however the
+    months were scheduled and nothing is added if any month fails. The participation totals
+    of the months replace those already in the store.
+
+    Args:
+        config_file (dict): Dict containing all config file information
+        first_month (str): The first month to restate in the form YYYY-MM
+        last_month (str): The last month to restate in the form YYYY-MM
+        max_workers (int, optional): Number of worker processes. Defaults to one per CPU
+        (at most one per month).
+
+    Raises:
+        FileNotFoundError: Raised if any month's archived inputs are missing
+
+    Returns:
+        list: The months restated
+    """
+    months = [str(month) for month in pd.period_range(first_month, last_month, freq="M")]
+    missing_inputs = [
+        path for month in months for path in get_archived_input_paths(config_file, month).values()
+        if not os.path.exists(path)
+    ]
+    if missing_inputs:
+        raise FileNotFoundError(f"Archived inputs not found for the backfill: {missing_inputs}")
+    max_workers = min(max_workers or os.cpu_count() or 1, len(months))
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker, initargs=(config_file,)) as executor:
+        month_results = list(executor.map(backfill_month, months))
+    merge_month_results(config_file, month_results)
+    return months
+
+def get_archived_input_paths(config_file: dict, month: str) -> dict:
+    """Gets the paths of a month's archived inputs (see archive.get_archived_input_path)
+
+    Args:
+        config_file (dict): Dict containing all config file information
+        month (str): The month in the form YYYY-MM
+
+    Returns:
+        dict: The paths of the month's "LDHC_monthly" and "Participation" inputs
+    """
+    return {
+        input_type: archive.get_archived_input_path(config_file, input_type, month)
+        for input_type in ["LDHC_monthly", "Participation"]
+    }
+
+def init_worker(config_file: dict) -> None:
+    """Loads what every month shares once per worker process: the config and the compiled
+    collection schema. Reference data connections are also opened once per process (see
+    reference.get_engine)."""
+    _worker_state["config_file"] = config_file
+    _worker_state["collection_schema"] = collection_schema.load_collection_schema(config_file)
+
+def backfill_month(month: str) -> dict:
+    """Processes one archived month in a worker and writes its output
+
+    Args:
+        month (str): The month in the form YYYY-MM
+
+    Returns:
+        dict: The month's achievement date (YYYY-MM-DD) under "ach_date", its DQ results
+        (see write_DQ_checks.get_DQ_results) under "DQ_results" and its participation totals
+        under "participation_totals"
+    """
+    config_file = _worker_state["config_file"]
+    input_paths = get_archived_input_paths(config_file, month)
+    LDHC_in = load.read_input_file(input_paths["LDHC_monthly"], "LDHC_monthly", config_file)
+    Participation_in = load.read_input_file(input_paths["Participation"], "Participation", config_file)
+    data = {
+        "LDHC_Monthly_df": LDHC_in,
+        "LDHC_Monthly_matrix": measure_matrix.build(LDHC_in),
+        "Participation_df": Participation_in,
+        "Collection_schema": _worker_state["collection_schema"],
+        "config_file": config_file,
+        "reference_data": original_mapping.prefetch_reference_data(LDHC_in, config_file)
+    }
+    results = run_stages(get_backfill_stages(), data, keep=["LDHC_mapped", "DQ_results", "participation_totals"])
+    write_LDHC_monthly.write_LDHC(results["LDHC_mapped"], config_file)
+    return {
+        "ach_date": dates.get_achievement_date(LDHC_in).strftime("%Y-%m-%d"),
+        "DQ_results": results["DQ_results"],
+        "participation_totals": results["participation_totals"]
+    }
+
+def get_backfill_stages() -> list:
+    """Gets the processing stages (see pipeline_wrapper.get_processing_stages) with the DQ
+    results and participation totals returned rather than written to their stores
+
+    Returns:
+        list: The backfill stages
+    """
+    backfill_stages = []
+    for stage in pipeline_wrapper.get_processing_stages():
+        if stage.name == "write_DQ_checks":
+            stage = stage._replace(
+                function=write_DQ_checks.get_DQ_results,
+                inputs={key: value for key, value in stage.inputs.items() if key != "config"}
+            )
+        elif stage.name == "participation":
+            stage = stage._replace(
+                function=get_participation_totals,
+                inputs={"Participation_df": "Participation_df", "LDHC_input_df": "LDHC_with_registers", "config_file": "config_file"}
+            )
+        backfill_stages.append(stage)
+    return backfill_stages
+
+def get_participation_totals(Participation_df: pd.DataFrame, LDHC_input_df: pd.DataFrame, config_file: dict) -> pd.DataFrame:
+    """Gets the participation totals of a single month (see participation_table.get_participation_totals)"""
+    return participation_table.get_participation_totals(
+        Participation_df, 
+        [LDHC_input_df], 
+        as_at_ach_date=config_file.get("Participation as at achievement date", "False") == "True"
+    )
+
+def merge_month_results(config_file: dict, month_results: list) -> None:
+    """Adds the months' DQ results to the DQ history and their participation totals to the
+    participation totals store, in achievement date order. The workbooks are then exported
+    once if this is switched on in the config.
+
+    Args:
+        config_file (dict): Dict containing all config file information
+        month_results (list): The results of backfill_month for each month
+    """
+    month_results = sorted(month_results, key=lambda month_result: month_result["ach_date"])
+    run_date = dates.get_run_date().strftime("%d/%m/%Y")
+    for month_result in month_results:
+        dq_history.append_DQ_results(config_file, month_result["DQ_results"], month_result["ach_date"], run_date)
+    participation_history.write_participation_totals(
+        pd.concat([month_result["participation_totals"] for month_result in month_results], ignore_index=True),
+        config_file,
+        restate=True
+    )
+    if config_file.get("Export DQ history workbook", "False") == "True":
+        dq_history.export_DQ_workbook(config_file)
+    if config_file.get("Export participation totals workbook", "False") == "True":
+        participation_history.export_participation_workbook(config_file)
+    return
+
+def main(argv: list = None) -> None:
+    """Runs a backfill from the command line, e.g.
+
+        python -m pipeline.backfill 2022-04 2023-03
+    """
+    parser = argparse.ArgumentParser(description="Restates a range of archived months")
+    parser.add_argument("first_month", help="First month to restate (YYYY-MM)")
+    parser.add_argument("last_month", help="Last month to restate (YYYY-MM)")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes")
+    parser.add_argument("--config", default="config.json", help="Path to the config file")
+    args = parser.parse_args(argv)
+    config_file = load_config.load_config(args.config)
+    months = run_backfill(config_file, args.first_month, args.last_month, args.workers)
+    print(f"Restated {len(months)} months: {months[0]} to {months[-1]}")
+    return
+
+if __name__ == "__main__":
+    main()
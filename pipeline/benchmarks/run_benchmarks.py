@@ -0,0 +1,288 @@
+import argparse
+import contextlib
+import hashlib
+import io
+import os
+import sys
+import time
+import warnings
+from functools import partial
+import pandas as pd
+from . import synthetic
+from ..data import load, collection_schema
+from ..processing import registers, single_pass_checks, measure_matrix, insert_additional_info_into_LDHC, format, original_suppression, original_mapping
+from ..processing.DQ_checks import DQ_check_1, DQ_check_2, DQ_check_3, remove_incomplete_pracs
+from ..processing.participation import participation_table
+from ..output import write_LDHC_monthly
+from .. import pipeline_wrapper
+
+DEFAULT_SIZES = [500, 2000, 7000]
+RESULT_COLS = ["N_PRACTICES", "STAGE", "VARIANT", "SECONDS", "ROWS_IN", "ROWS_OUT", "MATCHES_FIRST_VARIANT", "ERROR"]
+RESULTS_FILE_NAME = "benchmark_results.csv"
+
+def run_benchmarks(sizes: list, n_months: int = 3, repeats: int = 3, seed: int = 0, work_folder: str = "benchmark_data") -> pd.DataFrame:
+    """Times every stage of the pipeline on synthetic data (see synthetic.create_benchmark_root)
+    for each number of practices. Where a stage has more than one implementation (the legacy
+    per-check modules and the single pass checks, the loading options, the reference data
+    backends and the stage scheduler's thread and process pools) every variant is timed and
+    its output compared to that of the first variant.
+
+    The results are written to benchmark_results.csv in the work folder.
+
+    Args:
+        sizes (list): Numbers of practices to benchmark
+        n_months (int, optional): Months of input, used by the participation stage. Defaults to 3.
+        repeats (int, optional): Times each variant is run, the fastest is kept. Defaults to 3.
+        seed (int, optional): Seed of the synthetic data. Defaults to 0.
+        work_folder (str, optional): Where the synthetic roots and results are written.
+        Defaults to "benchmark_data".
+
+    Returns:
+        pd.DataFrame: One row per size, stage and variant (see RESULT_COLS)
+    """
+    os.makedirs(work_folder, exist_ok=True)
+    results = []
+    for n_practices in sizes:
+        root = os.path.join(work_folder, f"practices_{n_practices}")
+        config_file = synthetic.create_benchmark_root(root, n_practices, n_months, seed)
+        input_paths = synthetic.get_input_paths(root, synthetic.get_month_ends(n_months))
+        results.extend(benchmark_stages(config_file, input_paths, n_practices, repeats))
+    results_df = pd.DataFrame(results, columns=RESULT_COLS)
+    results_df.to_csv(os.path.join(work_folder, RESULTS_FILE_NAME), index=False)
+    return results_df
+
+def benchmark_stages(config_file: dict, input_paths: dict, n_practices: int, repeats: int) -> list:
+    """Times the stages in pipeline order, passing the output of each stage's first variant on
+    to the stages that use it
+
+    Args:
+        config_file (dict): Config for the synthetic root
+        input_paths (dict): Paths of the synthetic inputs (see synthetic.get_input_paths)
+        n_practices (int): Number of practices in the synthetic root
+        repeats (int): Times each variant is run
+
+    Returns:
+        list: The result rows
+    """
+    results = []
+    def time_stage(stage_name, variants, rows_in):
+        stage_results, output = time_variants(stage_name, variants, repeats, rows_in)
+        results.extend([n_practices, *stage_result] for stage_result in stage_results)
+        return output
+
+    LDHC_path = input_paths["LDHC_monthly"][-1]
+    LDHC_input_df = time_stage("load", {
+        "untyped": partial(load.read_input_file, LDHC_path, "LDHC_monthly", {**config_file, "Typed input loading": "False", "Use input cache": "False"}),
+        "typed": partial(load.read_input_file, LDHC_path, "LDHC_monthly", {**config_file, "Typed input loading": "True", "Use input cache": "False"}),
+        "typed, cached": partial(load.read_input_file, LDHC_path, "LDHC_monthly", {**config_file, "Typed input loading": "True", "Use input cache": "True"})
+    }, rows_in=None)
+    participation_df = load.read_input_file(input_paths["Participation"], "Participation", config_file)
+    schema = collection_schema.load_collection_schema(config_file)
+    LDHC_matrix = time_stage("measure_matrix", {"single pass": partial(measure_matrix.build, LDHC_input_df)}, len(LDHC_input_df))
+
+    register_dfs = {}
+    for register_name, relevant_indicator in schema.register_indicators.items():
+        register_dfs[register_name] = time_stage(register_name, {
+            "legacy": partial(registers.create_register_df, LDHC_input_df, relevant_indicator),
+            "matrix": partial(single_pass_checks.get_register_df, LDHC_matrix, relevant_indicator, schema.register_field_names)
+        }, len(LDHC_input_df))
+    time_stage("DQ_1", {
+        "legacy": partial(DQ_check_1.get_problem_prac_ind_df, LDHC_input_df),
+        "matrix": partial(single_pass_checks.get_DQ_1_df, LDHC_matrix)
+    }, len(LDHC_input_df))
+    DQ_flag_2_df = time_stage("DQ_2", {
+        "legacy": partial(DQ_check_2.get_problem_rows_df, LDHC_input_df, config_file),
+        "matrix": partial(single_pass_checks.get_DQ_2_df, LDHC_matrix, schema.expected_columns)
+    }, len(LDHC_input_df))
+    time_stage("DQ_3", {
+        "legacy": partial(DQ_check_3.get_problem_practice_series, register_dfs["register_14_17_df"], register_dfs["register_18_ov_df"], LDHC_input_df),
+        "matrix": partial(single_pass_checks.get_DQ_3_series, LDHC_matrix, register_dfs["register_14_17_df"], register_dfs["register_18_ov_df"], schema.payment_count_indicator)
+    }, len(LDHC_input_df))
+
+    LDHC_with_registers = time_stage("insert_registers", {
+        "current": partial(insert_additional_info_into_LDHC.insert, LDHC_input_df, register_dfs["register_14_17_df"], register_dfs["register_18_ov_df"])
+    }, len(LDHC_input_df))
+    LDHC_problem_pracs_removed = time_stage("remove_incomplete_pracs", {
+        "current": partial(remove_incomplete_pracs.remove, LDHC_with_registers, config_file, DQ_flag_2_df)
+    }, len(LDHC_with_registers))
+    LDHC_formatted = time_stage("format", {
+        "current": lambda: format.apply_formatting(LDHC_problem_pracs_removed.copy())
+    }, len(LDHC_problem_pracs_removed))
+    suppress = partial(
+        original_suppression.suppress_output,
+        measure_dict_meas_col_name='MEASURE',
+        measure_dict_meas_type_col_name='MEASURE_TYPE',
+        measure_dict_meas_description_col_name='MEASURE_DESCRIPTION',
+        main_table_meas_col_name='MEASURE',
+        main_table_value_col_name='VALUE',
+        main_table_prac_code_col_name='PRACTICE_CODE',
+        main_table_ind_code_col_name='IND_CODE',
+        config_file=config_file,
+        collection_schema=schema
+    )
+    LDHC_suppressed = time_stage("suppression", {
+        "current": lambda: suppress(main_table=LDHC_formatted.copy())
+    }, len(LDHC_formatted))
+    # The first snapshot run fills the snapshot, the fastest run reads from it
+    LDHC_mapped = time_stage("mapping", {
+        "sql (SQLite stand-in)": partial(original_mapping.mapping, LDHC_suppressed, {**config_file, "Reference data backend": "sql"}),
+        "snapshot": partial(original_mapping.mapping, LDHC_suppressed, {**config_file, "Reference data backend": "snapshot"})
+    }, len(LDHC_suppressed))
+    LDHC_input_dfs = [pd.read_csv(path) for path in input_paths["LDHC_monthly"][:-1]] + [LDHC_with_registers]
+    time_stage("participation", {
+        "current": partial(participation_table.create_participation_tables, participation_df, LDHC_input_dfs, {**config_file, "Restate participation totals": "True"})
+    }, len(participation_df))
+    time_stage("output", {
+        "pandas encoder": partial(write_output, LDHC_mapped, {**config_file, "Output CSV encoder": "pandas"}),
+        "arrow encoder": partial(write_output, LDHC_mapped, {**config_file, "Output CSV encoder": "arrow"}),
+        "arrow encoder + csv.gz + parquet": partial(write_output, LDHC_mapped, {**config_file, "Additional output formats": ["csv.gz", "parquet"]})
+    }, len(LDHC_mapped))
+
+    input_dict = {
+        "LDHC_Monthly_df": LDHC_input_df,
+        "LDHC_Monthly_matrix": LDHC_matrix,
+        "Participation_df": participation_df,
+        "Collection_schema": schema
+    }
+    time_stage("processing", {
+        "threads": partial(pipeline_wrapper.processing, input_dict, {**config_file, "Run CPU-bound stages in processes": "False"}),
+        "processes": partial(pipeline_wrapper.processing, input_dict, {**config_file, "Run CPU-bound stages in processes": "True"})
+    }, len(LDHC_input_df))
+    return results
+
+def write_output(LDHC_mapped: pd.DataFrame, config_file: dict) -> pd.Series:
+    """Writes the output (see write_LDHC_monthly.write_LDHC) and returns a hash of the output
+    csv, so that the csv each variant writes can be compared"""
+    write_LDHC_monthly.write_LDHC(LDHC_mapped, config_file)
+    with open(write_LDHC_monthly.get_output_path(LDHC_mapped, config_file), "rb") as f:
+        return pd.Series([hashlib.sha256(f.read()).hexdigest()], name="SHA256")
+
+def time_variants(stage_name: str, variants: dict, repeats: int, rows_in: int = None) -> tuple:
+    """Times each variant of a stage and compares its output to the first variant's
+
+    Args:
+        stage_name (str): The stage
+        variants (dict): Maps each variant name to a function taking no arguments
+        repeats (int): Times each variant is run, the fastest is kept
+        rows_in (int, optional): Rows in the stage's input. Defaults to None.
+
+    Returns:
+        tuple: The result rows (without the number of practices) and the output of the first
+        variant that succeeded
+    """
+    timings = []
+    for variant, function in variants.items():
+        seconds, output, error = time_call(function, repeats)
+        timings.append((variant, seconds, output, error))
+    reference = next((output for _, _, output, error in timings if error is None), None)
+    stage_results = []
+    for variant, seconds, output, error in timings:
+        if error is None and len(variants) > 1:
+            matches = compare_outputs(reference, output)
+        else:
+            matches = None
+        if isinstance(output, measure_matrix.MeasureMatrix):
+            rows_out = len(output.practices)
+        else:
+            rows_out = len(output) if hasattr(output, "__len__") else None
+        stage_results.append([stage_name, variant, seconds, rows_in, rows_out, matches, error])
+    return stage_results, reference
+
+def time_call(function, repeats: int) -> tuple:
+    """Runs a function repeatedly with its printing and warnings captured
+
+    Returns:
+        tuple: The fastest wall time in seconds, the output of the last run and the error
+        raised (None if the function succeeded)
+    """
+    best = None
+    output = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()), warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                output = function()
+        except Exception as e:
+            return None, None, repr(e)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, output, None
+
+def compare_outputs(reference, output) -> str:
+    """Compares a stage output to the reference output, after putting both in a common form
+    (see normalise_output)
+
+    Returns:
+        str: 'identical', 'same rows (order differs)' or 'different'
+    """
+    reference, output = normalise_output(reference), normalise_output(output)
+    if reference is None or output is None:
+        return "identical" if reference is output else "different"
+    if reference.equals(output):
+        return "identical"
+    if list(reference.columns) == list(output.columns) and len(reference) == len(output):
+        sort_cols = list(reference.columns)
+        if reference.sort_values(sort_cols).reset_index(drop=True).equals(output.sort_values(sort_cols).reset_index(drop=True)):
+            return "same rows (order differs)"
+    return "different"
+
+def normalise_output(output):
+    """Puts a stage output into a form that can be compared across variants: series become
+    single column dataframes, the index is dropped and every value is compared as a string so
+    that dtype differences (e.g. categorical against object codes) are ignored.
+
+    Args:
+        output: The stage output
+
+    Returns:
+        Optional[pd.DataFrame]: The normalised output, None if the stage returns nothing
+    """
+    if output is None:
+        return None
+    if isinstance(output, measure_matrix.MeasureMatrix):
+        output = measure_matrix.to_long(output)
+    if isinstance(output, pd.Series):
+        output = output.to_frame()
+    return output.reset_index(drop=True).astype(str)
+
+def get_timings_table(results_df: pd.DataFrame) -> pd.DataFrame:
+    """Gets the seconds each variant took for each number of practices, with the stages, 
+    variants and sizes in the order they were run. Variants without a timing are left out.
+
+    Args:
+        results_df (pd.DataFrame): The benchmark results (see run_benchmarks)
+
+    Returns:
+        pd.DataFrame: The timings, one row per (STAGE, VARIANT) and one column per N_PRACTICES
+    """
+    timings_df = results_df.pivot_table(index=["STAGE", "VARIANT"], columns="N_PRACTICES", values="SECONDS")
+    run_order = pd.MultiIndex.from_frame(results_df[["STAGE", "VARIANT"]].drop_duplicates())
+    return timings_df.reindex(index=run_order, columns=results_df["N_PRACTICES"].unique()).dropna(how="all")
+
+def main(argv: list = None) -> int:
+    """Runs the benchmarks from the command line, e.g.
+
+        python -m pipeline.benchmarks.run_benchmarks --sizes 500 2000 7000 --months 3
+
+    Returns:
+        int: 1 if any variant's output differs from its stage's first variant, otherwise 0
+    """
+    parser = argparse.ArgumentParser(description="Times each pipeline stage on synthetic data")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Numbers of practices")
+    parser.add_argument("--months", type=int, default=3, help="Months of input")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs of each variant, the fastest is kept")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic data")
+    parser.add_argument("--work-folder", default="benchmark_data", help="Where the synthetic data and results are written")
+    args = parser.parse_args(argv)
+    results_df = run_benchmarks(args.sizes, args.months, args.repeats, args.seed, args.work_folder)
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(get_timings_table(results_df))
+        problems = results_df[results_df["ERROR"].notna() | (results_df["MATCHES_FIRST_VARIANT"] == "different")]
+        if len(problems) > 0:
+            print(problems[["N_PRACTICES", "STAGE", "VARIANT", "MATCHES_FIRST_VARIANT", "ERROR"]])
+    print(f"Results written to {os.path.join(args.work_folder, RESULTS_FILE_NAME)}")
+    return int((results_df["MATCHES_FIRST_VARIANT"] == "different").any())
+
+if __name__ == "__main__":
+    sys.exit(main())
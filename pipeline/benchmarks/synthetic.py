@@ -0,0 +1,326 @@
+import csv
+import datetime
+import json
+import os
+import shutil
+import sqlite3
+from contextlib import closing
+import numpy as np
+import pandas as pd
+
+PUBLIC_METADATA_FOLDER = os.path.join(os.path.dirname(__file__), "..", "..", "public_metadata")
+PARTICIPATION_TEMPLATE = "synthetic-LDHC_QS Part Status-LDHC.csv"
+LDHC_INPUT_NAME = "synthetic-LDHC_Ind_Input_Details_LDHC.csv"
+# Number of records before the first practice row in the QS Part Status report
+PARTICIPATION_HEADER_RECORDS = 10
+QUALITY_SERVICE = "LDHC"
+ADDITIONAL_INDICATOR = ("LDHCMI099", "Numerator")
+# Share of practices signed up to each PCN, sub-ICB location, ICB and region
+PRACTICES_PER_PCN = 8
+PCNS_PER_SUB_ICB = 6
+SUB_ICBS_PER_ICB = 3
+N_REGIONS = 7
+
+def get_practice_codes(n_practices: int) -> list:
+    """Gets n ODS style practice codes (a letter followed by 5 digits), in code order"""
+    return sorted(f"{chr(65 + i % 25)}{81001 + i // 25:05d}" for i in range(n_practices))
+
+def get_month_ends(n_months: int, first_month: str = "2022-04") -> list:
+    """Gets the achievement dates (month ends) of n consecutive months"""
+    # Month ends are 'ME' from pandas 2.2, 'M' is deprecated there
+    pandas_version = tuple(int(part) for part in pd.__version__.split(".")[:2])
+    return list(pd.date_range(start=first_month, periods=n_months, freq="ME" if pandas_version >= (2, 2) else "M"))
+
+def generate_LDHC_input(practice_codes: list, ach_date: pd.Timestamp, ind_meas_map: pd.DataFrame, measure_types: dict, rng: np.random.Generator, anomaly_rate: float = 0.005) -> pd.DataFrame:
+    """Generates an Ind_Input_Details_LDHC extract for one month, one row per practice per 
+    (IND_CODE, FIELD_NAME) pair of the indicator to measure map, ordered by practice.
+
+    Denominators scale with a per-practice list size, PCAs and numerators are drawn from
+    what is left of the denominator and the payment count is the number of health checks 
+    delivered, so the registers and DQ rules behave as they do on real data. anomaly_rate of 
+    the rows are dropped (DQ2 missing), the numerators are pushed above the denominator 
+    (DQ1) and extra rows for an unknown indicator are added (DQ2 additional) for the same share
+    of practices.
+
+    Args:
+        practice_codes (list): Practices submitting data
+        ach_date (pd.Timestamp): The achievement date
+        ind_meas_map (pd.DataFrame): The indicator to measure map
+        measure_types (dict): Maps each measure to its type (see collection_schema)
+        rng (np.random.Generator): Random generator
+        anomaly_rate (float, optional): Share of rows/practices with DQ issues. Defaults to 0.005.
+
+    Returns:
+        pd.DataFrame: The input extract
+    """    
+    n_practices = len(practice_codes)
+    list_size = rng.gamma(shape=2.0, scale=15.0, size=n_practices)
+    values = {}
+    for ind_code, fields in ind_meas_map.groupby("IND_CODE", sort=False)["FIELD_NAME"]:
+        fields = list(fields)
+        if "Denominator" not in fields:
+            continue
+        denominator = rng.poisson(list_size * rng.uniform(0.3, 1.0))
+        PCA = rng.binomial(denominator, 0.05)
+        numerator = rng.binomial(denominator - PCA, 0.6)
+        for field in fields:
+            if field == "Denominator":
+                values[(ind_code, field)] = denominator
+            elif field == "Numerator":
+                values[(ind_code, field)] = numerator
+            elif measure_types.get(field) == "PCA":
+                values[(ind_code, field)] = PCA
+            else:
+                values[(ind_code, field)] = rng.poisson(0.5, n_practices)
+    register_numerators = [values[(ind_code, "Numerator")] for ind_code in ("LDHCMI034", "LDHCMI035") if (ind_code, "Numerator") in values]
+    payment_count = np.sum(register_numerators, axis=0) if register_numerators else rng.poisson(5, n_practices)
+    for ind_code, field in ind_meas_map[["IND_CODE", "FIELD_NAME"]].itertuples(index=False):
+        values.setdefault((ind_code, field), payment_count)
+
+    DQ1_practices = rng.random(n_practices) < anomaly_rate
+    for (ind_code, field), column in values.items():
+        if field == "Numerator" and (ind_code, "Denominator") in values:
+            values[(ind_code, field)] = np.where(DQ1_practices, values[(ind_code, "Denominator")] + 1, column)
+
+    columns = list(ind_meas_map[["IND_CODE", "FIELD_NAME"]].itertuples(index=False, name=None))
+    value_matrix = np.column_stack([values[column] for column in columns])
+    LDHC_input = pd.DataFrame({
+        "QUALITY_SERVICE": QUALITY_SERVICE,
+        "ORG_CODE": np.repeat(practice_codes, len(columns)),
+        "ACH_DATE": int(ach_date.strftime("%Y%m%d")),
+        "IND_CODE": np.tile([ind_code for ind_code, _ in columns], n_practices),
+        "FIELD_NAME": np.tile([field for _, field in columns], n_practices),
+        "VALUE": value_matrix.ravel(),
+        "APPROVED": "Y"
+    })
+    LDHC_input = LDHC_input[rng.random(len(LDHC_input)) >= anomaly_rate]
+    additional_practices = np.asarray(practice_codes)[rng.random(n_practices) < anomaly_rate]
+    additional_rows = pd.DataFrame({
+        "QUALITY_SERVICE": QUALITY_SERVICE,
+        "ORG_CODE": additional_practices,
+        "ACH_DATE": int(ach_date.strftime("%Y%m%d")),
+        "IND_CODE": ADDITIONAL_INDICATOR[0],
+        "FIELD_NAME": ADDITIONAL_INDICATOR[1],
+        "VALUE": 1,
+        "APPROVED": "Y"
+    })
+    return pd.concat([LDHC_input, additional_rows]).sort_values("ORG_CODE", kind="stable").reset_index(drop=True)
+
+def generate_participation_report(path: str, practice_codes: list, ach_dates: list, rng: np.random.Generator) -> None:
+    """Writes a QS Part Status report shaped like public_metadata's synthetic report, giving 
+    each practice a status history over the months: every practice is offered the service at
+    the start, most are approved within the months, and some are rejected or cancel.
+
+    Args:
+        path (str): Where to write the report
+        practice_codes (list): Practices in the report
+        ach_dates (list): The achievement dates the history covers
+        rng (np.random.Generator): Random generator
+    """    
+    with open(os.path.join(PUBLIC_METADATA_FOLDER, PARTICIPATION_TEMPLATE), newline="") as f:
+        header_records = [record for _, record in zip(range(PARTICIPATION_HEADER_RECORDS), csv.reader(f))]
+    first_day = ach_dates[0].replace(day=1)
+    n_days = (ach_dates[-1] - first_day).days + 1
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerows(header_records)
+        for practice_code in practice_codes:
+            history = [("Offered", first_day)]
+            outcome = rng.random()
+            decision_date = first_day + datetime.timedelta(days=int(rng.integers(0, n_days)))
+            if outcome < 0.85:
+                history.append(("Approved", decision_date))
+                if rng.random() < 0.03:
+                    history.append(("Cancelled", decision_date + datetime.timedelta(days=int(rng.integers(1, 60)))))
+            elif outcome < 0.92:
+                history.append(("Rejected", decision_date))
+            region = f"Region {ord(practice_code[0]) % N_REGIONS}"
+            for status, status_date in history:
+                writer.writerow(["", practice_code, "", f"Practice {practice_code}", "", "", "GP Practice", region, status, "", status_date.strftime("%d/%m/%Y"), ""])
+
+def get_geography(practice_codes: list) -> tuple:
+    """Assigns every practice a PCN, sub-ICB location, ICB and commissioning region
+
+    Returns:
+        tuple: The practices (one row per practice with its codes) and the geography lookup 
+        (ODS_CODE, ONS_CODE, NAME, GEOGRAPHY)
+    """    
+    index = np.arange(len(practice_codes))
+    PCN_index = index // PRACTICES_PER_PCN
+    sub_ICB_index = PCN_index // PCNS_PER_SUB_ICB
+    ICB_index = sub_ICB_index // SUB_ICBS_PER_ICB
+    region_index = ICB_index % N_REGIONS
+    practices = pd.DataFrame({
+        "PRACTICE_CODE": practice_codes,
+        "PRACTICE_NAME": [f"Practice {practice_code}" for practice_code in practice_codes],
+        "PCN_ODS_CODE": [f"U{i:05d}" for i in PCN_index],
+        "PCN_NAME": [f"PCN {i}" for i in PCN_index],
+        "SUB_ICB_LOC_CODE": [f"{i:02d}{chr(65 + i % 26)}" for i in sub_ICB_index],
+        "ICB_CODE": [f"Q{i:02d}" for i in ICB_index],
+        "COMM_REGION_CODE": [f"Y{56 + i}" for i in region_index]
+    })
+    geography = pd.concat([
+        pd.DataFrame({"ODS_CODE": practices[code_col].unique()}).assign(GEOGRAPHY=level)
+        for code_col, level in [("SUB_ICB_LOC_CODE", "SUB_ICB"), ("ICB_CODE", "ICB"), ("COMM_REGION_CODE", "REGION")]
+    ], ignore_index=True)
+    ONS_prefixes = {"SUB_ICB": "E38", "ICB": "E54", "REGION": "E40"}
+    geography["ONS_CODE"] = [f"{ONS_prefixes[level]}{i:06d}" for i, level in enumerate(geography["GEOGRAPHY"])]
+    geography["NAME"] = geography["GEOGRAPHY"].str.replace("_", "-") + " " + geography["ODS_CODE"]
+    return practices, geography[["NAME", "ONS_CODE", "ODS_CODE", "GEOGRAPHY"]]
+
+def generate_reference_database(path: str, practice_codes: list, rng: np.random.Generator) -> pd.DataFrame:
+    """Writes a SQLite stand-in for the ODS practice, ODS API (PCN) and ONS code history 
+    tables the reference queries use (see reference.REFERENCE_QUERIES). Attached under the 
+    schema name 'dbo' the queries run against it unchanged. Closed practices, superseded
+    practice records, ended PCN memberships and practices without a PCN are included so 
+    that every filter of the queries is exercised.
+
+    Args:
+        path (str): Where to write the database
+        practice_codes (list): The practices submitting data
+        rng (np.random.Generator): Random generator
+
+    Returns:
+        pd.DataFrame: The manual geography reference file contents (see original_mapping)
+    """    
+    practices, geography = get_geography(practice_codes)
+    n_practices = len(practices)
+    has_PCN = rng.random(n_practices) >= 0.03
+    superseded = rng.random(n_practices) < 0.05
+    closed_codes = [f"Z{90001 + i:05d}" for i in range(max(1, n_practices // 50))]
+
+    ODS_practice = pd.concat([
+        pd.DataFrame({
+            "CODE": practices["PRACTICE_CODE"], "NAME": practices["PRACTICE_NAME"], "POSTCODE": "AB1 2CD",
+            "COMMISSIONER_ORGANISATION_CODE": practices["SUB_ICB_LOC_CODE"], "HIGH_LEVEL_HEALTH_GEOGRAPHY": practices["ICB_CODE"],
+            "NATIONAL_GROUPING": practices["COMM_REGION_CODE"], "OPEN_DATE": "1990-01-01", "CLOSE_DATE": None,
+            "DSS_RECORD_START_DATE": np.where(superseded, "2021-04-01", "2000-01-01"), "DSS_RECORD_END_DATE": None
+        }),
+        pd.DataFrame({
+            "CODE": practices["PRACTICE_CODE"][superseded], "NAME": "Old name", "POSTCODE": "AB1 2CD",
+            "COMMISSIONER_ORGANISATION_CODE": "00X", "HIGH_LEVEL_HEALTH_GEOGRAPHY": "QXX",
+            "NATIONAL_GROUPING": "Y00", "OPEN_DATE": "1990-01-01", "CLOSE_DATE": None,
+            "DSS_RECORD_START_DATE": "2000-01-01", "DSS_RECORD_END_DATE": "2021-03-31"
+        }),
+        pd.DataFrame({
+            "CODE": closed_codes, "NAME": "Closed practice", "POSTCODE": "AB1 2CD",
+            "COMMISSIONER_ORGANISATION_CODE": practices["SUB_ICB_LOC_CODE"].iloc[0], 
+            "HIGH_LEVEL_HEALTH_GEOGRAPHY": practices["ICB_CODE"].iloc[0],
+            "NATIONAL_GROUPING": practices["COMM_REGION_CODE"].iloc[0], "OPEN_DATE": "1990-01-01", "CLOSE_DATE": "2019-03-31",
+            "DSS_RECORD_START_DATE": "2000-01-01", "DSS_RECORD_END_DATE": None
+        })
+    ], ignore_index=True)
+
+    PCNs = practices[["PCN_ODS_CODE", "PCN_NAME"]].drop_duplicates()
+    organisations = pd.concat([
+        pd.DataFrame({"organisationID": practices["PRACTICE_CODE"], "Name": practices["PRACTICE_NAME"]}),
+        pd.DataFrame({"organisationID": PCNs["PCN_ODS_CODE"], "Name": PCNs["PCN_NAME"]})
+    ], ignore_index=True).assign(datetype="Operational")
+    roles = pd.concat([
+        pd.DataFrame({"organisationID": practices["PRACTICE_CODE"], "roleID": "RO76"}),
+        pd.DataFrame({"organisationID": PCNs["PCN_ODS_CODE"], "roleID": "RO272"})
+    ], ignore_index=True).assign(datetype="Operational", primaryRole=1)
+    code_systems = pd.DataFrame({
+        "ID": ["RO76", "RO272", "RE8", "RE4"],
+        "displayname": ["GP PRACTICE", "PRIMARY CARE NETWORK", "IS PARTNER TO", "IS COMMISSIONED BY"]
+    })
+    ended = rng.random(n_practices) < 0.02
+    relationships = pd.concat([
+        pd.DataFrame({
+            "organisationID": practices["PRACTICE_CODE"][has_PCN], "relationshipID": "RE8",
+            "targetOrganisationID": practices["PCN_ODS_CODE"][has_PCN], "StartDate": "2020-07-01", "EndDate": None
+        }),
+        pd.DataFrame({
+            "organisationID": practices["PRACTICE_CODE"][has_PCN & ended], "relationshipID": "RE8",
+            "targetOrganisationID": PCNs["PCN_ODS_CODE"].iloc[0], "StartDate": "2019-07-01", "EndDate": "2020-06-30"
+        })
+    ], ignore_index=True)
+    geo_equivalents = pd.DataFrame({
+        "DATE_OF_OPERATION": "2020-04-01", "DH_GEOGRAPHY_CODE": geography["ODS_CODE"],
+        "DH_GEOGRAPHY_NAME": geography["NAME"], "GEOGRAPHY_CODE": geography["ONS_CODE"]
+    })
+
+    if os.path.exists(path):
+        os.remove(path)
+    with closing(sqlite3.connect(path)) as conn, conn:
+        for table_name, table in [
+            ("ODS_PRACTICE_V02", ODS_practice), ("ODSAPIOrganisationDetails", organisations), 
+            ("ODSAPIRoleDetails", roles), ("ODSAPICodeSystemDetails", code_systems),
+            ("ODSAPIRelationshipDetails", relationships), ("ONS_CHD_GEO_EQUIVALENTS", geo_equivalents)
+        ]:
+            table.to_sql(table_name, conn, index=False)
+        conn.execute("CREATE INDEX ods_practice_code ON ODS_PRACTICE_V02 (CODE)")
+        conn.execute("CREATE INDEX organisation_id ON ODSAPIOrganisationDetails (organisationID)")
+        conn.execute("CREATE INDEX role_organisation_id ON ODSAPIRoleDetails (organisationID)")
+        conn.execute("CREATE INDEX relationship_organisation_id ON ODSAPIRelationshipDetails (organisationID)")
+    return geography
+
+def get_input_paths(root: str, ach_dates: list) -> dict:
+    """Gets where create_benchmark_root writes each input
+
+    Returns:
+        dict: The paths of the LDHC inputs (oldest month first) under "LDHC_monthly" and of 
+        the QS Part Status report under "Participation"
+    """    
+    LDHC_paths = [
+        f"{root}\\Input\\Archive\\LDHC_monthly\\LDHC_main_{ach_date.strftime('%Y-%m')}.csv" for ach_date in ach_dates[:-1]
+    ]
+    LDHC_paths.append(f"{root}\\Input\\Current\\{LDHC_INPUT_NAME}")
+    return {
+        "LDHC_monthly": LDHC_paths,
+        "Participation": f"{root}\\Input\\Current\\{PARTICIPATION_TEMPLATE}"
+    }
+
+def create_benchmark_root(root: str, n_practices: int, n_months: int = 1, seed: int = 0) -> dict:
+    """Creates a root directory laid out as in the README, filled with synthetic data: the 
+    LDHC input for the latest month in Input\\Current and the earlier months in 
+    Input\\Archive\\LDHC_monthly, a QS Part Status report covering every month, the data 
+    dictionaries and check templates from public_metadata, and a SQLite reference database 
+    and manual reference file in Reference_data.
+
+    Args:
+        root (str): The root directory to create
+        n_practices (int): Number of practices
+        n_months (int, optional): Number of months of input. Defaults to 1.
+        seed (int, optional): Seed of the random generator. Defaults to 0.
+
+    Returns:
+        dict: A config for running the pipeline against the root. The 'sql' reference data 
+        backend reads from the SQLite reference database.
+    """    
+    rng = np.random.default_rng(seed)
+    for folder in ["Checks", "Data_dictionaries", "Input\\Current", "Input\\Archive\\LDHC_monthly", 
+                   "Input\\Archive\\Participation", "Output\\22_23\\Archive", "Reference_data"]:
+        os.makedirs(f"{root}\\{folder}", exist_ok=True)
+    for file_name, folder in [
+        ("indicator_to_measure_map.csv", "Data_dictionaries"), ("LDHC Data Dictionary_Python_only.xlsx", "Data_dictionaries"),
+        ("DQ_check_results.xlsx", "Checks"), ("LDHC_participation_totals.xlsx", "Checks")
+    ]:
+        shutil.copy(os.path.join(PUBLIC_METADATA_FOLDER, file_name), f"{root}\\{folder}\\{file_name}")
+
+    ind_meas_map = pd.read_csv(os.path.join(PUBLIC_METADATA_FOLDER, "indicator_to_measure_map.csv"))
+    measure_dict = pd.read_excel(os.path.join(PUBLIC_METADATA_FOLDER, "LDHC Data Dictionary_Python_only.xlsx"), sheet_name="Measures")
+    measure_types = measure_dict.set_index("MEASURE")["MEASURE_TYPE"].to_dict()
+    practice_codes = get_practice_codes(n_practices)
+    ach_dates = get_month_ends(n_months)
+    input_paths = get_input_paths(root, ach_dates)
+    for ach_date, input_path in zip(ach_dates, input_paths["LDHC_monthly"]):
+        LDHC_input = generate_LDHC_input(practice_codes, ach_date, ind_meas_map, measure_types, rng)
+        LDHC_input.to_csv(input_path, index=False)
+    generate_participation_report(input_paths["Participation"], practice_codes, ach_dates, rng)
+    reference_database_path = f"{root}\\Reference_data\\reference_database.sqlite"
+    geography = generate_reference_database(reference_database_path, practice_codes, rng)
+    manual_reference_path = f"{root}\\Reference_data\\manual_reference.csv"
+    geography.to_csv(manual_reference_path, index=False)
+
+    with open(os.path.join(PUBLIC_METADATA_FOLDER, "config.json")) as f:
+        config_file = json.load(f)
+    config_file.update({
+        "root_directory": root,
+        "Raise exception if DQ issues found": "False",
+        "Path to manual reference file": manual_reference_path,
+        "Reference data backend": "sql",
+        "SQLite reference database": reference_database_path,
+        "Path to reference snapshot": f"{root}\\Reference_data\\reference_snapshot.sqlite"
+    })
+    return config_file
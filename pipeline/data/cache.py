@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+import warnings
+import pandas as pd
+from typing import Callable, Optional
+
+CACHE_FOLDER_NAME = ".cache"
+CACHE_FILE_EXTENSION = ".arrow"
+
+def load_csv_with_cache(path: str, read_function: Callable[[str], pd.DataFrame], schema: Optional[dict] = None) -> pd.DataFrame:
+    """Loads a csv through a columnar cache kept in a '.cache' folder next to the file.
+
+    The cache entry is keyed by a hash of the file contents and of the load schema. If an 
+    entry exists it is memory-mapped instead of parsing the csv. Otherwise the csv is parsed 
+    with read_function and the result written to the cache, replacing any entries for older
+    versions of the file. The cache is skipped (with a warning) if pyarrow isn't installed.
+
+    Args:
+        path (str): Path to the csv file
+        read_function (Callable[[str], pd.DataFrame]): Function used to parse the csv on a cache miss
+        schema (Optional[dict]): The schema the csv is loaded with, None if it is read untyped
+
+    Returns:
+        pd.DataFrame: The loaded csv
+    """    
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        warnings.warn("pyarrow is not installed, the input cache is not being used")
+        return read_function(path)
+    cache_path = get_cache_path(path, hash_file(path), get_schema_key(schema))
+    if os.path.exists(cache_path):
+        return read_cache_file(cache_path)
+    input_df = read_function(path)
+    remove_cache_entries(path)
+    write_cache_file(input_df, cache_path)
+    return input_df
+
+def hash_file(path: str, block_size: int = 1 << 20) -> str:
+    """Gets the sha256 hash of a file's contents, reading it in blocks
+
+    Args:
+        path (str): Path to the file
+        block_size (int, optional): Number of bytes read at a time. Defaults to 1MB.
+
+    Returns:
+        str: The hex digest of the file contents
+    """    
+    file_hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+def get_schema_key(schema: Optional[dict]) -> str:
+    """Gets a short key identifying the load schema
+
+    Args:
+        schema (Optional[dict]): The schema the csv is loaded with, None if it is read untyped
+
+    Returns:
+        str: A short hash of the schema, or 'untyped'
+    """    
+    if schema is None:
+        return "untyped"
+    return hashlib.sha256(json.dumps(schema, sort_keys=True).encode()).hexdigest()[:12]
+
+def get_cache_path(path: str, content_hash: str, schema_key: str) -> str:
+    """Gets the path of the cache entry for a file
+
+    Args:
+        path (str): Path to the csv file
+        content_hash (str): Hash of the file contents
+        schema_key (str): Key of the load schema (see get_schema_key)
+
+    Returns:
+        str: Path of the cache entry, in the form '<folder>\\.cache\\<file name>.<hash>-<schema key>.arrow'
+    """    
+    folder, file_name = os.path.split(path)
+    return os.path.join(folder, CACHE_FOLDER_NAME, f"{file_name}.{content_hash[:32]}-{schema_key}{CACHE_FILE_EXTENSION}")
+
+def list_cache_entries(path: str) -> list:
+    """Lists the cache entries that belong to a file
+
+    Args:
+        path (str): Path to the csv file
+
+    Returns:
+        list: Paths of every cache entry for the file
+    """    
+    folder, file_name = os.path.split(path)
+    cache_folder = os.path.join(folder, CACHE_FOLDER_NAME)
+    if not os.path.isdir(cache_folder):
+        return []
+    return [
+        os.path.join(cache_folder, entry) for entry in os.listdir(cache_folder)
+        if entry.startswith(f"{file_name}.") and entry.endswith(CACHE_FILE_EXTENSION)
+    ]
+
+def remove_cache_entries(path: str) -> None:
+    """Deletes every cache entry for a file
+
+    Args:
+        path (str): Path to the csv file
+    """    
+    for cache_path in list_cache_entries(path):
+        os.remove(cache_path)
+
+def move_cache_entries(path: str, new_path: str, new_content_hash: Optional[str] = None) -> None:
+    """Moves the cache entries of a file so that they sit next to the file's new location
+    under its new name. Used when input files are archived.
+
+    Args:
+        path (str): The current path to the csv file
+        new_path (str): The path the csv file is being moved to
+        new_content_hash (Optional[str]): Hash of the new file's contents, if the file is
+        stored differently at its new location (e.g. compressed). Defaults to None, the
+        contents are unchanged.
+    """    
+    old_file_name = os.path.basename(path)
+    new_folder, new_file_name = os.path.split(new_path)
+    new_cache_folder = os.path.join(new_folder, CACHE_FOLDER_NAME)
+    for cache_path in list_cache_entries(path):
+        os.makedirs(new_cache_folder, exist_ok=True)
+        entry_key = os.path.basename(cache_path)[len(old_file_name):]
+        if new_content_hash is not None:
+            entry_key = f".{new_content_hash[:32]}-{entry_key.split('-', 1)[1]}"
+        os.replace(cache_path, os.path.join(new_cache_folder, new_file_name + entry_key))
+
+def read_cache_file(cache_path: str) -> pd.DataFrame:
+    """Reads a cache entry by memory-mapping the Arrow IPC file
+
+    Args:
+        cache_path (str): Path to the cache entry
+
+    Returns:
+        pd.DataFrame: The cached dataframe, with categorical and integer types restored
+    """    
+    import pyarrow as pa
+    with pa.memory_map(cache_path, "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+    return table.to_pandas()
+
+def write_cache_file(input_df: pd.DataFrame, cache_path: str) -> None:
+    """Writes a dataframe to a cache entry as an Arrow IPC file. The file is written under a 
+    temporary name first so that a failed write never leaves a partial entry behind.
+
+    Args:
+        input_df (pd.DataFrame): The parsed csv
+        cache_path (str): Path to the cache entry
+    """    
+    import pyarrow as pa
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    temp_path = f"{cache_path}.tmp"
+    try:
+        table = pa.Table.from_pandas(input_df, preserve_index=False)
+        with pa.OSFile(temp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(temp_path, cache_path)
+    except (pa.ArrowException, OSError) as e:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        warnings.warn(f"Could not write input cache entry {cache_path}: {e}")
@@ -0,0 +1,134 @@
+import os
+import pickle
+import warnings
+from typing import NamedTuple
+import pandas as pd
+from .cache import hash_file
+
+# Bump when the compiled form changes so that older cache files are rebuilt
+SCHEMA_VERSION = 1
+CACHE_FILE_NAME = "collection_schema.pickle"
+# Indicators whose Denominator and HLTHCHKDEC make up each register (see registers)
+REGISTER_INDICATORS = {"register_14_17_df": "LDHCMI034", "register_18_ov_df": "LDHCMI035"}
+REGISTER_FIELD_NAMES = ["Denominator", "HLTHCHKDEC"]
+PAYMENT_COUNT_INDICATOR = "LDHC021"
+
+class CollectionSchema(NamedTuple):
+    """Everything the stages need to know about the collection, compiled from the data 
+    dictionary's 'Measures' sheet and the indicator to measure map
+
+    measure_dict:            The 'Measures' sheet (MEASURE, MEASURE_DESCRIPTION, MEASURE_TYPE)
+    measure_types:           Maps each measure to its type ('PCA', 'Exclusion' or NaN)
+    ind_meas_map:            The indicator to measure map (IND_CODE, FIELD_NAME)
+    expected_columns:        The (IND_CODE, FIELD_NAME) pairs every practice should submit
+    PCA_counts:              Maps each indicator to its number of PCAs
+    register_indicators:     Maps each register result to the indicator it is built from
+    register_field_names:    The measures summed to make a register
+    payment_count_indicator: The indicator holding the payment count
+    """
+    measure_dict: pd.DataFrame
+    measure_types: dict
+    ind_meas_map: pd.DataFrame
+    expected_columns: pd.MultiIndex
+    PCA_counts: dict
+    register_indicators: dict
+    register_field_names: list
+    payment_count_indicator: str
+
+def get_source_paths(config_file: dict) -> dict:
+    """Gets the paths of the data dictionary and the indicator to measure map"""
+    root = config_file["root_directory"]
+    return {
+        "measure_dictionary": f"{root}\\Data_dictionaries\\LDHC Data Dictionary_Python_only.xlsx",
+        "ind_meas_map": f"{root}\\Data_dictionaries\\indicator_to_measure_map.csv"
+    }
+
+def load_collection_schema(config_file: dict) -> CollectionSchema:
+    """Loads the compiled collection schema, only parsing the source files if they have 
+    changed since it was last compiled.
+
+    The compiled schema is pickled to a '.cache' folder next to the source files along with 
+    each source's modification time, size and hash. If the modification times and sizes match
+    the cache is used straight away. Otherwise the sources are hashed, and the cache is still 
+    used if the hashes match (e.g. the files were copied or touched).
+
+    Args:
+        config_file (dict): A dictionary containing all config information
+
+    Returns:
+        CollectionSchema: The compiled collection schema
+    """    
+    source_paths = get_source_paths(config_file)
+    cache_path = os.path.join(os.path.dirname(source_paths["measure_dictionary"]), ".cache", CACHE_FILE_NAME)
+    source_stats = {name: get_file_stat(path) for name, path in source_paths.items()}
+    cached = read_cache_file(cache_path)
+    if cached is not None and cached["version"] == SCHEMA_VERSION:
+        if cached["stats"] == source_stats:
+            return cached["schema"]
+        source_hashes = {name: hash_file(path) for name, path in source_paths.items()}
+        if cached["hashes"] == source_hashes:
+            write_cache_file(cache_path, cached["schema"], source_stats, source_hashes)
+            return cached["schema"]
+    else:
+        source_hashes = {name: hash_file(path) for name, path in source_paths.items()}
+    schema = compile_collection_schema(source_paths["measure_dictionary"], source_paths["ind_meas_map"])
+    write_cache_file(cache_path, schema, source_stats, source_hashes)
+    return schema
+
+def compile_collection_schema(path_to_dict: str, path_to_ind_meas_map: str) -> CollectionSchema:
+    """Compiles the collection schema from the source files
+
+    Args:
+        path_to_dict (str): Path to the data dictionary workbook, only its 'Measures' sheet is read
+        path_to_ind_meas_map (str): Path to the indicator to measure map csv
+
+    Returns:
+        CollectionSchema: The compiled collection schema
+    """    
+    measure_dict = pd.read_excel(path_to_dict, sheet_name="Measures")
+    ind_meas_map = pd.read_csv(path_to_ind_meas_map)
+    measure_types = measure_dict.drop_duplicates("MEASURE").set_index("MEASURE")["MEASURE_TYPE"]
+    expected_columns = pd.MultiIndex.from_frame(ind_meas_map[["IND_CODE", "FIELD_NAME"]].drop_duplicates())
+    is_PCA = ind_meas_map["FIELD_NAME"].map(measure_types) == "PCA"
+    PCA_counts = ind_meas_map[is_PCA].groupby("IND_CODE")["FIELD_NAME"].nunique()
+    return CollectionSchema(
+        measure_dict=measure_dict,
+        measure_types=measure_types.to_dict(),
+        ind_meas_map=ind_meas_map,
+        expected_columns=expected_columns,
+        PCA_counts=PCA_counts.to_dict(),
+        register_indicators=dict(REGISTER_INDICATORS),
+        register_field_names=list(REGISTER_FIELD_NAMES),
+        payment_count_indicator=PAYMENT_COUNT_INDICATOR
+    )
+
+def get_file_stat(path: str) -> tuple:
+    """Gets a file's modification time (ns) and size"""
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+def read_cache_file(cache_path: str):
+    """Reads the cached schema, None if there is no usable cache file"""
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with open(cache_path, "rb") as f:
+            return pickle.load(f)
+    except Exception as e:
+        warnings.warn(f"Could not read the collection schema cache {cache_path}, it is being rebuilt: {e}")
+        return None
+
+def write_cache_file(cache_path: str, schema: CollectionSchema, source_stats: dict, source_hashes: dict) -> None:
+    """Writes the compiled schema to the cache, warning rather than failing if it can't"""
+    temp_path = f"{cache_path}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(temp_path, "wb") as f:
+            pickle.dump(
+                {"version": SCHEMA_VERSION, "stats": source_stats, "hashes": source_hashes, "schema": schema},
+                f, 
+                protocol=pickle.HIGHEST_PROTOCOL
+            )
+        os.replace(temp_path, cache_path)
+    except OSError as e:
+        warnings.warn(f"Could not write the collection schema cache {cache_path}: {e}")
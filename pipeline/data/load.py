@@ -1,6 +1,24 @@
 import pandas as pd
 import os
 from ..utils.config import load_config
+from . import cache
+
+# Column types used when "Typed input loading" is switched on in the config. Only the listed
+# columns are read. 'category' is used for low cardinality codes, 'integer' columns are
+# downcast to the smallest integer type that holds their values and 'date' columns are kept 
+# as categorical YYYYMMDD codes (the form the rest of the pipeline and the outputs use) once
+# every distinct value has been parsed as a date.
+INPUT_SCHEMAS = {
+    "LDHC_monthly": {
+        "QUALITY_SERVICE": "category",
+        "ORG_CODE": "category",
+        "ACH_DATE": "date",
+        "IND_CODE": "category",
+        "FIELD_NAME": "category",
+        "VALUE": "integer",
+        "APPROVED": "category"
+    }
+}
 
 
 def load_input_csv(config_file: dict, input_type: str) -> pd.DataFrame:
@@ -16,12 +34,94 @@ def load_input_csv(config_file: dict, input_type: str) -> pd.DataFrame:
         pd.DataFrame: Uses the passed information to load the relevant input table from the
         Current Input folder into a dataframe.
     """    
+    input_path = get_input_path(config_file, input_type)
+    return read_input_file(input_path, input_type, config_file)
+
+def get_input_path(config_file: dict, input_type: str) -> str:
+    """Gets the path of an input file in the Current Input folder
+
+    Args:
+        config_file (dict): A dict containing all the config information
+        input_type (str): A string indicating what the input file type is
+        Can take a value from the set {"LDHC_monthly", "Participation"}
+
+    Returns:
+        str: Path to the input csv
+    """    
     root = config_file["root_directory"]
     path_to_input_folder = f"{root}\\Input\\Current\\"
     input_file_name = load_input_file_names(path_to_input_folder)[input_type]
-    input_df = pd.read_csv(path_to_input_folder + input_file_name[0])
+    return path_to_input_folder + input_file_name[0]
+
+def read_input_file(input_path: str, input_type: str, config_file: dict) -> pd.DataFrame:
+    """Reads an input csv, using the typed schema and the input cache if they are switched 
+    on in the config ("Typed input loading" and "Use input cache").
+
+    Args:
+        input_path (str): Path to the input csv
+        input_type (str): A string indicating what the input file type is
+        Can take a value from the set {"LDHC_monthly", "Participation"}
+        config_file (dict): A dict containing all the config information
+
+    Returns:
+        pd.DataFrame: The input table
+    """    
+    schema = None
+    if config_file.get("Typed input loading", "False") == "True":
+        schema = INPUT_SCHEMAS.get(input_type)
+    if schema is None:
+        read_function = pd.read_csv
+    else:
+        read_function = lambda path: read_typed_csv(path, schema)
+    if config_file.get("Use input cache", "False") == "True":
+        return cache.load_csv_with_cache(input_path, read_function, schema)
+    return read_function(input_path)
+
+def read_typed_csv(path: str, schema: dict) -> pd.DataFrame:
+    """Reads a csv using an explicit column schema (see INPUT_SCHEMAS) so that pandas does not
+    have to infer a type for every row and unused columns are never read.
+
+    Args:
+        path (str): Path to the csv file
+        schema (dict): Maps each column to read to one of {'category', 'integer', 'date'}
+
+    Raises:
+        ValueError: Raised if a 'date' column contains a value that isn't a YYYYMMDD date
+
+    Returns:
+        pd.DataFrame: The csv contents with the schema types applied
+    """    
+    read_dtypes = {col: "category" for col, col_type in schema.items() if col_type in ("category", "date")}
+    input_df = pd.read_csv(path, usecols=list(schema), dtype=read_dtypes, **get_csv_parser_kwargs())
+    input_df = input_df[list(schema)]
+    for col, col_type in schema.items():
+        if col_type == "integer":
+            input_df[col] = pd.to_numeric(input_df[col], downcast="integer")
+        elif col_type == "date":
+            # Parsers differ in the type they give categories, so keep the codes as text.
+            # Only the distinct values need parsing, errors="raise" surfaces malformed dates
+            date_codes = [str(code) for code in input_df[col].cat.categories]
+            input_df[col] = input_df[col].cat.rename_categories(date_codes)
+            pd.to_datetime(pd.Series(date_codes, dtype=object), format="%Y%m%d", errors="raise")
     return input_df
 
+def get_csv_parser_kwargs() -> dict:
+    """Picks the fastest csv parser available. The pyarrow parser is multi-threaded but is only
+    supported by pandas 1.4 onwards and needs pyarrow to be installed, otherwise the default C 
+    parser is used.
+
+    Returns:
+        dict: Keyword arguments to pass to pd.read_csv
+    """    
+    pandas_version = tuple(int(part) for part in pd.__version__.split(".")[:2])
+    if pandas_version >= (1, 4):
+        try:
+            import pyarrow  # noqa: F401
+            return {"engine": "pyarrow"}
+        except ImportError:
+            pass
+    return {}
+
 def load_input_file_names(path_to_input_folder: str) -> dict:
     """Gets a dictionary mapping the two filetypes to their filenames as they
     appear in the input folder
@@ -0,0 +1,359 @@
+import datetime
+import hashlib
+import os
+import sqlite3
+import threading
+import pandas as pd
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import closing
+
+# Reference data queries run against the corporate SQL server. Every query is keyed by the 
+# achievement date (YYYY-MM-DD) and takes it as a parameter, repeated 'n_params' times. Queries
+# with a 'practice_filter_col' can be restricted to a list of practices, the restriction is 
+# inserted at '{practice_filter}'. Only the columns the mapping uses are selected.
+REFERENCE_QUERIES = {
+    "practice_mapping": {
+        "n_params": 4,
+        "practice_filter_col": "a.[CODE]",
+        "query": """SELECT a.[CODE] AS PRACTICE_CODE
+                         , a.[NAME] AS PRACTICE_NAME
+                         , a.[COMMISSIONER_ORGANISATION_CODE] AS SUB_ICB_LOC_CODE
+                         , a.[HIGH_LEVEL_HEALTH_GEOGRAPHY] AS ICB_CODE
+                         , a.[NATIONAL_GROUPING] AS COMM_REGION_CODE
+                    FROM [dbo].[ODS_PRACTICE_V02] as a
+                    WHERE a.OPEN_DATE <= ?
+                    AND (a.CLOSE_DATE IS NULL OR a.CLOSE_DATE >= ?)
+                    AND a.DSS_RECORD_START_DATE <= ?
+                    AND (a.DSS_RECORD_END_DATE IS NULL OR a.DSS_RECORD_END_DATE >= ?)
+                    {practice_filter}
+                    ORDER BY a.CODE"""
+    },
+    "pcn_mapping": {
+        "n_params": 2,
+        "practice_filter_col": "o.organisationID",
+        "query": """
+        select DISTINCT o.Name AS PRACTICE_NAME,
+        o.organisationID AS PRACTICE_CODE,
+        target.name AS PCN_NAME,
+        target.organisationID AS PCN_ODS_CODE
+        from [dbo].[ODSAPIOrganisationDetails] o, 
+        [dbo].[ODSAPIRoleDetails] r,
+        [dbo].[ODSAPICodeSystemDetails] rolename,
+        [dbo].[ODSAPIRelationshipDetails] re,
+        [dbo].[ODSAPICodeSystemDetails] relname, 
+        [dbo].[ODSAPIOrganisationDetails] target, 
+        [dbo].[ODSAPIRoleDetails] targetrole, 
+        [dbo].[ODSAPICodeSystemDetails] targetrolecode
+        where o.datetype ='Operational'
+        AND target.datetype = 'Operational'
+        AND r.datetype = 'Operational'
+        AND targetRole.dateType = 'Operational'
+        AND (rolename.displayname = 'GP PRACTICE' OR rolename.displayname = 'PRESCRIBING COST CENTRE')
+        AND o.organisationID = r.organisationID
+        AND r.roleID = rolename.ID
+        AND targetrole.roleID = 'RO272' and targetrole.primaryRole=1 
+        AND re.organisationID = o.organisationID
+        AND re.relationshipID = relname.ID
+        AND re.targetOrganisationID = target.organisationID
+        AND relname.displayname = 'IS PARTNER TO' 
+        AND target.organisationID = targetrole.organisationID
+        AND targetrole.roleID = targetrolecode.ID
+        AND NOT (o.organisationID = 'E85069' AND re.StartDate = '2021-11-01')
+        AND re.StartDate <= ?
+        AND (re.EndDate >= ?
+        OR re.EndDate IS NULL)
+        {practice_filter}
+        order by o.name, target.name
+        """
+    },
+    "geography_mapping": {
+        "n_params": 1,
+        "query": """SELECT DISTINCT a.DATE_OF_OPERATION, a.DH_GEOGRAPHY_CODE, a.DH_GEOGRAPHY_NAME, a.GEOGRAPHY_CODE
+        FROM [dbo].[ONS_CHD_GEO_EQUIVALENTS] as a
+        INNER JOIN (SELECT DH_GEOGRAPHY_CODE, MAX(DATE_OF_OPERATION) AS DATE_OF_OPERATION FROM [dbo].[ONS_CHD_GEO_EQUIVALENTS] WHERE DATE_OF_OPERATION <= ? GROUP BY DH_GEOGRAPHY_CODE) as b
+        ON a.DATE_OF_OPERATION = b.DATE_OF_OPERATION
+        AND a.DH_GEOGRAPHY_CODE = b.DH_GEOGRAPHY_CODE"""
+    }
+}
+
+SNAPSHOT_INDEX_TABLE = "snapshot_index"
+
+# SQL Server allows at most 2100 parameters per query so practice lists are sent in batches
+PRACTICE_FILTER_BATCH_SIZE = 1000
+
+# Engines are shared by every query of a run (and every prefetch thread) so that connections 
+# come from one pool rather than each query opening its own engine
+_engines = {}
+_engines_lock = threading.Lock()
+
+def get_reference_data(query_name: str, ach_date: str, config_file: dict, practice_codes: list = None) -> pd.DataFrame:
+    """Gets a reference data table for the achievement date from the backend chosen by the 
+    "Reference data backend" config key:
+
+    'sql'      - always runs the query against the SQL server
+    'snapshot' - reads the table from the local snapshot if it is there, otherwise runs the 
+                 query against the SQL server and saves the result to the snapshot
+    'offline'  - only reads from the local snapshot, erroring if the table isn't there
+
+    Setting "Refresh reference snapshot" to 'True' in the config re-runs the query and 
+    overwrites the snapshot table when using the 'snapshot' backend.
+
+    Args:
+        query_name (str): A key of REFERENCE_QUERIES
+        ach_date (str): The achievement date in the form YYYY-MM-DD
+        config_file (dict): A dictionary containing all the config information
+        practice_codes (list, optional): Restricts queries that support it to these practices.
+        Defaults to None (no restriction).
+
+    Raises:
+        ValueError: Raised if the backend isn't recognised or if the 'offline' backend is used
+        and the snapshot doesn't contain the table
+
+    Returns:
+        pd.DataFrame: The reference data table
+    """    
+    backend = config_file.get("Reference data backend", "sql")
+    if "practice_filter_col" not in REFERENCE_QUERIES[query_name]:
+        practice_codes = None
+    if backend == "sql":
+        return read_from_sql(query_name, ach_date, config_file, practice_codes)
+    if backend not in ("snapshot", "offline"):
+        raise ValueError(f"Unknown reference data backend '{backend}', expected one of {{'sql', 'snapshot', 'offline'}}")
+    snapshot_path = get_snapshot_path(config_file)
+    refresh = config_file.get("Refresh reference snapshot", "False") == "True"
+    if not refresh or backend == "offline":
+        reference_df = read_from_snapshot(snapshot_path, query_name, ach_date, practice_codes)
+        if reference_df is None and practice_codes is not None:
+            # An unrestricted snapshot of the query can serve any list of practices
+            reference_df = read_from_snapshot(snapshot_path, query_name, ach_date)
+            if reference_df is not None:
+                reference_df = reference_df[reference_df["PRACTICE_CODE"].isin(practice_codes)].reset_index(drop=True)
+        if reference_df is not None:
+            return reference_df
+        if backend == "offline":
+            raise ValueError(f"The reference snapshot {snapshot_path} has no '{query_name}' table for {ach_date}")
+    reference_df = read_from_sql(query_name, ach_date, config_file, practice_codes)
+    write_to_snapshot(reference_df, snapshot_path, query_name, ach_date, practice_codes)
+    return reference_df
+
+def prefetch_reference_data(query_names: list, ach_date: str, config_file: dict, practice_codes: list = None) -> dict:
+    """Starts fetching reference tables in the background so that the database round trips
+    overlap with the processing stages. Each query runs on its own thread using the shared
+    engine (see get_engine).
+
+    Args:
+        query_names (list): Keys of REFERENCE_QUERIES to fetch
+        ach_date (str): The achievement date in the form YYYY-MM-DD
+        config_file (dict): A dictionary containing all the config information
+        practice_codes (list, optional): Restricts queries that support it to these practices.
+        Defaults to None (no restriction).
+
+    Returns:
+        dict: Maps each query name to a Future resolving to the reference table
+    """    
+    executor = ThreadPoolExecutor(max_workers=max(len(query_names), 1), thread_name_prefix="reference")
+    reference_futures = {
+        query_name: executor.submit(get_reference_data, query_name, ach_date, config_file, practice_codes)
+        for query_name in query_names
+    }
+    executor.shutdown(wait=False)
+    return reference_futures
+
+def resolve_reference_data(reference_data, query_name: str, ach_date: str, config_file: dict, practice_codes: list = None) -> pd.DataFrame:
+    """Gets a reference table from prefetched data if it is there, otherwise fetches it now
+
+    Args:
+        reference_data (Optional[dict]): Maps query names to reference tables or to Futures
+        from prefetch_reference_data. Can be None.
+        query_name (str): A key of REFERENCE_QUERIES
+        ach_date (str): The achievement date in the form YYYY-MM-DD
+        config_file (dict): A dictionary containing all the config information
+        practice_codes (list, optional): Practices to restrict the query to if it has to be 
+        fetched now. Defaults to None (no restriction).
+
+    Returns:
+        pd.DataFrame: The reference table
+    """    
+    if reference_data is None or query_name not in reference_data:
+        return get_reference_data(query_name, ach_date, config_file, practice_codes)
+    reference_df = reference_data[query_name]
+    if isinstance(reference_df, Future):
+        reference_df = reference_df.result()
+    return reference_df
+
+def get_engine(config_file: dict):
+    """Gets the engine for the SQL server in the config, creating it on first use
+
+    Args:
+        config_file (dict): A dictionary containing all the config information
+
+    Returns:
+        sqlalchemy.engine.Engine: Pooled engine connected to the SQL server
+    """    
+    engine_key = tuple(config_file["SQL connection string"])
+    with _engines_lock:
+        if engine_key not in _engines:
+            _engines[engine_key] = connect(config_file["SQL connection string"])
+        return _engines[engine_key]
+
+def connect(SQL_connection_list: list):
+    """Creates a SQLAlchemy engine for the SQL server. sqlalchemy (and through it pyodbc) is
+    only imported here so that the snapshot backends work without them.
+
+    Args:
+        SQL_connection_list (list): The driver, server, database and trusted connection 
+        values from the "SQL connection string" config key
+
+    Raises:
+        Exception: Raised if the engine can't be created
+
+    Returns:
+        sqlalchemy.engine.Engine: Engine connected to the SQL server
+    """    
+    try:
+        import sqlalchemy as db
+        driver = SQL_connection_list[0]
+        server = SQL_connection_list[1]
+        database = SQL_connection_list[2]
+        trusted_connection = SQL_connection_list[3]
+        conn = db.create_engine(f"mssql+pyodbc://{server}/{database}?driver={driver}?Trusted_Connection={trusted_connection}")
+    except Exception:
+        raise Exception("Database Connection unsuccessful")
+    return conn
+
+def connect_sqlite(database_path: str) -> sqlite3.Connection:
+    """Opens a SQLite database standing in for the SQL server (e.g. the synthetic reference
+    database of the benchmarks). The database is attached as 'dbo' so that the reference 
+    queries run against it unchanged.
+
+    Args:
+        database_path (str): Path to the SQLite database
+
+    Returns:
+        sqlite3.Connection: Connection with the database attached as 'dbo'
+    """    
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    conn.execute("ATTACH DATABASE ? AS dbo", (database_path,))
+    return conn
+
+def read_from_sql(query_name: str, ach_date: str, config_file: dict, practice_codes: list = None) -> pd.DataFrame:
+    """Runs a reference query against the SQL server. If practice codes are given they are
+    sent to the server in batches of IN lists so that only rows for those practices are
+    returned.
+
+    If "SQLite reference database" is set in the config the query is run against that 
+    SQLite database instead (see connect_sqlite).
+
+    Args:
+        query_name (str): A key of REFERENCE_QUERIES
+        ach_date (str): The achievement date in the form YYYY-MM-DD
+        config_file (dict): A dictionary containing all the config information
+        practice_codes (list, optional): Practices to restrict the query to. Defaults to None.
+
+    Returns:
+        pd.DataFrame: The query result
+    """    
+    if config_file.get("SQLite reference database"):
+        with closing(connect_sqlite(config_file["SQLite reference database"])) as conn:
+            return run_reference_query(query_name, ach_date, conn, practice_codes)
+    return run_reference_query(query_name, ach_date, get_engine(config_file), practice_codes)
+
+def run_reference_query(query_name: str, ach_date: str, conn, practice_codes: list = None) -> pd.DataFrame:
+    """Runs a reference query on a connection, batching the practice filter (see read_from_sql)
+
+    Args:
+        query_name (str): A key of REFERENCE_QUERIES
+        ach_date (str): The achievement date in the form YYYY-MM-DD
+        conn: SQLAlchemy engine or DBAPI connection
+        practice_codes (list, optional): Practices to restrict the query to. Defaults to None.
+
+    Returns:
+        pd.DataFrame: The query result
+    """    
+    reference_query = REFERENCE_QUERIES[query_name]
+    date_params = (ach_date,) * reference_query["n_params"]
+    if practice_codes is None:
+        query = reference_query["query"].replace("{practice_filter}", "")
+        return pd.read_sql_query(query, conn, params=date_params)
+    practice_codes = list(practice_codes)
+    if len(practice_codes) == 0:
+        query = reference_query["query"].replace("{practice_filter}", "AND 1 = 0")
+        return pd.read_sql_query(query, conn, params=date_params)
+    batches = []
+    for start in range(0, len(practice_codes), PRACTICE_FILTER_BATCH_SIZE):
+        batch = practice_codes[start:start + PRACTICE_FILTER_BATCH_SIZE]
+        practice_filter = f"AND {reference_query['practice_filter_col']} IN ({', '.join('?' * len(batch))})"
+        query = reference_query["query"].replace("{practice_filter}", practice_filter)
+        batches.append(pd.read_sql_query(query, conn, params=date_params + tuple(batch)))
+    return pd.concat(batches, ignore_index=True)
+
+def get_snapshot_path(config_file: dict) -> str:
+    """Gets the path to the local reference snapshot, taken from the "Path to reference
+    snapshot" config key if it is set
+
+    Args:
+        config_file (dict): A dictionary containing all the config information
+
+    Returns:
+        str: Path to the SQLite snapshot file
+    """    
+    root = config_file["root_directory"]
+    return config_file.get("Path to reference snapshot", f"{root}\\Reference_data\\reference_snapshot.sqlite")
+
+def get_snapshot_table_name(query_name: str, ach_date: str, practice_codes: list = None) -> str:
+    """Gets the name of the snapshot table holding a query's result for an achievement date
+    (and for a list of practices, if the query was restricted to one)"""
+    table_name = f"{query_name}__{ach_date.replace('-', '_')}"
+    if practice_codes is not None:
+        practices_hash = hashlib.sha256("\n".join(sorted(practice_codes)).encode()).hexdigest()[:12]
+        table_name = f"{table_name}__{practices_hash}"
+    return table_name
+
+def read_from_snapshot(snapshot_path: str, query_name: str, ach_date: str, practice_codes: list = None):
+    """Reads a reference table from the local snapshot
+
+    Args:
+        snapshot_path (str): Path to the SQLite snapshot file
+        query_name (str): A key of REFERENCE_QUERIES
+        ach_date (str): The achievement date in the form YYYY-MM-DD
+        practice_codes (list, optional): The practices the query was restricted to. Defaults to None.
+
+    Returns:
+        Optional[pd.DataFrame]: The snapshot table, or None if the snapshot doesn't contain it
+    """    
+    if not os.path.exists(snapshot_path):
+        return None
+    table_name = get_snapshot_table_name(query_name, ach_date, practice_codes)
+    with closing(sqlite3.connect(snapshot_path, timeout=30)) as conn, conn:
+        table_exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,)
+        ).fetchone()
+        if table_exists is None:
+            return None
+        return pd.read_sql_query(f'SELECT * FROM "{table_name}"', conn)
+
+def write_to_snapshot(reference_df: pd.DataFrame, snapshot_path: str, query_name: str, ach_date: str, practice_codes: list = None) -> None:
+    """Saves a reference table to the local snapshot, replacing any previous copy, and records
+    it in the snapshot's index table
+
+    Args:
+        reference_df (pd.DataFrame): The reference table
+        snapshot_path (str): Path to the SQLite snapshot file
+        query_name (str): A key of REFERENCE_QUERIES
+        ach_date (str): The achievement date in the form YYYY-MM-DD
+        practice_codes (list, optional): The practices the query was restricted to. Defaults to None.
+    """    
+    snapshot_folder = os.path.dirname(snapshot_path)
+    if snapshot_folder:
+        os.makedirs(snapshot_folder, exist_ok=True)
+    table_name = get_snapshot_table_name(query_name, ach_date, practice_codes)
+    with closing(sqlite3.connect(snapshot_path, timeout=30)) as conn, conn:
+        reference_df.to_sql(table_name, conn, if_exists="replace", index=False)
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {SNAPSHOT_INDEX_TABLE} "
+            "(TABLE_NAME TEXT PRIMARY KEY, QUERY_NAME TEXT, ACH_DATE TEXT, ROW_COUNT INTEGER, CREATED TEXT)"
+        )
+        conn.execute(
+            f"INSERT OR REPLACE INTO {SNAPSHOT_INDEX_TABLE} VALUES (?, ?, ?, ?, ?)",
+            (table_name, query_name, ach_date, len(reference_df), datetime.datetime.now().isoformat(timespec="seconds"))
+        )
@@ -0,0 +1,32 @@
+from .data import load, collection_schema
+from .processing import measure_matrix, single_pass_checks
+from .processing.DQ_checks import report_dq_check_results
+from .output import write_DQ_checks
+
+# Only the modules the DQ checks need are imported here, so that checking a new extract doesn't
+# import the mapping, suppression, participation or output modules (see main.py)
+
+def run(config_file: dict) -> dict:
+    """Runs the registers and DQ checks on the LDHC input in Input\\Current and prints the DQ
+    report, without running the rest of the pipeline. Nothing is written: the DQ history,
+    participation totals and outputs are left as they are, the reference data isn't queried
+    and the inputs aren't archived. As in a full run the report raises if any check fails
+    and "Raise exception if DQ issues found" is 'True' in the config.
+
+    Args:
+        config_file (dict): Dict containing all config file information
+
+    Returns:
+        dict: The DQ results in the form they are held in the DQ history (see
+        write_DQ_checks.get_DQ_results), with the registers under "register_14_17_df" and
+        "register_18_ov_df"
+    """
+    LDHC_in = load.load_input_csv(config_file, "LDHC_monthly")
+    results = single_pass_checks.run(
+        measure_matrix.build(LDHC_in), config_file, collection_schema.load_collection_schema(config_file)
+    )
+    DQ_results = write_DQ_checks.get_DQ_results(
+        results["DQ_flag_1_df"], results["DQ_flag_2_df"], results["DQ_flag_3_practice_series"], LDHC_in
+    )
+    report_dq_check_results.report(DQ_results, config_file)
+    return {**DQ_results, "register_14_17_df": results["register_14_17_df"], "register_18_ov_df": results["register_18_ov_df"]}
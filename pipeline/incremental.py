@@ -0,0 +1,255 @@
+import json
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from .data import cache, collection_schema as schema
+from .processing import measure_matrix, original_mapping
+from .processing.DQ_checks import DQ_check_2
+from .utils.scheduler.stages import run_stages
+from .utils.dates import dates
+
+# Bump when a change to the processing changes the output for unchanged inputs, so that
+# states saved by earlier versions are not reused
+STATE_VERSION = 2
+# Stages whose results for a practice only depend on that practice's input rows. These are
+# only run for practices whose input has changed.
+PRACTICE_STAGES = ["checks", "insert_registers", "remove_incomplete_pracs", "format", "suppression", "mapping"]
+# Results of the practice stages that are kept, the rest are released as soon as they have been used
+PRACTICE_RESULTS = ["DQ_flag_1_df", "DQ_flag_2_df", "DQ_flag_3_practice_series", "LDHC_mapped"]
+# Stages that need the whole month. These are run on the spliced results.
+MONTH_STAGES = ["write_DQ_checks", "report", "participation"]
+# Config keys that change the output of every practice
+CONTEXT_CONFIG_KEYS = ["Remove pracs with incomplete info", "Suppression rules", "Typed input loading"]
+# Hash key (16 characters) of the input rows
+FINGERPRINT_HASH_KEY = "ldhc_practice_00"
+
+def process(input_dict: dict, config_file: dict, stages: list, reference_data: dict = None, run_report=None) -> pd.DataFrame:
+    """Processes a month, only redoing the registers, DQ checks, suppression and mapping for
+    practices whose input rows have changed since the month was last processed.
+
+    Each practice's fingerprint is a hash of its input rows (in order) and of its row of
+    the practice hierarchy. The fingerprints are saved with each practice's DQ results and
+    mapped output (see save_state). On the next run of the same achievement date, only the
+    practices with a new or changed fingerprint are put through the practice stages (see
+    PRACTICE_STAGES) and their results are spliced into the saved results, in the order a
+    full run gives. The month stages (DQ history, DQ report and participation) then run on
+    the spliced results as they would in a full run. Every practice is processed if there
+    is no saved state or if the data dictionaries or the config keys in CONTEXT_CONFIG_KEYS
+    have changed.
+
+    The state is only saved once the DQ report has passed.
+
+    Args:
+        input_dict (dict): The loaded inputs (see pipeline_wrapper.data_load)
+        config_file (dict): A dictionary containing all the information from the config
+        stages (list): The processing stages (see pipeline_wrapper.get_processing_stages)
+        reference_data (dict, optional): Prefetched reference data for the mapping. Defaults to None.
+        run_report (RunReport, optional): Records every stage if given. Defaults to None.
+
+    Returns:
+        pd.DataFrame: The main LDHC output df, the same as a full run's
+    """
+    LDHC_input_df = input_dict["LDHC_Monthly_df"]
+    ach_date = dates.get_achievement_date(LDHC_input_df).strftime("%Y-%m-%d")
+    practice_codes = original_mapping.get_practice_filter(LDHC_input_df["ORG_CODE"], config_file)
+    practice_hierarchy = original_mapping.get_practice_hierarchy(ach_date, config_file, reference_data, practice_codes)
+    fingerprints = get_practice_fingerprints(LDHC_input_df, practice_hierarchy)
+    context = get_context(config_file)
+    state_path = get_state_path(config_file, ach_date)
+    previous_state = load_state(state_path, context)
+    if previous_state is None:
+        unchanged_practices = pd.Index([], name="ORG_CODE")
+    else:
+        previous_fingerprints = previous_state["fingerprints"].reindex(fingerprints.index)
+        unchanged_practices = fingerprints.index[previous_fingerprints.to_numpy() == fingerprints.to_numpy()]
+    changed_input_df = LDHC_input_df[~in_practices(LDHC_input_df["ORG_CODE"], unchanged_practices)].reset_index(drop=True)
+    print(f"Processing {changed_input_df['ORG_CODE'].nunique()} of {len(fingerprints)} practices, the rest are unchanged since the last run")
+
+    stages_by_name = {stage.name: stage for stage in stages}
+    practice_results = process_practices(changed_input_df, config_file, stages_by_name, practice_hierarchy, input_dict["Collection_schema"], run_report)
+    if previous_state is not None:
+        practice_results = splice_results(previous_state, practice_results, unchanged_practices)
+    practice_results["LDHC_mapped"] = order_by_hierarchy(practice_results["LDHC_mapped"], practice_hierarchy)
+    state = {
+        "version": STATE_VERSION,
+        "context": context,
+        "fingerprints": fingerprints,
+        **{name: result.copy() for name, result in practice_results.items()}
+    }
+
+    run_stages(get_month_stages(stages_by_name), {**input_dict, **practice_results, "config_file": config_file}, run_report=run_report)
+    save_state(state, state_path)
+    return practice_results["LDHC_mapped"]
+
+def get_month_stages(stages_by_name: dict) -> list:
+    """Gets the month stages (see MONTH_STAGES). The participation stage only counts the 
+    practices in the input, so it is given the input rather than the input with registers,
+    which isn't kept for every practice."""
+    return [
+        stages_by_name[name]._replace(inputs={
+            argument: ("LDHC_Monthly_df" if data_name == "LDHC_with_registers" else data_name)
+            for argument, data_name in stages_by_name[name].inputs.items()
+        })
+        for name in MONTH_STAGES
+    ]
+
+def process_practices(changed_input_df: pd.DataFrame, config_file: dict, stages_by_name: dict, practice_hierarchy: pd.DataFrame, collection_schema, run_report=None) -> dict:
+    """Runs the practice stages (see PRACTICE_STAGES) on the rows of some of the practices
+
+    Returns:
+        dict: The DQ results and the mapped output of the practices
+    """
+    if len(changed_input_df) == 0:
+        return {
+            "DQ_flag_1_df": pd.DataFrame(columns=["ORG_CODE", "IND_CODE"]),
+            "DQ_flag_2_df": pd.DataFrame(columns=DQ_check_2.ROW_KEY_COLS + ["Type_of_information_issue"]),
+            "DQ_flag_3_practice_series": pd.Series([], dtype=object, name="ORG_CODE"),
+            "LDHC_mapped": pd.DataFrame(columns=original_mapping.HEADINGS + [original_mapping.SUPPRESSED_HEADING])
+        }
+    practice_stages = []
+    for name in PRACTICE_STAGES:
+        stage = stages_by_name[name]
+        if name == "mapping":
+            # The month stages run after the splice, so the mapping can't wait for the DQ report
+            stage = stage._replace(inputs={**stage.inputs, "practice_hierarchy": "practice_hierarchy"}, after=[])
+        practice_stages.append(stage)
+    data = {
+        "LDHC_Monthly_df": changed_input_df,
+        "LDHC_Monthly_matrix": measure_matrix.build(changed_input_df),
+        "Collection_schema": collection_schema,
+        "config_file": config_file,
+        "reference_data": None,
+        "practice_hierarchy": practice_hierarchy
+    }
+    results = run_stages(
+        practice_stages,
+        data,
+        use_process_pool=config_file.get("Run CPU-bound stages in processes", "False") == "True",
+        run_report=run_report,
+        keep=PRACTICE_RESULTS
+    )
+    return {name: results[name] for name in PRACTICE_RESULTS}
+
+def splice_results(previous_state: dict, practice_results: dict, unchanged_practices: pd.Index) -> dict:
+    """Adds the saved results of the unchanged practices to the results of the changed
+    practices, ordering the DQ results as the checks do (see single_pass_checks)
+
+    Returns:
+        dict: The DQ results and mapped output of every practice. The mapped output still has
+        to be put in hierarchy order (see order_by_hierarchy).
+    """
+    def unchanged(name, practice_col=None):
+        previous = previous_state[name]
+        return previous[in_practices(previous if practice_col is None else previous[practice_col], unchanged_practices)]
+    previous_results = {
+        "DQ_flag_1_df": unchanged("DQ_flag_1_df", "ORG_CODE"),
+        "DQ_flag_2_df": unchanged("DQ_flag_2_df", "ORG_CODE"),
+        "DQ_flag_3_practice_series": unchanged("DQ_flag_3_practice_series"),
+        "LDHC_mapped": unchanged("LDHC_mapped", "PRACTICE_CODE")
+    }
+    return concat_practice_results([previous_results, practice_results])
+
+def concat_practice_results(results: list) -> dict:
+    """Concatenates the results of process_practices for different practices, ordering the
+    DQ results as the checks do (see single_pass_checks). The mapped output is concatenated
+    in the order given.
+
+    Returns:
+        dict: The DQ results and mapped output of every practice
+    """
+    def concat(name):
+        return pd.concat([result[name] for result in results], ignore_index=True)
+    DQ_3_practices = np.concatenate([result["DQ_flag_3_practice_series"].to_numpy() for result in results])
+    return {
+        "DQ_flag_1_df": concat("DQ_flag_1_df").sort_values(["ORG_CODE", "IND_CODE"]).reset_index(drop=True),
+        "DQ_flag_2_df": concat("DQ_flag_2_df").sort_values(DQ_check_2.ROW_KEY_COLS).reset_index(drop=True),
+        "DQ_flag_3_practice_series": pd.Series(np.sort(DQ_3_practices), name="ORG_CODE"),
+        "LDHC_mapped": concat("LDHC_mapped")
+    }
+
+def order_by_hierarchy(LDHC_mapped: pd.DataFrame, practice_hierarchy: pd.DataFrame) -> pd.DataFrame:
+    """Puts the practices of the mapped output in the order of the practice hierarchy, keeping
+    the order of each practice's rows, as the join in original_mapping.mapping does"""
+    practice_ranks = pd.Series(np.arange(len(practice_hierarchy)), index=practice_hierarchy["PRACTICE_CODE"])
+    row_order = np.argsort(LDHC_mapped["PRACTICE_CODE"].map(practice_ranks).to_numpy(), kind="stable")
+    return LDHC_mapped.iloc[row_order].reset_index(drop=True)
+
+def get_practice_fingerprints(LDHC_input_df: pd.DataFrame, practice_hierarchy: pd.DataFrame) -> pd.Series:
+    """Fingerprints each practice's input rows and its row of the practice hierarchy. The 
+    rows are hashed along with their position within the practice, so reordering a 
+    practice's rows changes its fingerprint, and the row hashes of each practice are summed.
+
+    Args:
+        LDHC_input_df (pd.DataFrame): The main LDHC input
+        practice_hierarchy (pd.DataFrame): The practice hierarchy (see original_mapping.get_practice_hierarchy)
+
+    Returns:
+        pd.Series: The fingerprint of each practice, indexed by practice code
+    """
+    practice_codes, practices = pd.factorize(LDHC_input_df["ORG_CODE"])
+    row_order = np.argsort(practice_codes, kind="stable")
+    practice_starts = np.flatnonzero(np.r_[True, np.diff(practice_codes[row_order]) != 0]) if len(row_order) else row_order
+    positioned_rows = LDHC_input_df.assign(ROW_POSITION=LDHC_input_df.groupby(practice_codes).cumcount().to_numpy())
+    row_hashes = pd.util.hash_pandas_object(positioned_rows, index=False, hash_key=FINGERPRINT_HASH_KEY).to_numpy()
+    fingerprint_parts = [np.add.reduceat(row_hashes[row_order], practice_starts) if len(row_order) else row_hashes]
+    hierarchy_hashes = pd.util.hash_pandas_object(practice_hierarchy, index=False).to_numpy()
+    hierarchy_positions = pd.Index(practice_hierarchy["PRACTICE_CODE"]).get_indexer(practices)
+    # Practices that aren't in the hierarchy (and so aren't in the output) get a hash of 0
+    fingerprint_parts.append(np.where(hierarchy_positions >= 0, hierarchy_hashes[hierarchy_positions], np.uint64(0)))
+    return pd.Series(
+        ["".join(f"{int(part):016x}" for part in parts) for parts in zip(*fingerprint_parts)],
+        index=pd.Index(practices, name="ORG_CODE"),
+        dtype=object
+    )
+
+def in_practices(practice_col: pd.Series, practices: pd.Index) -> np.ndarray:
+    """Gets a mask of the rows whose practice is one of practices, testing each distinct
+    practice code once rather than every row"""
+    practice_codes, distinct_practices = pd.factorize(practice_col)
+    # Compared as objects, arrow backed strings convert every value to a scalar in isin
+    is_in = pd.Index(distinct_practices, dtype=object).isin(np.asarray(practices, dtype=object))
+    return np.append(is_in, False)[practice_codes]
+
+def get_context(config_file: dict) -> str:
+    """Gets what the output of every practice depends on besides its own rows: the data
+    dictionaries and the config keys in CONTEXT_CONFIG_KEYS"""
+    return json.dumps({
+        "sources": {name: cache.hash_file(path) for name, path in schema.get_source_paths(config_file).items()},
+        "config": {key: config_file.get(key) for key in CONTEXT_CONFIG_KEYS}
+    }, sort_keys=True)
+
+def get_state_path(config_file: dict, ach_date: str) -> str:
+    """Gets the path of the saved state for an achievement date (YYYY-MM-DD), kept in the 
+    folder given by the "Path to incremental state" config key if it is set"""
+    root = config_file["root_directory"]
+    state_folder = config_file.get("Path to incremental state", f"{root}\\Checks\\incremental_state")
+    return f"{state_folder}\\practice_state_{ach_date}.pickle"
+
+def load_state(state_path: str, context: str):
+    """Loads the saved state of a month
+
+    Returns:
+        Optional[dict]: The saved state, None if there isn't one or it was saved by a 
+        different STATE_VERSION or in a different context
+    """
+    if not os.path.exists(state_path):
+        return None
+    try:
+        with open(state_path, "rb") as f:
+            state = pickle.load(f)
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+    if state.get("version") != STATE_VERSION or state.get("context") != context:
+        return None
+    return state
+
+def save_state(state: dict, state_path: str) -> None:
+    """Saves the state of a month, replacing the previous state in one step"""
+    state_folder = os.path.dirname(state_path)
+    if state_folder:
+        os.makedirs(state_folder, exist_ok=True)
+    temp_path = f"{state_path}.tmp"
+    with open(temp_path, "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, state_path)
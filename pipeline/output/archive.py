@@ -1,24 +1,184 @@
-import pandas as pd
-import shutil
+import datetime
+import gzip
 import os
+import shutil
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+import pandas as pd
 from ..utils.dates.dates import get_achievement_date
-def archive(config: dict, LDHC_output_df: pd.DataFrame) -> None:
-    """This function moves all files from the input folder 'Current' to the input 
-    folder 'Archive\\LDHC_monthly' or 'Archive\\Participation' depending on 
-    file type
+from ..data import cache, load
+
+MANIFEST_TABLE = "ARCHIVE_MANIFEST"
+MANIFEST_COLS = ["RUN_ID", "INPUT_TYPE", "ACH_DATE", "FILE_NAME", "CONTENT_HASH", "SIZE", "STORED_SIZE", "OBJECT", "DUPLICATE", "ARCHIVED_AT"]
+# Where inputs were archived before the object store, still read if a month has no manifest entry
+LEGACY_ARCHIVE_PATHS = {
+    "LDHC_monthly": "LDHC_monthly\\LDHC_main_{month}.csv",
+    "Participation": "Participation\\LDHC_Participation_{month}.csv"
+}
+
+def archive(config: dict, LDHC_output_df: pd.DataFrame, stored_inputs: dict = None, run_id: str = None) -> None:
+    """This function archives all files in the input folder 'Current'. Each file is stored
+    gzip compressed in 'Archive\\objects' under the sha256 hash of its contents (see
+    store_inputs), so an input that has been archived before isn't stored again, and a
+    row is added to the archive manifest (see get_manifest_path) recording the file's hash,
+    size, achievement date and run. Re-running a month adds to the manifest rather than
+    replacing the month's earlier inputs. The files are then removed from 'Current'. Any input
+    cache entries for a file are moved alongside its archived copy so that reloading it
+    doesn't need to parse the csv again.
 
     Args:
         config (dict): A dictionary continaing all the information from the config file.
         LDHC_output_df (pd.Dataframe): The main LDHC output.
+        stored_inputs (dict, optional): The inputs already being stored by store_inputs.
+        Stored now if not given.
+        run_id (str, optional): Id of the run, recorded in the manifest. Defaults to the time
+        the inputs are archived.
+    """
+    if stored_inputs is None:
+        stored_inputs = store_inputs(config)
+    root_dir = config["root_directory"]
+    current_input_folder = f"{root_dir}\\Input\\Current"
+    archived_at = datetime.datetime.now()
+    run_id = run_id or archived_at.strftime("%Y%m%d_%H%M%S")
+    ach_date = get_achievement_date(LDHC_output_df).strftime("%Y-%m-%d")
+    manifest_rows = []
+    for (input_type, file_name), stored_input in stored_inputs.items():
+        stored_input = stored_input.result()
+        manifest_rows.append({
+            "RUN_ID": run_id,
+            "INPUT_TYPE": input_type,
+            "ACH_DATE": ach_date,
+            "FILE_NAME": file_name,
+            **{col: stored_input[col] for col in ["CONTENT_HASH", "SIZE", "STORED_SIZE", "OBJECT", "DUPLICATE"]},
+            "ARCHIVED_AT": archived_at.isoformat(timespec="seconds")
+        })
+    append_manifest_rows(config, manifest_rows)
+    for (input_type, file_name), stored_input in stored_inputs.items():
+        stored_input = stored_input.result()
+        input_path = f"{current_input_folder}\\{file_name}"
+        object_path = get_object_path(config, stored_input["OBJECT"])
+        cache.move_cache_entries(input_path, object_path, new_content_hash=stored_input["STORED_HASH"])
+        os.remove(input_path)
+    return
+
+def store_inputs(config: dict) -> dict:
+    """Starts storing the files in the input folder 'Current' in the archive's object store
+    in the background (see store_input), so that hashing and compressing them overlaps with
+    the rest of the run. Call as soon as the run starts and pass the result to archive.
+
+    Args:
+        config (dict): A dictionary continaing all the information from the config file.
+
+    Returns:
+        dict: Maps (input type, file name) of each input to a Future of its store_input result
     """
     root_dir = config["root_directory"]
     current_input_folder = f"{root_dir}\\Input\\Current"
-    input_archive_folder = f"{root_dir}\\Input\\Archive"
-    date_info = get_achievement_date(LDHC_output_df).strftime("%Y-%m")
-    for file_name in os.listdir(current_input_folder):
-        if ".csv" in file_name:
-            if "Ind_Input_Details_LDHC" in file_name:
-                shutil.move(f"{current_input_folder}\\{file_name}", f"{input_archive_folder}\\LDHC_monthly\\LDHC_main_{date_info}.csv")
-            elif "QS Part Status-LDHC" in file_name:
-                shutil.move(f"{current_input_folder}\\{file_name}", f"{input_archive_folder}\\Participation\\LDHC_Participation_{date_info}.csv")
-    return
\ No newline at end of file
+    objects_folder = get_objects_folder(config)
+    input_files = [
+        (input_type, file_name)
+        for input_type, file_names in load.load_input_file_names(f"{current_input_folder}\\").items()
+        for file_name in file_names if ".csv" in file_name
+    ]
+    executor = ThreadPoolExecutor(max_workers=max(len(input_files), 1), thread_name_prefix="archive")
+    stored_inputs = {
+        (input_type, file_name): executor.submit(store_input, f"{current_input_folder}\\{file_name}", objects_folder)
+        for input_type, file_name in input_files
+    }
+    executor.shutdown(wait=False)
+    return stored_inputs
+
+def store_input(input_path: str, objects_folder: str) -> dict:
+    """Stores a file in the object store as '<sha256 of its contents>.csv.gz', unless a file
+    with the same contents is already stored. The gzip header holds no file name or time,
+    so the same contents always give the same object. hashlib and zlib release the GIL, so
+    this runs alongside the processing.
+
+    Args:
+        input_path (str): Path to the file
+        objects_folder (str): The object store folder
+
+    Returns:
+        dict: The file's "CONTENT_HASH", "SIZE", the "OBJECT" name and its "STORED_SIZE" and
+        "STORED_HASH" (the hash of the compressed object), and whether it was already stored
+        ("DUPLICATE")
+    """
+    content_hash = cache.hash_file(input_path)
+    object_name = f"{content_hash}.csv.gz"
+    object_path = f"{objects_folder}\\{object_name}"
+    duplicate = os.path.exists(object_path)
+    if not duplicate:
+        os.makedirs(objects_folder, exist_ok=True)
+        temp_path = f"{object_path}.{os.getpid()}.tmp"
+        with open(input_path, "rb") as source, open(temp_path, "wb") as raw_target:
+            with gzip.GzipFile(filename="", mode="wb", fileobj=raw_target, compresslevel=6, mtime=0) as target:
+                shutil.copyfileobj(source, target, 1 << 20)
+        os.replace(temp_path, object_path)
+    return {
+        "CONTENT_HASH": content_hash,
+        "SIZE": os.path.getsize(input_path),
+        "OBJECT": object_name,
+        "STORED_SIZE": os.path.getsize(object_path),
+        "STORED_HASH": cache.hash_file(object_path),
+        "DUPLICATE": int(duplicate)
+    }
+
+def get_archived_input_path(config: dict, input_type: str, month: str) -> str:
+    """Gets the path of a month's archived input, the one archived most recently if the month
+    was run more than once. Archived objects are gzip compressed, pd.read_csv (and so
+    load.read_input_file) decompresses them as it reads. Months archived before the object
+    store are read from their old location (see LEGACY_ARCHIVE_PATHS).
+
+    Args:
+        config (dict): A dictionary continaing all the information from the config file.
+        input_type (str): "LDHC_monthly" or "Participation"
+        month (str): The month in the form YYYY-MM
+
+    Returns:
+        str: Path of the archived input
+    """
+    manifest_path = get_manifest_path(config)
+    if os.path.exists(manifest_path):
+        with closing(sqlite3.connect(manifest_path, timeout=30)) as conn:
+            row = conn.execute(
+                f"SELECT OBJECT FROM {MANIFEST_TABLE} WHERE INPUT_TYPE = ? AND substr(ACH_DATE, 1, 7) = ? ORDER BY rowid DESC LIMIT 1",
+                (input_type, month)
+            ).fetchone()
+        if row is not None:
+            return get_object_path(config, row[0])
+    return f"{get_archive_folder(config)}\\{LEGACY_ARCHIVE_PATHS[input_type].format(month=month)}"
+
+def read_manifest(config: dict) -> pd.DataFrame:
+    """Reads the archive manifest, oldest first"""
+    with closing(sqlite3.connect(get_manifest_path(config), timeout=30)) as conn:
+        cursor = conn.execute(f"SELECT {', '.join(MANIFEST_COLS)} FROM {MANIFEST_TABLE} ORDER BY rowid")
+        return pd.DataFrame(cursor.fetchall(), columns=MANIFEST_COLS)
+
+def append_manifest_rows(config: dict, manifest_rows: list) -> None:
+    """Adds rows to the archive manifest, creating it if needed"""
+    with closing(sqlite3.connect(get_manifest_path(config), timeout=30)) as conn, conn:
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {MANIFEST_TABLE} "
+            "(RUN_ID TEXT, INPUT_TYPE TEXT, ACH_DATE TEXT, FILE_NAME TEXT, CONTENT_HASH TEXT, SIZE INTEGER, "
+            "STORED_SIZE INTEGER, OBJECT TEXT, DUPLICATE INTEGER, ARCHIVED_AT TEXT)"
+        )
+        conn.executemany(
+            f"INSERT INTO {MANIFEST_TABLE} ({', '.join(MANIFEST_COLS)}) VALUES ({', '.join('?' * len(MANIFEST_COLS))})",
+            [[row[col] for col in MANIFEST_COLS] for row in manifest_rows]
+        )
+
+def get_archive_folder(config: dict) -> str:
+    root_dir = config["root_directory"]
+    return f"{root_dir}\\Input\\Archive"
+
+def get_objects_folder(config: dict) -> str:
+    return f"{get_archive_folder(config)}\\objects"
+
+def get_object_path(config: dict, object_name: str) -> str:
+    return f"{get_objects_folder(config)}\\{object_name}"
+
+def get_manifest_path(config: dict) -> str:
+    """Gets the path to the archive manifest, taken from the "Path to archive manifest"
+    config key if it is set"""
+    return config.get("Path to archive manifest", f"{get_archive_folder(config)}\\archive_manifest.sqlite")
@@ -0,0 +1,187 @@
+import datetime
+import os
+import sqlite3
+from contextlib import closing
+import pandas as pd
+from ..data import load
+
+# Sheets of the DQ check results workbook, in the order they are exported
+DQ_HISTORY_SHEETS = ["DQ_1", "DQ_2_missing_info", "DQ_2_additional_info", "DQ_3"]
+DQ_RUNS_TABLE = "DQ_RUNS"
+# Bookkeeping columns held alongside the DQ results but not exported
+STORE_COLS = ["RUN_ID", "ROW_NUM", "ACH_DATE_KEY"]
+
+def get_DQ_history_path(config: dict) -> str:
+    """Gets the path to the DQ history store, taken from the "Path to DQ history store"
+    config key if it is set
+
+    Args:
+        config (dict): A dict holding all information from the config file
+
+    Returns:
+        str: Path to the SQLite DQ history store
+    """    
+    root = config["root_directory"]
+    return config.get("Path to DQ history store", f"{root}\\Checks\\DQ_check_history.sqlite")
+
+def get_DQ_workbook_path(config: dict) -> str:
+    """Gets the path of the DQ check results workbook"""
+    root = config["root_directory"]
+    return f"{root}\\Checks\\DQ_check_results.xlsx"
+
+def append_DQ_results(config: dict, DQ_results: dict, ach_date: str, run_date: str) -> int:
+    """Appends one run's DQ check results to the DQ history store. Results are only ever 
+    inserted, partitioned by achievement date, so a run only costs its own rows however
+    many months the history holds. 
+
+    The first time the store is used, the history held in the DQ check results workbook 
+    (if there is one) is imported into it.
+
+    Args:
+        config (dict): A dict holding all information from the config file
+        DQ_results (dict): Maps each of DQ_HISTORY_SHEETS to the run's results for that check
+        ach_date (str): The achievement date in the form YYYY-MM-DD
+        run_date (str): The date the process was run
+
+    Returns:
+        int: The id of the run in the store
+    """    
+    store_path = get_DQ_history_path(config)
+    if not os.path.exists(store_path):
+        create_store(store_path)
+        import_DQ_workbook(config, store_path)
+    with closing(sqlite3.connect(store_path, timeout=30)) as conn, conn:
+        run_id = insert_run(conn, ach_date, run_date)
+        for sheet_name in DQ_HISTORY_SHEETS:
+            insert_rows(conn, sheet_name, DQ_results[sheet_name], run_id, [ach_date] * len(DQ_results[sheet_name]))
+    return run_id
+
+def create_store(store_path: str) -> None:
+    """Creates an empty DQ history store"""
+    store_folder = os.path.dirname(store_path)
+    if store_folder:
+        os.makedirs(store_folder, exist_ok=True)
+    with closing(sqlite3.connect(store_path, timeout=30)) as conn, conn:
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {DQ_RUNS_TABLE} "
+            "(RUN_ID INTEGER PRIMARY KEY AUTOINCREMENT, ACH_DATE_KEY TEXT, DATE_RUN TEXT, CREATED TEXT)"
+        )
+
+def insert_run(conn: sqlite3.Connection, ach_date: str, run_date: str) -> int:
+    """Records a run in the store and returns its id"""
+    cursor = conn.execute(
+        f"INSERT INTO {DQ_RUNS_TABLE} (ACH_DATE_KEY, DATE_RUN, CREATED) VALUES (?, ?, ?)",
+        (ach_date, run_date, datetime.datetime.now().isoformat(timespec="seconds"))
+    )
+    return cursor.lastrowid
+
+def insert_rows(conn: sqlite3.Connection, sheet_name: str, DQ_data: pd.DataFrame, run_id: int, ach_date_keys: list) -> None:
+    """Inserts a run's rows for one DQ check, with the achievement date (YYYY-MM-DD) of each
+    row given by ach_date_keys, creating the check's table (or any columns 
+    the table doesn't have yet) as needed. The result columns are left untyped so values
+    are stored as they are, as they would be in the workbook.
+    """    
+    table_cols = get_table_cols(conn, sheet_name)
+    if not table_cols:
+        conn.execute(
+            f'CREATE TABLE "{sheet_name}" (RUN_ID INTEGER, ROW_NUM INTEGER, ACH_DATE_KEY TEXT)'
+        )
+        conn.execute(
+            f'CREATE INDEX "{sheet_name}_partition" ON "{sheet_name}" (ACH_DATE_KEY, RUN_ID)'
+        )
+        table_cols = list(STORE_COLS)
+    for col in DQ_data.columns:
+        if col not in table_cols:
+            conn.execute(f'ALTER TABLE "{sheet_name}" ADD COLUMN "{col}"')
+            table_cols.append(col)
+    cols = STORE_COLS + list(DQ_data.columns)
+    values = DQ_data.astype(object).where(DQ_data.notna(), None)
+    rows = (
+        (run_id, row_num, ach_date_key, *row) 
+        for row_num, (ach_date_key, row) in enumerate(zip(ach_date_keys, values.itertuples(index=False, name=None)))
+    )
+    col_list = ", ".join(f'"{col}"' for col in cols)
+    placeholders = ", ".join("?" * len(cols))
+    conn.executemany(f'INSERT INTO "{sheet_name}" ({col_list}) VALUES ({placeholders})', rows)
+
+def get_table_cols(conn: sqlite3.Connection, table_name: str) -> list:
+    """Gets the column names of a table in the store, empty if the table doesn't exist"""
+    return [row[1] for row in conn.execute(f'PRAGMA table_info("{table_name}")')]
+
+def import_DQ_workbook(config: dict, store_path: str) -> None:
+    """Imports the history held in the DQ check results workbook into a new store, as a 
+    single run. The workbook's additional info sheet only holds the additional info from 
+    the last run (it was previously built on top of the missing info history), so only 
+    those rows are imported from it.
+    """    
+    if not os.path.exists(get_DQ_workbook_path(config)):
+        return
+    sheet_dict_DQ_hist = load.load_DQ_checks_history(config)
+    additional_info = sheet_dict_DQ_hist.get("DQ_2_additional_info")
+    if additional_info is not None and len(additional_info) > 0:
+        last_run = (additional_info["DATE_RUN"] == additional_info["DATE_RUN"].iloc[0]) & (additional_info["ACH_DATE"] == additional_info["ACH_DATE"].iloc[0])
+        sheet_dict_DQ_hist["DQ_2_additional_info"] = additional_info[last_run.cummin()]
+    with closing(sqlite3.connect(store_path, timeout=30)) as conn, conn:
+        run_id = insert_run(conn, None, "Imported from DQ_check_results.xlsx")
+        for sheet_name in DQ_HISTORY_SHEETS:
+            history = sheet_dict_DQ_hist.get(sheet_name)
+            if history is None or "ACH_DATE" not in history.columns:
+                continue
+            ach_date_keys = pd.to_datetime(history["ACH_DATE"].astype(str), format="%d/%m/%Y", errors="coerce").dt.strftime("%Y-%m-%d")
+            insert_rows(conn, sheet_name, history, run_id, ach_date_keys.astype(object).where(ach_date_keys.notna(), None).tolist())
+
+def read_DQ_history(config: dict, sheet_name: str, ach_dates: list = None) -> pd.DataFrame:
+    """Reads the history of one DQ check, newest run first
+
+    Args:
+        config (dict): A dict holding all information from the config file
+        sheet_name (str): One of DQ_HISTORY_SHEETS
+        ach_dates (list, optional): Achievement dates (YYYY-MM-DD) to read. Defaults to all.
+
+    Returns:
+        pd.DataFrame: The DQ check history
+    """    
+    with closing(sqlite3.connect(get_DQ_history_path(config), timeout=30)) as conn:
+        cursor = select_history(conn, sheet_name, ach_dates)
+        return pd.DataFrame(cursor.fetchall(), columns=[col[0] for col in cursor.description])
+
+def select_history(conn: sqlite3.Connection, sheet_name: str, ach_dates: list = None) -> sqlite3.Cursor:
+    """Selects the exported columns of a DQ check's history, newest run first"""
+    cols = [col for col in get_table_cols(conn, sheet_name) if col not in STORE_COLS]
+    col_list = ", ".join(f'"{col}"' for col in cols)
+    query = f'SELECT {col_list} FROM "{sheet_name}"'
+    params = []
+    if ach_dates is not None:
+        query += f" WHERE ACH_DATE_KEY IN ({', '.join('?' * len(ach_dates))})"
+        params = list(ach_dates)
+    return conn.execute(query + " ORDER BY RUN_ID DESC, ROW_NUM", params)
+
+def export_DQ_workbook(config: dict, path: str = None, ach_dates: list = None) -> str:
+    """Writes the DQ history store out as the DQ check results workbook, one sheet per check
+    with the newest run at the top. Rows are streamed from the store into a write-only 
+    workbook, so memory use doesn't grow with the size of the history.
+
+    Args:
+        config (dict): A dict holding all information from the config file
+        path (str, optional): Where to write the workbook. Defaults to Checks\\DQ_check_results.xlsx
+        ach_dates (list, optional): Achievement dates (YYYY-MM-DD) to export. Defaults to all.
+
+    Returns:
+        str: Path of the workbook
+    """    
+    from openpyxl import Workbook
+    path = path or get_DQ_workbook_path(config)
+    temp_path = f"{path}.tmp.xlsx"
+    workbook = Workbook(write_only=True)
+    with closing(sqlite3.connect(get_DQ_history_path(config), timeout=30)) as conn:
+        for sheet_name in DQ_HISTORY_SHEETS:
+            worksheet = workbook.create_sheet(sheet_name)
+            if not get_table_cols(conn, sheet_name):
+                continue
+            cursor = select_history(conn, sheet_name, ach_dates)
+            worksheet.append([col[0] for col in cursor.description])
+            for row in cursor:
+                worksheet.append(row)
+        workbook.save(temp_path)
+    os.replace(temp_path, path)
+    return path
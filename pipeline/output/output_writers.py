@@ -0,0 +1,277 @@
+import gzip
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+# Rows encoded at a time by the arrow csv encoder, chunks are encoded in parallel
+CSV_CHUNK_ROWS = 100_000
+# The output csv uses the line terminator DataFrame.to_csv uses when writing to a path
+CSV_LINE_TERMINATOR = os.linesep
+# The suppression mask column (see original_suppression.suppress_output), the column whose
+# flagged values are suppressed and what is published in their place
+SUPPRESSED_COL = "SUPPRESSED"
+SUPPRESSED_VALUE_COL = "VALUE"
+SUPPRESSED_MARKER = "*"
+
+# Output writers (see write_LDHC_monthly.open_output_writers) are created with the path of the
+# output csv, the achievement date (YYYYMMDD), the config and the service year. write() is called
+# with the rows of the output in order, then close() to put the output in place or abort() to
+# discard it.
+
+class CSVWriter:
+    """Writes the output csv. The file is the same, byte for byte, as DataFrame.to_csv with
+    index=False would write. The "Output CSV encoder" config key picks how it is encoded:
+    'arrow' (the default) encodes chunks of rows in parallel with pyarrow's csv writer (see
+    encode_csv), 'pandas' uses DataFrame.to_csv. Suppressed values are written as a '*' (see 
+    get_published_values).
+    """
+    def __init__(self, output_path: str, ach_date: str, config_file: dict, service_year: str):
+        self.path = self.get_path(output_path)
+        self.temp_path = f"{self.path}.tmp"
+        self.encoder = config_file.get("Output CSV encoder", "arrow")
+        if self.encoder not in ("arrow", "pandas"):
+            raise ValueError(f"Unknown 'Output CSV encoder' value '{self.encoder}', expected one of ('arrow', 'pandas')")
+        self.header = True
+        self.file = self.open(self.temp_path)
+
+    def get_path(self, output_path: str) -> str:
+        return output_path
+
+    def open(self, path: str):
+        return open(path, "wb")
+
+    def write(self, LDHC_output_df: pd.DataFrame) -> None:
+        for encoded_chunk in encode_csv(get_published_values(LDHC_output_df), self.header, self.encoder):
+            self.file.write(encoded_chunk)
+        self.header = False
+
+    def close(self) -> None:
+        self.file.close()
+        os.replace(self.temp_path, self.path)
+
+    def abort(self) -> None:
+        self.file.close()
+        os.remove(self.temp_path)
+
+class CompressedCSVWriter(CSVWriter):
+    """Writes the output csv gzip compressed, alongside the csv (.csv.gz). The gzip header holds
+    no file name or time, so the same output always gives the same file."""
+    def get_path(self, output_path: str) -> str:
+        return f"{output_path}.gz"
+
+    def open(self, path: str):
+        self.raw_file = open(path, "wb")
+        return gzip.GzipFile(filename="", mode="wb", fileobj=self.raw_file, compresslevel=6, mtime=0)
+
+    def close(self) -> None:
+        self.file.close()
+        self.raw_file.close()
+        os.replace(self.temp_path, self.path)
+
+    def abort(self) -> None:
+        self.file.close()
+        self.raw_file.close()
+        os.remove(self.temp_path)
+
+class ParquetWriter:
+    """Writes the output as a Parquet dataset partitioned by achievement date, in the folder
+    Output\\yy_yy\\parquet, with a folder per month (ACH_DATE=YYYYMMDD) holding a file per
+    write. A month's folder is replaced each time the month is written. The dataset can be
+    read with pd.read_parquet, e.g. a single month with filters=[("ACH_DATE", "==", 20230331)].
+    Columns are written as the text they have in the csv, except for VALUE which is written as
+    an integer with suppressed values left out (null) and the suppression mask, which is 
+    written as a boolean SUPPRESSED column.
+    """
+    def __init__(self, output_path: str, ach_date: str, config_file: dict, service_year: str):
+        import pyarrow.parquet  # noqa: F401
+        root = config_file["root_directory"]
+        self.path = f"{root}\\Output\\{service_year}\\parquet\\ACH_DATE={ach_date}"
+        self.temp_path = f"{self.path}.tmp"
+        if os.path.exists(self.temp_path):
+            shutil.rmtree(self.temp_path)
+        os.makedirs(self.temp_path)
+        self.n_parts = 0
+
+    def write(self, LDHC_output_df: pd.DataFrame) -> None:
+        import pyarrow.parquet
+        import pyarrow.compute
+        import pyarrow
+        # Every column but the values and the mask is written as text so that all parts and months
+        # have the same schema
+        has_mask = SUPPRESSED_COL in LDHC_output_df.columns
+        columns = {
+            col_name: None if has_mask and col_name in (SUPPRESSED_VALUE_COL, SUPPRESSED_COL) else get_text_array(col)
+            for col_name, col in LDHC_output_df.drop(columns="ACH_DATE").items()
+        }
+        if has_mask:
+            suppressed = pyarrow.array(LDHC_output_df[SUPPRESSED_COL].to_numpy(dtype=bool))
+            values = pyarrow.array(LDHC_output_df[SUPPRESSED_VALUE_COL].to_numpy(), from_pandas=True).cast(pyarrow.int64())
+            columns[SUPPRESSED_VALUE_COL] = pyarrow.compute.if_else(suppressed, pyarrow.scalar(None, pyarrow.int64()), values)
+            columns[SUPPRESSED_COL] = suppressed
+        table = pyarrow.table(columns)
+        pyarrow.parquet.write_table(table, os.path.join(self.temp_path, f"part-{self.n_parts:05d}.parquet"))
+        self.n_parts += 1
+
+    def close(self) -> None:
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.replace(self.temp_path, self.path)
+
+    def abort(self) -> None:
+        shutil.rmtree(self.temp_path)
+
+# Writers for each output format
+OUTPUT_WRITERS = {
+    "csv": CSVWriter,
+    "csv.gz": CompressedCSVWriter,
+    "parquet": ParquetWriter
+}
+
+def get_published_values(LDHC_output_df: pd.DataFrame) -> pd.DataFrame:
+    """Puts a '*' in place of every value flagged in the suppression mask column and leaves the
+    mask out, giving the rows as they are published. With pyarrow the values are converted to 
+    the text pandas writes for them (see get_text_array), so they become a column of text
+    rather than a column of numbers and '*'s. Blank values are left as None. A df without a 
+    mask is returned as it is.
+
+    Args:
+        LDHC_output_df (pd.DataFrame): The rows to publish
+
+    Returns:
+        pd.DataFrame: The rows with the suppressed values replaced with a '*'
+    """
+    if SUPPRESSED_COL not in LDHC_output_df.columns:
+        return LDHC_output_df
+    suppressed = LDHC_output_df[SUPPRESSED_COL].to_numpy(dtype=bool)
+    published_df = LDHC_output_df.drop(columns=SUPPRESSED_COL)
+    try:
+        import pyarrow
+        import pyarrow.compute
+    except ImportError:
+        values = published_df[SUPPRESSED_VALUE_COL].to_numpy(dtype=object, copy=True)
+        values[suppressed] = SUPPRESSED_MARKER
+        return published_df.assign(**{SUPPRESSED_VALUE_COL: values})
+    values = pyarrow.compute.if_else(pyarrow.array(suppressed), SUPPRESSED_MARKER, get_text_array(published_df[SUPPRESSED_VALUE_COL]))
+    return published_df.assign(**{SUPPRESSED_VALUE_COL: values.to_numpy(zero_copy_only=False)})
+
+def encode_csv(LDHC_output_df: pd.DataFrame, header: bool = True, encoder: str = "arrow"):
+    """Encodes a df as csv, in the form DataFrame.to_csv gives when writing to a path with
+    index=False. The header is always written by pandas.
+
+    The 'arrow' encoder converts the columns to an arrow table, with every column that isn't
+    an integer or string column converted to text as pandas would write it (see
+    to_arrow_table), then encodes chunks of CSV_CHUNK_ROWS rows on a thread pool with
+    pyarrow's csv writer, which doesn't hold the GIL. pyarrow won't write values that need
+    quoting without quoting every value, so any chunk holding such a value is encoded by
+    pandas. If pyarrow isn't installed or the df has columns pandas formats in its own way
+    (dates, times and so on), the whole df is encoded by pandas.
+
+    Args:
+        LDHC_output_df (pd.DataFrame): The rows to encode
+        header (bool, optional): Whether to start with the header. Defaults to True.
+        encoder (str, optional): 'arrow' or 'pandas'. Defaults to "arrow".
+
+    Yields:
+        bytes: The encoded csv, in order
+    """
+    if header:
+        yield to_csv_bytes(LDHC_output_df.iloc[:0], header=True)
+    if len(LDHC_output_df) == 0:
+        return
+    if encoder != "arrow" or not supports_arrow_encoding(LDHC_output_df):
+        yield to_csv_bytes(LDHC_output_df, header=False)
+        return
+    import pyarrow
+    import pyarrow.csv
+    table = to_arrow_table(LDHC_output_df)
+    write_options, replace_line_ends = get_csv_write_options()
+    def encode_chunk(start):
+        sink = pyarrow.BufferOutputStream()
+        try:
+            pyarrow.csv.write_csv(table.slice(start, CSV_CHUNK_ROWS), sink, write_options)
+        except pyarrow.ArrowInvalid:
+            return to_csv_bytes(LDHC_output_df.iloc[start:start + CSV_CHUNK_ROWS], header=False)
+        encoded_chunk = sink.getvalue().to_pybytes()
+        if replace_line_ends:
+            encoded_chunk = encoded_chunk.replace(b"\n", CSV_LINE_TERMINATOR.encode("utf-8"))
+        return encoded_chunk
+    chunk_starts = range(0, len(LDHC_output_df), CSV_CHUNK_ROWS)
+    with ThreadPoolExecutor(max_workers=min(len(chunk_starts), os.cpu_count() or 1)) as executor:
+        yield from executor.map(encode_chunk, chunk_starts)
+
+def get_csv_write_options():
+    """Gets the options for pyarrow's csv writer. The line terminator can only be set from
+    pyarrow 13, earlier versions end every line with '\\n'. As values that need quoting are never
+    written by pyarrow (see encode_csv) every '\\n' it writes is a line end, so these are replaced
+    with CSV_LINE_TERMINATOR after encoding.
+
+    Returns:
+        tuple: The pyarrow.csv.WriteOptions and whether the line ends need replacing
+    """
+    import pyarrow.csv
+    try:
+        return pyarrow.csv.WriteOptions(include_header=False, quoting_style="none", eol=CSV_LINE_TERMINATOR), False
+    except TypeError:
+        return pyarrow.csv.WriteOptions(include_header=False, quoting_style="none"), CSV_LINE_TERMINATOR != "\n"
+
+def to_csv_bytes(LDHC_output_df: pd.DataFrame, header: bool) -> bytes:
+    """Encodes a df with DataFrame.to_csv. The line terminator argument was named 
+    line_terminator before pandas 1.5."""
+    pandas_version = tuple(int(part) for part in pd.__version__.split(".")[:2])
+    line_terminator_arg = "lineterminator" if pandas_version >= (1, 5) else "line_terminator"
+    return LDHC_output_df.to_csv(index=False, header=header, **{line_terminator_arg: CSV_LINE_TERMINATOR}).encode("utf-8")
+
+def supports_arrow_encoding(LDHC_output_df: pd.DataFrame) -> bool:
+    """Checks that pyarrow is installed and that every column is one the arrow encoder writes
+    as pandas does. A single column df is left to pandas as it quotes empty values."""
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.csv  # noqa: F401
+    except ImportError:
+        return False
+    pandas_formatted = (
+        pd.api.types.is_datetime64_any_dtype(col) or pd.api.types.is_timedelta64_dtype(col)
+        or pd.api.types.is_complex_dtype(col) or isinstance(col.dtype, (pd.PeriodDtype, pd.IntervalDtype, pd.SparseDtype))
+        for _, col in LDHC_output_df.items()
+    )
+    return len(LDHC_output_df.columns) > 1 and not any(pandas_formatted)
+
+def to_arrow_table(LDHC_output_df: pd.DataFrame):
+    """Converts a df to an arrow table for the csv encoder. Integer and string columns are kept
+    as they are, other columns are converted to the text pandas would write for them.
+
+    Args:
+        LDHC_output_df (pd.DataFrame): The df to convert
+
+    Returns:
+        pyarrow.Table: The table
+    """
+    import pyarrow
+    columns = {}
+    for col_name, col in LDHC_output_df.items():
+        if (pd.api.types.is_integer_dtype(col) and not col.hasnans) or isinstance(col.dtype, pd.StringDtype):
+            columns[col_name] = pyarrow.array(col, from_pandas=True)
+        else:
+            columns[col_name] = get_text_array(col)
+    return pyarrow.table(columns)
+
+def get_text_array(col: pd.Series):
+    """Converts a column to an arrow string array holding the text pandas writes for each value,
+    nothing if it is missing (see pandas' get_values_for_csv). Extension columns such as
+    categoricals are converted to objects first as pandas does."""
+    import pyarrow
+    if isinstance(col.dtype, pd.api.extensions.ExtensionDtype):
+        values = np.asarray(col.array.astype(object))
+    else:
+        values = col.to_numpy()
+    if values.dtype.kind in "iu":
+        return pyarrow.array(values).cast(pyarrow.string())
+    if values.dtype == object:
+        # Quickest when every value is a string
+        try:
+            return pyarrow.array(values, type=pyarrow.string(), from_pandas=True)
+        except (pyarrow.ArrowTypeError, pyarrow.ArrowInvalid):
+            pass
+    return pyarrow.array(values.astype(str), type=pyarrow.string(), mask=pd.isna(values))
@@ -0,0 +1,122 @@
+import datetime
+import os
+import sqlite3
+from contextlib import closing
+import pandas as pd
+
+PARTICIPATION_TOTALS_TABLE = "PARTICIPATION_TOTALS"
+PARTICIPATION_TOTALS_COLS = ["ACH_DATE", "Description", "Count", "Percentage"]
+
+def get_participation_store_path(config: dict) -> str:
+    """Gets the path to the participation totals store, taken from the "Path to participation
+    totals store" config key if it is set"""
+    root = config["root_directory"]
+    return config.get("Path to participation totals store", f"{root}\\Checks\\LDHC_participation_totals.sqlite")
+
+def get_participation_workbook_path(config: dict) -> str:
+    """Gets the path of the participation totals workbook"""
+    root = config["root_directory"]
+    return f"{root}\\Checks\\LDHC_participation_totals.xlsx"
+
+def write_participation_totals(participation_totals: pd.DataFrame, config: dict, restate: bool = False) -> None:
+    """Adds participation totals for one or more achievement months to the participation 
+    totals store. Only the given months are written. Months already in the store are left 
+    as they are unless restate is True, in which case they are replaced.
+
+    The first time the store is used, the totals held in the participation totals workbook
+    (if there is one) are imported into it.
+
+    Args:
+        participation_totals (pd.DataFrame): Totals with the columns PARTICIPATION_TOTALS_COLS
+        config (dict): A dict holding all information from the config file
+        restate (bool, optional): Replace months already in the store. Defaults to False.
+    """    
+    store_path = get_participation_store_path(config)
+    if not os.path.exists(store_path):
+        create_store(store_path)
+        import_participation_workbook(config, store_path)
+    participation_totals = participation_totals.assign(ACH_DATE=format_ach_dates(participation_totals["ACH_DATE"]))
+    with closing(sqlite3.connect(store_path, timeout=30)) as conn, conn:
+        for ach_date, month_totals in participation_totals.groupby("ACH_DATE", sort=False):
+            month_exists = conn.execute(
+                f"SELECT 1 FROM {PARTICIPATION_TOTALS_TABLE} WHERE ACH_DATE = ? LIMIT 1", (ach_date,)
+            ).fetchone()
+            if month_exists and not restate:
+                print(f"Data for {ach_date} already exists in ldhc-participation-totals.")
+                continue
+            conn.execute(f"DELETE FROM {PARTICIPATION_TOTALS_TABLE} WHERE ACH_DATE = ?", (ach_date,))
+            insert_rows(conn, month_totals)
+
+def create_store(store_path: str) -> None:
+    """Creates an empty participation totals store"""
+    store_folder = os.path.dirname(store_path)
+    if store_folder:
+        os.makedirs(store_folder, exist_ok=True)
+    with closing(sqlite3.connect(store_path, timeout=30)) as conn, conn:
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {PARTICIPATION_TOTALS_TABLE} "
+            "(ACH_DATE TEXT, ROW_NUM INTEGER, Description TEXT, Count INTEGER, Percentage TEXT, CREATED TEXT, "
+            "PRIMARY KEY (ACH_DATE, ROW_NUM))"
+        )
+
+def insert_rows(conn: sqlite3.Connection, month_totals: pd.DataFrame) -> None:
+    """Inserts the totals of one achievement month, keeping their row order"""
+    created = datetime.datetime.now().isoformat(timespec="seconds")
+    rows = month_totals[PARTICIPATION_TOTALS_COLS].astype(object).where(month_totals[PARTICIPATION_TOTALS_COLS].notna(), None)
+    conn.executemany(
+        f"INSERT INTO {PARTICIPATION_TOTALS_TABLE} (ACH_DATE, ROW_NUM, Description, Count, Percentage, CREATED) VALUES (?, ?, ?, ?, ?, ?)",
+        (
+            (ach_date, row_num, description, count, percentage, created)
+            for row_num, (ach_date, description, count, percentage) in enumerate(rows.itertuples(index=False, name=None))
+        )
+    )
+
+def format_ach_dates(ach_dates: pd.Series) -> pd.Series:
+    """Formats achievement dates as YYYY-MM-DD, leaving any value that isn't a date as it is"""
+    parsed_dates = pd.to_datetime(ach_dates, errors="coerce")
+    return parsed_dates.dt.strftime("%Y-%m-%d").where(parsed_dates.notna(), ach_dates.astype(str))
+
+def import_participation_workbook(config: dict, store_path: str) -> None:
+    """Imports the totals held in the participation totals workbook into a new store"""
+    workbook_path = get_participation_workbook_path(config)
+    if not os.path.exists(workbook_path):
+        return
+    aggregate_participation_totals = pd.read_excel(workbook_path)
+    if aggregate_participation_totals.empty:
+        return
+    aggregate_participation_totals["ACH_DATE"] = format_ach_dates(aggregate_participation_totals["ACH_DATE"])
+    with closing(sqlite3.connect(store_path, timeout=30)) as conn, conn:
+        for _, month_totals in aggregate_participation_totals.groupby("ACH_DATE", sort=False):
+            insert_rows(conn, month_totals)
+
+def read_participation_totals(config: dict) -> pd.DataFrame:
+    """Reads every month's participation totals from the store, in achievement date order
+
+    Args:
+        config (dict): A dict holding all information from the config file
+
+    Returns:
+        pd.DataFrame: The participation totals with the columns PARTICIPATION_TOTALS_COLS
+    """    
+    col_list = ", ".join(PARTICIPATION_TOTALS_COLS)
+    with closing(sqlite3.connect(get_participation_store_path(config), timeout=30)) as conn:
+        participation_totals = pd.read_sql_query(
+            f"SELECT {col_list} FROM {PARTICIPATION_TOTALS_TABLE} ORDER BY ACH_DATE, ROW_NUM", conn
+        )
+    parsed_dates = pd.to_datetime(participation_totals["ACH_DATE"], format="%Y-%m-%d", errors="coerce")
+    participation_totals["ACH_DATE"] = parsed_dates.astype(object).where(parsed_dates.notna(), participation_totals["ACH_DATE"])
+    return participation_totals
+
+def export_participation_workbook(config: dict, path: str = None) -> str:
+    """Writes the participation totals store out as the participation totals workbook
+
+    Args:
+        config (dict): A dict holding all information from the config file
+        path (str, optional): Where to write the workbook. Defaults to Checks\\LDHC_participation_totals.xlsx
+
+    Returns:
+        str: Path of the workbook
+    """    
+    path = path or get_participation_workbook_path(config)
+    read_participation_totals(config).to_excel(path, index=False)
+    return path
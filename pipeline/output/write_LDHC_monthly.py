@@ -1,9 +1,12 @@
 import pandas as pd
 from ..utils.dates import dates
+from . import output_writers
+from contextlib import contextmanager
 import datetime
 
 def write_LDHC(LDHC_output_df: pd.DataFrame, config_file: dict, service_year="22_23"):
-    """Writes the main LDHC file to the output folder with the correct file_name     
+    """Writes the main LDHC file to the output folder with the correct file_name, along with
+    any additional output formats (see open_output_writers)
 
     Args:
         LDHC_output_df (pd.DataFrame): The final LDHC main df after all processing has been applied
@@ -11,13 +14,64 @@ def write_LDHC(LDHC_output_df: pd.DataFrame, config_file: dict, service_year="22
         service_year (str, optional): The relevant service year of the publication being run in the form
         yy_yy. Defaults to "22_23".
     """    
+    with open_output_writers(LDHC_output_df, config_file, service_year) as write_output:
+        write_output(LDHC_output_df)
+    return
+
+@contextmanager
+def open_output_writers(LDHC_output_df: pd.DataFrame, config_file: dict, service_year="22_23"):
+    """Opens a writer for the output csv and for each of the formats listed under "Additional
+    output formats" in the config (see output_writers.OUTPUT_WRITERS), and yields a function
+    that writes rows of the output to all of them. The output can be written in one go or a 
+    part at a time (see streaming), in order.
+
+    The writers write to temporary files that replace the outputs once the block has finished,
+    so if anything in the block raises no output is changed.
+
+    Args:
+        LDHC_output_df (pd.DataFrame): A df holding the achievement date of the output in its ACH_DATE column
+        config_file (dict): A dictionary containing all the config file information
+        service_year (str, optional): The relevant service year of the publication being run in the form
+        yy_yy. Defaults to "22_23".
+    """    
+    output_formats = ["csv"] + list(config_file.get("Additional output formats", []))
+    unknown_formats = [output_format for output_format in output_formats if output_format not in output_writers.OUTPUT_WRITERS]
+    if unknown_formats:
+        raise ValueError(f"Unknown output formats {unknown_formats}, expected some of {list(output_writers.OUTPUT_WRITERS)}")
+    output_path = get_output_path(LDHC_output_df, config_file, service_year)
+    ach_date = dates.get_achievement_date(LDHC_output_df).strftime("%Y%m%d")
+    writers = []
+    try:
+        for output_format in output_formats:
+            writers.append(output_writers.OUTPUT_WRITERS[output_format](output_path, ach_date, config_file, service_year))
+        def write_output(LDHC_output_part):
+            for writer in writers:
+                writer.write(LDHC_output_part)
+        yield write_output
+    except BaseException:
+        for writer in writers:
+            writer.abort()
+        raise
+    for writer in writers:
+        writer.close()
+
+def get_output_path(LDHC_output_df: pd.DataFrame, config_file: dict, service_year="22_23") -> str:
+    """Gets the path the main LDHC file is written to (see write_LDHC)
+
+    Args:
+        LDHC_output_df (pd.DataFrame): A df holding the achievement date of the output in its ACH_DATE column
+        config_file (dict): A dictionary containing all the config file information
+        service_year (str, optional): The relevant service year of the publication being run in the form
+        yy_yy. Defaults to "22_23".
+
+    Returns:
+        str: Path of the main LDHC file
+    """    
     root = config_file["root_directory"]
     output_folder = f"{root}\\Output\\{service_year}"
     file_name_date_component = get_date_for_file_name(LDHC_output_df)
     file_name = f"\\learning-disabilities-health-check-scheme-eng-{file_name_date_component}.csv"
-    output_path = f"{output_folder}{file_name}"
-    LDHC_output_df.to_csv(output_path, index=False)
-    return
+    return f"{output_folder}{file_name}"
 
 def get_date_for_file_name(LDHC_output_df: pd.DataFrame) -> datetime.datetime:
     """Gets the file_name date in the correct format based on the achievemnt date of LDHC
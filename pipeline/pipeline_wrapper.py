@@ -1,19 +1,65 @@
-from .data import load
-from .processing import registers, format, original_mapping, original_suppression, insert_additional_info_into_LDHC
-from .processing.DQ_checks import DQ_check_1, DQ_check_2, DQ_check_3, report_dq_check_results, remove_incomplete_pracs
+from .data import load, collection_schema
+from .processing import format, original_mapping, original_suppression, insert_additional_info_into_LDHC, single_pass_checks, measure_matrix
+from .processing.DQ_checks import report_dq_check_results, remove_incomplete_pracs
 from .output import write_DQ_checks, write_LDHC_monthly, archive
 from .processing.participation import participation_table
 from .utils.config import load_config
+from .utils.scheduler.stages import Stage, run_stages
+from .utils.instrumentation.run_report import RunReport, create_run_report, measure
+from .utils.dates import dates
+from . import incremental, streaming
+from functools import partial
 import pandas as pd
-def run(config_file: dict) -> None:
+def run(config_file: dict, archive_inputs: bool = True) -> None:
     """Acts as a wrapper function that calls the different 
         stages of the pipeline 
+
+        If "Write run report" is 'True' in the config, the wall time, CPU time, row counts
+        and memory use of every stage are written to a JSON run report in Checks\\run_reports
+        (see run_report.RunReport), also when the run fails
+
+        Inputs too large to process in memory (see streaming.use_streaming) are streamed
+        through the pipeline a partition of practices at a time instead (see streaming.run)
+
+        The inputs are hashed and compressed into the archive in the background while the
+        run goes on (see archive.store_inputs), and are archived once the output is written
     Args:
         config_file (dict): Dict containing all config file information
+        archive_inputs (bool, optional): Whether to archive the inputs once the output is
+        written. If False they are left in Input\\Current, so the month can be run again.
+        Defaults to True.
     """    
-    input_dict = data_load(config_file)
-    LDHC_output_df = processing(input_dict, config_file)
-    output(LDHC_output_df, config_file)
+    run_report = create_run_report(config_file)
+    run_id = run_report.run_id if run_report is not None else None
+    try:
+        stored_inputs = archive.store_inputs(config_file) if archive_inputs else None
+        if streaming.use_streaming(load.get_input_path(config_file, "LDHC_monthly"), config_file):
+            latest_month = streaming.run(config_file, get_processing_stages(), run_report)
+            if archive_inputs:
+                archive.archive(config_file, latest_month, stored_inputs, run_id)
+            if run_report is not None:
+                run_report.metadata["ACH_DATE"] = dates.get_achievement_date(latest_month).strftime("%Y-%m-%d")
+                print(f"Run report written to {run_report.write()}")
+            return
+        input_dict = measure(run_report, "data_load", data_load, config_file=config_file)
+        if run_report is not None:
+            run_report.metadata["ACH_DATE"] = dates.get_achievement_date(input_dict["LDHC_Monthly_df"]).strftime("%Y-%m-%d")
+        reference_data = measure(
+            run_report, "prefetch_reference_data", original_mapping.prefetch_reference_data, 
+            LDHC_input_df=input_dict["LDHC_Monthly_df"], config_file=config_file
+        )
+        LDHC_output_df = processing(input_dict, config_file, reference_data, run_report)
+        measure(
+            run_report, "output", output, 
+            LDHC_output_df=LDHC_output_df, config_file=config_file, 
+            archive_inputs=archive_inputs, stored_inputs=stored_inputs, run_id=run_id
+        )
+    except BaseException as e:
+        if run_report is not None:
+            run_report.write(status="failed", error=repr(e))
+        raise
+    if run_report is not None:
+        print(f"Run report written to {run_report.write()}")
     return
 
 def data_load(config_file: dict) -> dict:
@@ -26,22 +72,25 @@ def data_load(config_file: dict) -> dict:
     Returns:
         dict: A dictionary with keys denoting the input file type
         and their associated values being the relevant Pandas 
-        dataframe.
+        dataframe. The practice x measure matrix of the LDHC input 
+        is included under "LDHC_Monthly_matrix" and the compiled 
+        collection schema (see collection_schema) under "Collection_schema".
     """    
     LDHC_in = load.load_input_csv(config_file, "LDHC_monthly")
     Participation_in = load.load_input_csv(config_file, "Participation")
     input_dict = {
         "LDHC_Monthly_df": LDHC_in,
-        "Participation_df": Participation_in
+        "LDHC_Monthly_matrix": measure_matrix.build(LDHC_in),
+        "Participation_df": Participation_in,
+        "Collection_schema": collection_schema.load_collection_schema(config_file)
     }
     return input_dict
 
-def processing(input_dict: dict, config_file: str) -> pd.DataFrame:
-    """REGISTERS
-        The function first gets the register dfs for the age ranges 14-17 and 18 and over.
-        
-        DQ CHECKS
-        It then runs through the data quality checks and writes the results to the relevant files
+def processing(input_dict: dict, config_file: str, reference_data: dict = None, run_report: RunReport = None) -> pd.DataFrame:
+    """REGISTERS AND DQ CHECKS
+        The function first gets the register dfs for the age ranges 14-17 and 18 and over and 
+        runs through the data quality checks, all as column arithmetic on the practice x 
+        measure matrix built when the input was loaded (see single_pass_checks). The DQ results are then written to the relevant files
         The DQ check results are then printed to the terminal. The "Raise exception if DQ issues 
         found" key in the config file should be set by default to True. In this scenario, if a 
         DQ is found the process will forcably error. If you are aware of the issues and wish to
@@ -61,64 +110,159 @@ def processing(input_dict: dict, config_file: str) -> pd.DataFrame:
         A step is then included to apply all the relevant formatting to the main LDHC df
 
         MAPPING
-        The practice code is then mapped to the following information which is then joined onto
-        the table: PRACTICE_NAME	PCN_ODS_CODE	PCN_NAME	ONS_SUB_ICB_LOC_CODE	
+        The reference data used here is fetched in the background from the start of the run
+        (see original_mapping.prefetch_reference_data). The practice code is then mapped to 
+        the following information which is then joined onto the table: PRACTICE_NAME	PCN_ODS_CODE	PCN_NAME	ONS_SUB_ICB_LOC_CODE	
         SUB_ICB_LOC_CODE	SUB_ICB_LOC_NAME	ONS_ICB_CODE	ICB_CODE	ICB_NAME	
         ONS_COMM_REGION_CODE	COMM_REGION_CODE	COMM_REGION_NAME.
 
         SUPPRESSION
-        Sensitive values are replaced with a '*'
+        Sensitive values are flagged in a SUPPRESSED column, the values themselves stay numeric
+        and are only replaced with a '*' when the output is written
+
+        PARTICIPATION
+        The participation totals for the month are added to the participation totals store
 
         RETURN
         Finally the fully processed output is returnedfrom the function
 
+        SCHEDULING
+        The steps above are declared as a graph of stages (see get_processing_stages) and run
+        by the stage scheduler, which starts each stage as soon as its inputs are ready. The
+        register insertion, removal of problem practices, formatting and suppression only 
+        depend on the checks so they run while the DQ results are written and reported. The 
+        mapping and participation stages wait for the DQ report, so if it raises nothing is
+        written. Set "Run CPU-bound stages in processes" to 'True' in the config to run the
+        checks and suppression on a process pool.
+
+        INCREMENTAL PROCESSING
+        Set "Incremental processing" to 'True' in the config to only redo the registers, DQ 
+        checks, suppression and mapping for practices whose input has changed since the 
+        month was last processed (see incremental.process), e.g. after CQRS resubmissions. 
+        The output is the same as a full run's.
+
     Args:
         input_dict (dict): A dictionary with keys denoting the input file type
         and their associated values being the relevant Pandas 
         dataframe. 
         config_file (str): A dictionary containing all the information from the 
         config
+        reference_data (dict, optional): Prefetched reference data for the mapping stage, 
+        fetched during mapping if not given
+        run_report (RunReport, optional): Records every stage if given
 
     Returns:
         pd.DataFrame: The main LDHC output df with all the relevant processing steps 
         applied to it.
     """    
-    LDHC_input_df = input_dict["LDHC_Monthly_df"]
-    Participation_df = input_dict["Participation_df"]
-    register_14_17_df = registers.create_register_df(LDHC_input_df, "LDHCMI034")
-    register_18_ov_df = registers.create_register_df(LDHC_input_df, "LDHCMI035")
-    DQ_flag_1_df = DQ_check_1.get_problem_prac_ind_df(LDHC_input_df)
-    DQ_flag_2_df = DQ_check_2.get_problem_rows_df(LDHC_input_df, config_file)
-    DQ_flag_3_practice_series = DQ_check_3.get_problem_practice_series(register_14_17_df,register_18_ov_df,LDHC_input_df)
-    write_DQ_checks.write_DQ_check_results(config_file, DQ_flag_1_df, DQ_flag_2_df, DQ_flag_3_practice_series, LDHC_input_df)
-    report_dq_check_results.report(DQ_flag_1_df, DQ_flag_2_df, DQ_flag_3_practice_series, config_file)
-    LDHC_input_df = insert_additional_info_into_LDHC.insert(LDHC_input_df, register_14_17_df, register_18_ov_df)
-    LDHC_problem_pracs_removed = remove_incomplete_pracs.remove(LDHC_input_df, config_file, DQ_flag_2_df)
-    LDHC_formatted = format.apply_formatting(LDHC_problem_pracs_removed)
-    LDHC_suppressed = original_suppression.suppress_output(
-        main_table=LDHC_formatted,
-        config_file=config_file,
-        measure_dict_meas_col_name='MEASURE',
-        measure_dict_meas_type_col_name='MEASURE_TYPE',
-        measure_dict_meas_description_col_name='MEASURE_DESCRIPTION',
-        main_table_meas_col_name='MEASURE',
-        main_table_value_col_name='VALUE',
-        main_table_prac_code_col_name='PRACTICE_CODE',
-        main_table_ind_code_col_name='IND_CODE'
+    if config_file.get("Incremental processing", "False") == "True":
+        return incremental.process(input_dict, config_file, get_processing_stages(), reference_data, run_report)
+    data = {
+        **input_dict,
+        "config_file": config_file,
+        "reference_data": reference_data
+    }
+    results = run_stages(
+        get_processing_stages(),
+        data,
+        use_process_pool=config_file.get("Run CPU-bound stages in processes", "False") == "True",
+        run_report=run_report,
+        keep=["LDHC_mapped"]
     )
-    LDHC_mapped = original_mapping.mapping(LDHC_suppressed, config_file)
-    create_participation_table = participation_table.create_participation_table(Participation_df, LDHC_input_df, config_file)
-    return LDHC_mapped
+    return results["LDHC_mapped"]
+
+def get_processing_stages() -> list:
+    """Declares the processing steps (see processing) as stages with their inputs and outputs
+
+    Returns:
+        list: The processing stages
+    """    
+    return [
+        Stage(
+            "checks",
+            single_pass_checks.run,
+            inputs={"LDHC_matrix": "LDHC_Monthly_matrix", "config_file": "config_file", "collection_schema": "Collection_schema"},
+            outputs=["register_14_17_df", "register_18_ov_df", "DQ_flag_1_df", "DQ_flag_2_df", "DQ_flag_3_practice_series"],
+            kind="cpu"
+        ),
+        Stage(
+            "write_DQ_checks",
+            write_DQ_checks.write_DQ_check_results,
+            inputs={
+                "config": "config_file", "DQ_flag_1_df": "DQ_flag_1_df", "DQ_flag_2_df": "DQ_flag_2_df", 
+                "DQ_flag_3_practice_series": "DQ_flag_3_practice_series", "LDHC_input_df": "LDHC_Monthly_df"
+            },
+            outputs=["DQ_results"]
+        ),
+        Stage(
+            "report",
+            report_dq_check_results.report,
+            inputs={"DQ_results": "DQ_results", "config_file": "config_file"}
+        ),
+        Stage(
+            "insert_registers",
+            insert_additional_info_into_LDHC.insert,
+            inputs={"LDHC_input_df": "LDHC_Monthly_df", "register_14_17_df": "register_14_17_df", "register_18_ov_df": "register_18_ov_df"},
+            outputs=["LDHC_with_registers"]
+        ),
+        Stage(
+            "remove_incomplete_pracs",
+            remove_incomplete_pracs.remove,
+            inputs={"LDHC_input_df": "LDHC_with_registers", "config_file": "config_file", "DQ_flag_2_df": "DQ_flag_2_df"},
+            outputs=["LDHC_problem_pracs_removed"]
+        ),
+        Stage(
+            "format",
+            format.apply_formatting,
+            inputs={"LDHC_df": "LDHC_problem_pracs_removed"},
+            outputs=["LDHC_formatted"]
+        ),
+        Stage(
+            "suppression",
+            partial(
+                original_suppression.suppress_output,
+                measure_dict_meas_col_name='MEASURE',
+                measure_dict_meas_type_col_name='MEASURE_TYPE',
+                measure_dict_meas_description_col_name='MEASURE_DESCRIPTION',
+                main_table_meas_col_name='MEASURE',
+                main_table_value_col_name='VALUE',
+                main_table_prac_code_col_name='PRACTICE_CODE',
+                main_table_ind_code_col_name='IND_CODE'
+            ),
+            inputs={"main_table": "LDHC_formatted", "config_file": "config_file", "collection_schema": "Collection_schema"},
+            outputs=["LDHC_suppressed"],
+            kind="cpu"
+        ),
+        Stage(
+            "mapping",
+            original_mapping.mapping,
+            inputs={"dataFrame": "LDHC_suppressed", "config_file": "config_file", "reference_data": "reference_data"},
+            outputs=["LDHC_mapped"],
+            after=["report"]
+        ),
+        Stage(
+            "participation",
+            participation_table.create_participation_table,
+            inputs={"Participation_df": "Participation_df", "LDHC_input_df": "LDHC_with_registers", "config_file": "config_file"},
+            outputs=["participation_totals"],
+            after=["report"]
+        )
+    ]
+
 
    
     
-def output(LDHC_output_df: pd.DataFrame, config_file: dict):
+def output(LDHC_output_df: pd.DataFrame, config_file: dict, archive_inputs: bool = True, stored_inputs: dict = None, run_id: str = None):
     """Writes main LDHC file and performs necessary archiving
 
     Args:
         LDHC_output_df (pd.DataFrame): The LDHC main dataframe in the correct format fot outputting
         config_file (dict): A dictionary with all the config information in it
+        archive_inputs (bool, optional): Whether to archive the inputs. Defaults to True.
+        stored_inputs (dict, optional): The inputs being stored in the archive (see archive.store_inputs)
+        run_id (str, optional): Id of the run, recorded in the archive manifest
     """    
     write_LDHC_monthly.write_LDHC(LDHC_output_df, config_file)
-    archive.archive(config_file, LDHC_output_df)
+    if archive_inputs:
+        archive.archive(config_file, LDHC_output_df, stored_inputs, run_id)
     return
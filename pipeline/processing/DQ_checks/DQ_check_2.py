@@ -1,6 +1,8 @@
 import pandas as pd
 from ...data import load 
 
+ROW_KEY_COLS = ["ORG_CODE", "IND_CODE", "FIELD_NAME"]
+
 def get_problem_rows_df(LDHC_input_df: pd.DataFrame, config_file: dict) -> pd.DataFrame:
     """Returns 1 dataframe highlighting which rows violate the 2 information issues
     covered by DQ check 2. Where the individual issues are defined as:
@@ -18,50 +20,61 @@ def get_problem_rows_df(LDHC_input_df: pd.DataFrame, config_file: dict) -> pd.Da
         config_file (dict): A dictionary containing all config information
 
     Returns:
-        pd.DataFrame: A dataframe with a column highlighting whether a row is violating 
-        one of the above issues
+        pd.DataFrame: A dataframe containing only the rows violating one of the above issues,
+        with a column highlighting which issue each row violates
     """    
     ind_meas_map_df = load.load_indicator_to_measure_map(config_file)
-    DQ2_df = pd.concat([
-        isolate_problem_rows_for_prac(LDHC_input_df, ind_meas_map_df, practice) for practice in set(LDHC_input_df.ORG_CODE)
-    ])
+    expected_rows_df = build_expected_rows_df(LDHC_input_df, ind_meas_map_df)
+    DQ2_df = isolate_problem_rows(LDHC_input_df, expected_rows_df)
     return DQ2_df
 
-def isolate_problem_rows_for_prac(LDHC_input_df: pd.DataFrame, ind_meas_map_df: pd.DataFrame, practice: str) -> pd.DataFrame:
+def build_expected_rows_df(LDHC_input_df: pd.DataFrame, ind_meas_map_df: pd.DataFrame) -> pd.DataFrame:
+    """Builds the grid of every practice/indicator/measure combination that should be present
+    in the input, i.e. each submitting practice crossed with every row of the indicator to
+    measure map.
+
+    Args:
+        LDHC_input_df (pd.DataFrame): Main LDHC input
+        ind_meas_map_df (pd.DataFrame): A dictionary that maps each indicator to the measures that 
+        make it up
+
+    Returns:
+        pd.DataFrame: A dataframe with one row per expected ORG_CODE/IND_CODE/FIELD_NAME combination
+    """    
+    practices_df = pd.DataFrame({"ORG_CODE": LDHC_input_df["ORG_CODE"].unique()})
+    ind_meas_pairs_df = ind_meas_map_df[["IND_CODE", "FIELD_NAME"]].drop_duplicates()
+    return practices_df.merge(ind_meas_pairs_df, how="cross")
+
+def isolate_problem_rows(LDHC_input_df: pd.DataFrame, expected_rows_df: pd.DataFrame) -> pd.DataFrame:
     """
-    filters LDHC_input_df to only contain rows pertaining to the practice
-    |
-    merges in the info from the measure dicitonary
-    |
-    queries the new df to only find rows that violate the chosen
-    DQ2 rule
+    reduces LDHC_input_df to its distinct practice/indicator/measure rows
     |
-    Selects the columns we want returned
+    outer merges these against the expected rows in one pass
     |
-    Takes a deep copy to avoid 'setting on copy' pandas warnings
+    keeps only the rows found on one side of the merge i.e. the
+    rows that violate one of the DQ2 rules
     |
-    Inserts in practice information to the df before returning 
+    Formats the merge column before returning
 
     Args:
         LDHC_input_df (pd.DataFrame): Main LDHC input
-        ind_meas_map_df (pd.DataFrame): A dictionary that maps each indicator to the measures that 
-        make it up
-        practice (str): A string of the practice code
+        expected_rows_df (pd.DataFrame): Every practice/indicator/measure combination that should
+        be in the input (see build_expected_rows_df)
 
     Returns:
-        pd.DataFrame: A dataframe for the practice with a column highlighting whether a row is violating 
-        one of the 2 DQ2 issues.
+        pd.DataFrame: A dataframe of the rows violating one of the 2 DQ2 issues with a column 
+        highlighting which issue is being violated.
     """
-    practice_problem_rows_df = (
-        LDHC_input_df
-        .query("ORG_CODE == @practice")
-        .merge(ind_meas_map_df, how="outer", on=["FIELD_NAME", "IND_CODE"], indicator=True)
-        .loc[:, ["ORG_CODE", "IND_CODE", "FIELD_NAME", "_merge"]]
-        .copy(deep=True)
+    problem_rows_df = (
+        LDHC_input_df[ROW_KEY_COLS]
+        .drop_duplicates()
+        .merge(expected_rows_df, how="outer", on=ROW_KEY_COLS, indicator=True)
+        .query("_merge != 'both'")
+        .sort_values(ROW_KEY_COLS)
+        .reset_index(drop=True)
     )
-    practice_problem_rows_df = format_merge_col(practice_problem_rows_df)
-    practice_problem_rows_df["ORG_CODE"] = practice
-    return practice_problem_rows_df
+    problem_rows_df = format_merge_col(problem_rows_df)
+    return problem_rows_df
 
 def format_merge_col(practice_problem_rows_df: pd.DataFrame) -> pd.DataFrame:
     """renames the merge column and replaces the string indicators so
@@ -76,6 +89,7 @@ def format_merge_col(practice_problem_rows_df: pd.DataFrame) -> pd.DataFrame:
     practice_problem_rows_df.rename(columns={"_merge": "Type_of_information_issue"}, inplace=True)
     practice_problem_rows_df["Type_of_information_issue"] = (
         practice_problem_rows_df["Type_of_information_issue"]
+        .astype(str)
         .map({"right_only": "missing", "left_only": "additional"})
     )
     return practice_problem_rows_df
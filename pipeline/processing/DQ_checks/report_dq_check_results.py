@@ -1,7 +1,9 @@
 import pandas as pd
 import warnings
 from typing import Union, List
-def report(DQ_flag_1_df: pd.DataFrame, DQ_flag_2_df: pd.DataFrame, DQ_flag_3_practice_series: pd.Series, config_file: dict):
+from pipeline.output import dq_history
+
+def report(DQ_results: dict, config_file: dict):
     """Assesses whether any of the DQ results have been violated. If they have, the relevant 
     DQ check is printed and a warning is issued. Alternatively if a DQ check has passed, a 
     message is printed indicating no issues have been found for the given DQ check.
@@ -18,11 +20,8 @@ def report(DQ_flag_1_df: pd.DataFrame, DQ_flag_2_df: pd.DataFrame, DQ_flag_3_pra
 
 
     Args:
-        DQ_flag_1_df (pd.DataFrame): Dataframe of practice codes and associated indicator 
-        codes that violate DQ check 1.
-        DQ_flag_2_df (pd.DataFrame): A dataframe containing the practice/indicator/measure 
-        combinations that aren't represented in the input LDHC main df for the given practice
-        DQ_flag_3_practice_series (pd.Series): A Series contianing only practices that violate the DQ 3 rule
+        DQ_results (dict): The DQ results in the form they are held in the DQ history, with a 
+        "No issues found" row for each check that passed (see write_DQ_checks.get_DQ_results)
         config_file (dict): A dictionary containing all the information from the config file
 
     Raises:
@@ -31,21 +30,22 @@ def report(DQ_flag_1_df: pd.DataFrame, DQ_flag_2_df: pd.DataFrame, DQ_flag_3_pra
     """    
     failure_flag = config_file["Raise exception if DQ issues found"]
     failures = []
+    details = (
+        f"check the DQ history store ({dq_history.get_DQ_history_path(config_file)}) for more details, "
+        "'python -m main export-dq' writes it out as the DQ check results workbook"
+    )
 
-    DQ2_missing_information = DQ_flag_2_df.query("Type_of_information_issue == 'missing'")
-    DQ2_additional_information = DQ_flag_2_df.query("Type_of_information_issue == 'additional'")
-
-    print_DQ_results(DQ_flag_1_df, "DQ_1", failures)
-    print_DQ_results(DQ2_missing_information, "DQ2_missing_information", failures)
-    print_DQ_results(DQ2_additional_information, "DQ2_additional_information", failures)
-    print_DQ_results(DQ_flag_3_practice_series, "DQ_3", failures)
+    print_DQ_results(DQ_results["DQ_1"], "DQ_1", failures)
+    print_DQ_results(DQ_results["DQ_2_missing_info"], "DQ2_missing_information", failures)
+    print_DQ_results(DQ_results["DQ_2_additional_info"], "DQ2_additional_information", failures)
+    print_DQ_results(DQ_results["DQ_3"], "DQ_3", failures)
     
     if (len(failures) > 0) & (failure_flag == "True"):
-        raise Exception(f"""The following DQ checks failed: {failures} check the DQ history file for more details.
+        raise Exception(f"""The following DQ checks failed: {failures} {details}.
         if you are aware of these issues and want to re-run the package without this exception being raised set
         the 'Raise exception if DQ issues found' variable in config to False""")
     elif (len(failures) > 0) & (failure_flag == "False"):
-        warnings.warn(f"The following DQ checks failed {failures} check the DQ history file for more details")
+        warnings.warn(f"The following DQ checks failed {failures} {details}")
     else:
         print("All DQ checks passed")
     return 
@@ -60,8 +60,8 @@ def print_DQ_results(DQ_flag_data: Union[pd.Series, pd.DataFrame], DQ_check_indi
     the holder list 'failures'.
 
     Args:
-        DQ_flag_data (Union[pd.Series, pd.DataFrame]): A pandas object holding the relevant DQ flag data. Can only be
-        from the set {DQ_flag_1_df, DQ_flag_2_df, DQ_flag_3_practice_series}.
+        DQ_flag_data (Union[pd.Series, pd.DataFrame]): A pandas object holding the relevant DQ flag data, one of the 
+        DQ results (see write_DQ_checks.get_DQ_results).
         DQ_check_indicator (str): A string indicating the relevant DQ check name. Can only come from the set {'DQ1', 'DQ2', 'DQ3'}
         failures (list): A holder list that has the relevant DQ_check_indicator appended to it if a failure is found 
 
@@ -73,12 +73,12 @@ def print_DQ_results(DQ_flag_data: Union[pd.Series, pd.DataFrame], DQ_check_indi
         if "No issues found" in list(DQ_flag_data):
             print("   No Issues")
         else:
-            print("   Issues found check DQ history file")
+            print("   Issues found check the DQ history store")
             failures.append(f"{DQ_check_indicator}")
     elif isinstance(DQ_flag_data, pd.DataFrame):
         if "No issues found" in list(DQ_flag_data.ORG_CODE):
             print("   No Issues")
         else:
-            print("   Issues found check DQ history file")
+            print("   Issues found check the DQ history store")
             failures.append(f"{DQ_check_indicator}")
     return failures
\ No newline at end of file
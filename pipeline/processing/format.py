@@ -2,18 +2,33 @@ import pandas as pd
 
 def apply_formatting(LDHC_df: pd.DataFrame) -> pd.DataFrame:
     """Applies the following formatting steps to the input df:
-    
+
     1. Drop approved column
     2. Renames Practice code and Measure column
     3. Replcaces the 'Number (Scaled)' string in the measure column with 'Count'
 
+    The formatted df is assembled from the input's columns and only the measure column is
+    rebuilt. From pandas 2 the other columns are shared with the input rather than copied.
+    Earlier versions of pandas combine the columns of each type into one block when a df is
+    built, which copies their values (for text columns the references to the strings, not 
+    the strings themselves).
+
     Args:
         LDHC_df (pd.DataFrame): The main LDHC dataframe
 
     Returns:
         pd.DataFrame: The fully formatted LDHC dataframe
-    """    
-    LDHC_approve_col_rem = LDHC_df.drop("APPROVED", axis=1)
-    LDHC_renamed = LDHC_approve_col_rem.rename(columns={"ORG_CODE": "PRACTICE_CODE", "FIELD_NAME": "MEASURE"})
-    LDHC_renamed["MEASURE"] = LDHC_renamed["MEASURE"].replace("Number (Scaled)", "Count")
-    return LDHC_renamed
\ No newline at end of file
+    """
+    renamed_cols = {"ORG_CODE": "PRACTICE_CODE", "FIELD_NAME": "MEASURE"}
+    formatted_cols = {
+        renamed_cols.get(col_name, col_name): col for col_name, col in LDHC_df.items() if col_name != "APPROVED"
+    }
+    formatted_cols["MEASURE"] = replace_value(formatted_cols["MEASURE"], "Number (Scaled)", "Count")
+    return pd.DataFrame(formatted_cols, index=LDHC_df.index, copy=False)
+
+def replace_value(col: pd.Series, value, new_value) -> pd.Series:
+    """Replaces a value in a column. A categorical column stays categorical, with the new
+    value added to its categories if needed."""
+    if isinstance(col.dtype, pd.CategoricalDtype) and new_value not in col.cat.categories:
+        col = col.cat.add_categories([new_value])
+    return col.mask(col == value, new_value)
@@ -1,17 +1,34 @@
 import pandas as pd
 
 def insert(LDHC_input_df: pd.DataFrame, register_14_17_df: pd.DataFrame, register_18_ov_df: pd.DataFrame) -> pd.DataFrame:
-    """Inserts practice's register information for the age brackets 14-17 and 18 and over 
+    """Inserts practice's register information for the age brackets 14-17 and 18 and over
     into the main LDHC dataframe
 
+    The register rows are appended in the main df's column types. Where a column of the main
+    df is categorical (typed loading, see load.read_input_file) the register values are added
+    to its categories, so appending them only copies the category codes rather than turning
+    the whole column into strings. The input's columns are shared rather than copied before
+    they are appended (from pandas 2, see format.apply_formatting).
+
     Args:
         LDHC_input_df (pd.DataFrame): The main LDHC dataframe
-        register_14_17_df (pd.DataFrame): A datframe containing information for each practice's 
+        register_14_17_df (pd.DataFrame): A datframe containing information for each practice's
         register of patients aged between 14 and 17.
-        register_18_ov_df (pd.DataFrame): A datframe containing information for each practice's 
+        register_18_ov_df (pd.DataFrame): A datframe containing information for each practice's
         register of patients aged 18 and over.
 
     Returns:
         pd.DataFrame: The main LDHC datframe with register information inserted
-    """    
-    return pd.concat([LDHC_input_df, register_14_17_df, register_18_ov_df]).reset_index(drop=True)
\ No newline at end of file
+    """
+    register_df = pd.concat([register_14_17_df, register_18_ov_df], ignore_index=True)
+    columns = LDHC_input_df.columns.append(register_df.columns.difference(LDHC_input_df.columns, sort=False))
+    register_df = register_df.reindex(columns=columns)
+    input_columns = {}
+    for col_name, col in LDHC_input_df.items():
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            register_values = register_df[col_name].dropna().unique()
+            col = col.cat.add_categories(pd.Index(register_values).difference(col.cat.categories, sort=False))
+            register_df[col_name] = pd.Categorical(register_df[col_name], dtype=col.dtype)
+        input_columns[col_name] = col
+    LDHC_input_df = pd.DataFrame(input_columns, index=LDHC_input_df.index, copy=False)
+    return pd.concat([LDHC_input_df, register_df], ignore_index=True)
@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+from typing import NamedTuple
+
+KEY_COLS = ["ORG_CODE", "IND_CODE", "FIELD_NAME"]
+
+class MeasureMatrix(NamedTuple):
+    """Compact practice x measure representation of the long LDHC table.
+
+    Attributes:
+        practices (pd.Index): The practice code of each row, in order of first appearance
+        columns (pd.MultiIndex): The (IND_CODE, FIELD_NAME) pair of each column, in order of 
+        first appearance
+        values (np.ndarray): int64 matrix of the summed VALUE of each practice/column cell, 0 
+        where the cell was not submitted. Blank values are skipped, as a groupby sum would.
+        present (np.ndarray): Boolean matrix, True where the practice submitted the cell
+        valid (np.ndarray): Boolean matrix, True where the practice submitted the cell with at
+        least one value that isn't blank. Comparisons of a cell that only holds blanks are 
+        false, as they are for NaN.
+        attributes (dict): Maps every other input column to either its single value (if it is 
+        the same on every row) or to a tuple of (code matrix, categories)
+        column_order (list): The column order of the long table the matrix was built from
+        first_row (pd.DataFrame): The first row of the long table, used for row level constants
+        such as QUALITY_SERVICE and ACH_DATE
+    """
+    practices: pd.Index
+    columns: pd.MultiIndex
+    values: np.ndarray
+    present: np.ndarray
+    valid: np.ndarray
+    attributes: dict
+    column_order: list
+    first_row: pd.DataFrame
+
+    def column(self, ind_code: str, field_name: str) -> np.ndarray:
+        """Returns the values of one (IND_CODE, FIELD_NAME) column, 0 where the column or cell is missing"""
+        if (ind_code, field_name) not in self.columns:
+            return np.zeros(len(self.practices), dtype="int64")
+        return self.values[:, self.columns.get_loc((ind_code, field_name))]
+
+    def column_present(self, ind_code: str, field_name: str) -> np.ndarray:
+        """Returns the presence mask of one (IND_CODE, FIELD_NAME) column"""
+        if (ind_code, field_name) not in self.columns:
+            return np.zeros(len(self.practices), dtype=bool)
+        return self.present[:, self.columns.get_loc((ind_code, field_name))]
+
+    def column_valid(self, ind_code: str, field_name: str) -> np.ndarray:
+        """Returns the mask of the cells of one (IND_CODE, FIELD_NAME) column holding a value"""
+        if (ind_code, field_name) not in self.columns:
+            return np.zeros(len(self.practices), dtype=bool)
+        return self.valid[:, self.columns.get_loc((ind_code, field_name))]
+
+def build(LDHC_input_df: pd.DataFrame) -> MeasureMatrix:
+    """Builds the practice x measure matrix from the long LDHC table in one pass
+
+    Args:
+        LDHC_input_df (pd.DataFrame): The main LDHC input dataframe
+
+    Returns:
+        MeasureMatrix: The matrix form of the input
+    """    
+    row_codes, practices = pd.factorize(LDHC_input_df["ORG_CODE"])
+    ind_codes, ind_uniques = pd.factorize(LDHC_input_df["IND_CODE"])
+    field_codes, field_uniques = pd.factorize(LDHC_input_df["FIELD_NAME"])
+    col_codes, pair_codes = pd.factorize(ind_codes * len(field_uniques) + field_codes)
+    columns = pd.MultiIndex.from_arrays(
+        [np.asarray(ind_uniques).take(pair_codes // len(field_uniques)),
+         np.asarray(field_uniques).take(pair_codes % len(field_uniques))],
+        names=["IND_CODE", "FIELD_NAME"]
+    )
+    shape = (len(practices), len(columns))
+    flat_codes = row_codes * shape[1] + col_codes
+    input_values = LDHC_input_df["VALUE"].to_numpy(dtype="float64", na_value=np.nan)
+    has_value = ~np.isnan(input_values)
+    values = np.bincount(
+        flat_codes, weights=np.where(has_value, input_values, 0), minlength=shape[0] * shape[1]
+    ).round().astype("int64").reshape(shape)
+    present = (np.bincount(flat_codes, minlength=shape[0] * shape[1]) > 0).reshape(shape)
+    valid = (np.bincount(flat_codes[has_value], minlength=shape[0] * shape[1]) > 0).reshape(shape)
+    attributes = {}
+    for col in LDHC_input_df.columns.difference(KEY_COLS + ["VALUE"], sort=False):
+        attribute_codes, categories = pd.factorize(LDHC_input_df[col])
+        if len(categories) <= 1:
+            attributes[col] = categories[0] if len(categories) else None
+        else:
+            code_matrix = np.full(shape, -1, dtype="int32")
+            code_matrix.flat[flat_codes] = attribute_codes
+            attributes[col] = (code_matrix, categories)
+    return MeasureMatrix(
+        practices=pd.Index(practices, name="ORG_CODE"),
+        columns=columns,
+        values=values,
+        present=present,
+        valid=valid,
+        attributes=attributes,
+        column_order=list(LDHC_input_df.columns),
+        first_row=LDHC_input_df.head(1).reset_index(drop=True)
+    )
+
+def to_long(matrix: MeasureMatrix) -> pd.DataFrame:
+    """Converts the matrix back to the long LDHC format with one row per submitted cell, 
+    ordered by practice and then by column. Cells that only hold blanks are given a blank value.
+
+    Args:
+        matrix (MeasureMatrix): The practice x measure matrix
+
+    Returns:
+        pd.DataFrame: The long LDHC table with the same columns as the table the matrix was 
+        built from
+    """    
+    row_codes, col_codes = np.nonzero(matrix.present)
+    long_values = matrix.values[row_codes, col_codes]
+    blank_values = ~matrix.valid[row_codes, col_codes]
+    if blank_values.any():
+        long_values = np.where(blank_values, np.nan, long_values)
+    long_cols = {
+        "ORG_CODE": matrix.practices.take(row_codes),
+        "IND_CODE": matrix.columns.get_level_values("IND_CODE").take(col_codes),
+        "FIELD_NAME": matrix.columns.get_level_values("FIELD_NAME").take(col_codes),
+        "VALUE": long_values
+    }
+    for col, attribute in matrix.attributes.items():
+        if isinstance(attribute, tuple):
+            code_matrix, categories = attribute
+            long_cols[col] = categories.take(code_matrix[row_codes, col_codes])
+        else:
+            long_cols[col] = [attribute] * len(row_codes)
+    long_df = pd.DataFrame({col: np.asarray(values) for col, values in long_cols.items()})
+    return long_df[matrix.column_order]
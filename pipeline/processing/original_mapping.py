@@ -1,221 +1,174 @@
+import numpy as np
 import pandas as pd
-from datetime import timedelta, date, datetime
-import pyodbc 
-import sqlalchemy as db
-def mapping(dataFrame, config_file):
-    """
-    TO BE REPLACED AND UPDATED
-    """    
-    
-    ## Set up (new to package) #######################################################################
-    use_corporate_reference = False
-    manual_reference_file = config_file["Path to manual reference file"]
-    
-    headings = [
+import hashlib
+import warnings
+from datetime import datetime
+from ..data import reference
+from ..utils.dates import dates
+
+USE_CORPORATE_REFERENCE = False
+
+HEADINGS = [
     'QUALITY_SERVICE', 'PRACTICE_CODE', 'PRACTICE_NAME', 
     'PCN_ODS_CODE', 'PCN_NAME', 
     'ONS_SUB_ICB_LOC_CODE', 'SUB_ICB_LOC_CODE', 'SUB_ICB_LOC_NAME', 
     'ONS_ICB_CODE', 'ICB_CODE','ICB_NAME',
     'ONS_COMM_REGION_CODE','COMM_REGION_CODE','COMM_REGION_NAME', 
     'ACH_DATE', 'IND_CODE', 'MEASURE', 'VALUE'
-    ]
-
-    ach_date = datetime.strptime(str(dataFrame.ACH_DATE[0]), "%Y%m%d").strftime("%Y-%m-%d")
-
-    SQL_connection_list = config_file["SQL connection string"]
-    ##################################################################################################
-    ## connect to SQL server
-    def connect(SQL_connection_list):
-        try:
-            driver = SQL_connection_list[0]
-            server = SQL_connection_list[1]
-            database = SQL_connection_list[2]
-            trusted_connection = SQL_connection_list[3]
-            conn = db.create_engine(f"mssql+pyodbc://{server}/{database}?driver={driver}?Trusted_Connection={trusted_connection}")
-        except:
-            raise Exception("Database Connection unsuccessful")
-            conn = None
-        return conn  
-
-    conn = connect(SQL_connection_list)
-
-
-    ## This function needs you to define an ach_date
-        ## this has been done earlier in the code here but any ach_date will work providing it is YYYY-MM-DD format
-
-    ## A connection string is also included in the function but may be uneccesary if a connection to DSS_PROD is defined
-
-    ## The function returns a file including practices, and PCN names and codes
-        ## easiest way to add to your practice mapping table is with a left join onto your chosen table    
-    def create_pcn_mappings(ach_date):
-        pcn_string = f"""
-        select DISTINCT o.Name AS PRACTICE_NAME,
-        o.organisationID AS PRACTICE_CODE,
-        re.StartDate AS RELATIONSHIP_START_DATE,
-        re.EndDate AS RELATIONSHIP_END_DATE,
-        target.name AS PCN_NAME,
-        target.organisationID AS PCN_ODS_CODE,
-        o.SysStartTime as API_SYSTEM_UPDATE_DATE
-        from [dbo].[ODSAPIOrganisationDetails] o, 
-        [dbo].[ODSAPIRoleDetails] r,
-        [dbo].[ODSAPICodeSystemDetails] rolename,
-        [dbo].[ODSAPIRelationshipDetails] re,
-        [dbo].[ODSAPICodeSystemDetails] relname, 
-        [dbo].[ODSAPIOrganisationDetails] target, 
-        [dbo].[ODSAPIRoleDetails] targetrole, 
-        [dbo].[ODSAPICodeSystemDetails] targetrolecode
-        where o.datetype ='Operational'
-        AND target.datetype = 'Operational'
-        AND r.datetype = 'Operational'
-        AND targetRole.dateType = 'Operational'
-        AND (rolename.displayname = 'GP PRACTICE' OR rolename.displayname = 'PRESCRIBING COST CENTRE')
-        AND o.organisationID = r.organisationID
-        AND r.roleID = rolename.ID
-        AND targetrole.roleID = 'RO272' and targetrole.primaryRole=1 
-        AND re.organisationID = o.organisationID
-        AND re.relationshipID = relname.ID
-        AND re.targetOrganisationID = target.organisationID
-        AND relname.displayname = 'IS PARTNER TO' 
-        AND target.organisationID = targetrole.organisationID
-        AND targetrole.roleID = targetrolecode.ID
-        AND NOT (o.organisationID = 'E85069' AND re.StartDate = '2021-11-01')
-        AND re.StartDate <= ?
-        AND (re.EndDate >= ?
-        OR re.EndDate IS NULL)
-        order by o.name, target.name
-        """
-
-
-        ## Create table and select the 4 relevant columns
-        pcn_map = pd.read_sql(pcn_string, conn, params = (ach_date,)*2)
-        pcn_map = pcn_map[['PRACTICE_NAME','PRACTICE_CODE','PCN_NAME','PCN_ODS_CODE']]
-
-        return pcn_map
-
-
-    def corporate_reference_mapping():
-        mapping_max_query = """SELECT DISTINCT a.DATE_OF_OPERATION, a.DH_GEOGRAPHY_CODE, a.DH_GEOGRAPHY_NAME, a.GEOGRAPHY_CODE
-        FROM [dbo].[ONS_CHD_GEO_EQUIVALENTS] as a
-        INNER JOIN (SELECT DH_GEOGRAPHY_CODE, MAX(DATE_OF_OPERATION) AS DATE_OF_OPERATION FROM [dbo].[ONS_CHD_GEO_EQUIVALENTS] WHERE DATE_OF_OPERATION <= ? GROUP BY DH_GEOGRAPHY_CODE) as b
-        ON a.DATE_OF_OPERATION = b.DATE_OF_OPERATION
-        AND a.DH_GEOGRAPHY_CODE = b.DH_GEOGRAPHY_CODE"""
-        mapping_max = pd.read_sql_query(mapping_max_query, conn, params=(ach_date,))
-        return mapping_max
-
-
-    def manual_file_mapping():
-        df = pd.read_csv(manual_reference_file)
-        df = df.rename(columns={'NAME':'DH_GEOGRAPHY_NAME', 'ONS_CODE':'GEOGRAPHY_CODE', 'ODS_CODE':'DH_GEOGRAPHY_CODE'})
-        df = df.drop(columns=['GEOGRAPHY'])
-        df['DATE_OF_OPERATION'] = ach_date
-        return df
-    
-    
-    practice_mapping_query = """SELECT a.[CODE] AS PRACTICE_CODE
-                                         , a.[NAME] AS PRACTICE_NAME
-                                         , a.POSTCODE
-                                         , a.[COMMISSIONER_ORGANISATION_CODE] AS SUB_ICB_LOC_CODE
-                                         , a.[HIGH_LEVEL_HEALTH_GEOGRAPHY] AS ICB_CODE
-                                         , a.[NATIONAL_GROUPING] AS COMM_REGION_CODE
-                                    FROM [dbo].[ODS_PRACTICE_V02] as a
-                                    WHERE a.OPEN_DATE <= ?
-                                    AND (a.CLOSE_DATE IS NULL OR a.CLOSE_DATE >= ?)
-                                    AND a.DSS_RECORD_START_DATE <= ?
-                                    AND (a.DSS_RECORD_END_DATE IS NULL OR a.DSS_RECORD_END_DATE >= ?)
-                                    ORDER BY a.CODE"""
-
-    #AND a.CODE IN (SELECT DISTINCT PRACTICE_CODE FROM [DSS_CORPORATE].[dbo].[GP_PATIENT_LIST] WHERE EXTRACT_DATE = ?)
-    practice_mapping = pd.read_sql_query(practice_mapping_query, conn, params=(ach_date,)*4)
-
-    
-    if use_corporate_reference:
-        mapping_max = corporate_reference_mapping()
+]
+
+# Suppression mask (see original_suppression.suppress_output), carried after the HEADINGS
+# when the table has one. The output writers turn it into '*'s and leave it out.
+SUPPRESSED_HEADING = 'SUPPRESSED'
+
+# Each geography level of the practice hierarchy: (ODS code column, ONS code column, name column)
+GEOGRAPHY_LEVELS = [
+    ("SUB_ICB_LOC_CODE", "ONS_SUB_ICB_LOC_CODE", "SUB_ICB_LOC_NAME"),
+    ("ICB_CODE", "ONS_ICB_CODE", "ICB_NAME"),
+    ("COMM_REGION_CODE", "ONS_COMM_REGION_CODE", "COMM_REGION_NAME")
+]
+
+HIERARCHY_COLS = [
+    "PRACTICE_CODE", "PRACTICE_NAME", "PCN_ODS_CODE", "PCN_NAME",
+    "ONS_SUB_ICB_LOC_CODE", "SUB_ICB_LOC_CODE", "SUB_ICB_LOC_NAME",
+    "ONS_ICB_CODE", "ICB_CODE", "ICB_NAME",
+    "ONS_COMM_REGION_CODE", "COMM_REGION_CODE", "COMM_REGION_NAME"
+]
+
+def get_reference_query_names():
+    """
+    Reference data queries (see data.reference) used by the mapping
+    """
+    query_names = ["practice_mapping", "pcn_mapping"]
+    if USE_CORPORATE_REFERENCE:
+        query_names.append("geography_mapping")
+    return query_names
+
+def prefetch_reference_data(LDHC_input_df, config_file):
+    """
+    Starts fetching the reference data used by the mapping as soon as the input is loaded.
+    The queries only depend on the achievement date so they can run while the registers,
+    DQ checks and suppression are processed. Pass the result to mapping as 'reference_data'.
+    """
+    ach_date = dates.get_achievement_date(LDHC_input_df).strftime("%Y-%m-%d")
+    practice_codes = get_practice_filter(LDHC_input_df["ORG_CODE"], config_file)
+    return reference.prefetch_reference_data(get_reference_query_names(), ach_date, config_file, practice_codes)
+
+def get_practice_filter(practice_code_col, config_file):
+    """
+    Practices the reference queries are restricted to when "Filter reference queries to
+    practices" is 'True' in the config, otherwise None (every practice is fetched)
+    """
+    if config_file.get("Filter reference queries to practices", "False") != "True":
+        return None
+    return sorted(str(practice_code) for practice_code in practice_code_col.unique())
+
+def mapping(dataFrame, config_file, reference_data=None, practice_hierarchy=None):
+    """
+    Maps each practice to its practice name, PCN and sub-ICB/ICB/commissioning region codes,
+    ONS codes and names, and returns the table with the output HEADINGS.
+
+    The mapping comes from the practice hierarchy for the achievement date (see 
+    get_practice_hierarchy), which has exactly one row per practice, so it is applied as a
+    lookup that can't duplicate rows. The output is put together a column at a time in the
+    order the join of the practice hierarchy and the table would give (practices in hierarchy
+    order, each practice's rows in table order, practices without a hierarchy entry left out),
+    which is the only time the table is copied from pandas 2. Earlier versions of pandas copy
+    the columns again when they combine the columns of each type into one block. Categorical 
+    columns are written out as their values. The suppression mask is kept after the HEADINGS
+    if the table has one.
+
+    reference_data can hold the prefetched reference tables (see prefetch_reference_data),
+    any that are missing are fetched when needed. A practice hierarchy that has already been
+    built can be passed as practice_hierarchy instead.
+    """    
+    if practice_hierarchy is None:
+        ach_date = datetime.strptime(str(dataFrame.ACH_DATE.iloc[0]), "%Y%m%d").strftime("%Y-%m-%d")
+        practice_codes = get_practice_filter(dataFrame.PRACTICE_CODE, config_file)
+        practice_hierarchy = get_practice_hierarchy(ach_date, config_file, reference_data, practice_codes)
+    practice_positions = pd.Index(practice_hierarchy['PRACTICE_CODE']).get_indexer(dataFrame['PRACTICE_CODE'])
+    row_order = np.argsort(practice_positions, kind='stable')
+    row_order = row_order[practice_positions[row_order] >= 0]
+    headings = HEADINGS + [SUPPRESSED_HEADING] if SUPPRESSED_HEADING in dataFrame.columns else HEADINGS
+    mapped_cols = {}
+    for heading in headings:
+        if heading in practice_hierarchy.columns:
+            col = practice_hierarchy[heading].take(practice_positions[row_order])
+        else:
+            col = dataFrame[heading].take(row_order)
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            mapped_cols[heading] = col.cat.categories.array.take(col.cat.codes.to_numpy(), allow_fill=True)
+        else:
+            mapped_cols[heading] = col.array
+    return pd.DataFrame(mapped_cols, copy=False)
+
+def get_practice_hierarchy(ach_date, config_file, reference_data=None, practice_codes=None):
+    """
+    Gets the practice -> PCN -> sub-ICB -> ICB -> commissioning region table for the 
+    achievement date. With the 'snapshot' or 'offline' reference data backends the table is 
+    persisted in the reference snapshot so that it is only built once per achievement date 
+    (and set of practices / manual reference file).
+    """
+    manual_reference_file = config_file["Path to manual reference file"]
+    hierarchy_name = "practice_hierarchy"
+    if not USE_CORPORATE_REFERENCE:
+        with open(manual_reference_file, "rb") as f:
+            hierarchy_name = f"{hierarchy_name}_{hashlib.sha256(f.read()).hexdigest()[:12]}"
+
+    backend = config_file.get("Reference data backend", "sql")
+    refresh = config_file.get("Refresh reference snapshot", "False") == "True"
+    persist = backend in ("snapshot", "offline")
+    if persist and not refresh:
+        snapshot_path = reference.get_snapshot_path(config_file)
+        practice_hierarchy = reference.read_from_snapshot(snapshot_path, hierarchy_name, ach_date, practice_codes)
+        if practice_hierarchy is not None:
+            return practice_hierarchy
+
+    practice_mapping = reference.resolve_reference_data(reference_data, "practice_mapping", ach_date, config_file, practice_codes)
+    pcn_map = reference.resolve_reference_data(reference_data, "pcn_mapping", ach_date, config_file, practice_codes)
+    if USE_CORPORATE_REFERENCE:
+        mapping_max = reference.resolve_reference_data(reference_data, "geography_mapping", ach_date, config_file, practice_codes)
     else:
-        mapping_max = manual_file_mapping()
-
-  
-    mapping = pd.merge(practice_mapping,
-                           mapping_max,
-                           left_on = "SUB_ICB_LOC_CODE",
-                           right_on = "DH_GEOGRAPHY_CODE",
-                           how = "left").drop(columns = [
-                                "DATE_OF_OPERATION", 
-                                "DH_GEOGRAPHY_CODE"
-                            ]).rename(columns={
-                                "DH_GEOGRAPHY_NAME":"SUB_ICB_LOC_NAME",
-                                "GEOGRAPHY_CODE":"ONS_SUB_ICB_LOC_CODE"
-                            })
-
-    mapping = pd.merge(mapping,
-                           mapping_max,
-                           left_on = "ICB_CODE",
-                           right_on = "DH_GEOGRAPHY_CODE",
-                           how = "left").drop(columns = [
-                                "DATE_OF_OPERATION", 
-                                "DH_GEOGRAPHY_CODE"
-                            ]).rename(columns={
-                                "DH_GEOGRAPHY_NAME":"ICB_NAME",
-                                "GEOGRAPHY_CODE":"ONS_ICB_CODE"
-                            })
-
-    mapping = pd.merge(mapping,
-                           mapping_max,
-                           left_on = "COMM_REGION_CODE",
-                           right_on = "DH_GEOGRAPHY_CODE",
-                           how = "left").drop(columns = [
-                                "DATE_OF_OPERATION", 
-                                "DH_GEOGRAPHY_CODE"
-                            ]).rename(columns={
-                                "DH_GEOGRAPHY_NAME":"COMM_REGION_NAME",
-                                "GEOGRAPHY_CODE":"ONS_COMM_REGION_CODE"
-                            })
-    
-
-    # ADD A DAY TO ACHEIVEMENT DATE TO FILL IN NULL END DATES
-    ach_date_slice = ach_date[0:10]
-    ach_date_datetime = datetime.strptime(ach_date_slice, "%Y-%m-%d")
-    ach_date_add1 = ach_date_datetime + pd.DateOffset(days=1)
-    output_date = datetime.strftime(ach_date_datetime, "%d%b%Y")
-
-
-    # Sort the mapping of the practices and order of the columns before doing anything with the data
-    mapping_cols = [
-            "PUBLICATION", 
-            "ACH_DATE", 
-            "PRACTICE_CODE",
-            "PRACTICE_NAME",
-            "POSTCODE",
-            "PCN_ODS_CODE",
-            "PCN_NAME",
-            "ONS_SUB_ICB_LOC_CODE", 
-            "SUB_ICB_LOC_CODE", 
-            "SUB_ICB_LOC_NAME",
-            "ONS_ICB_CODE", 
-            "ICB_CODE",
-            "ICB_NAME",
-            "ONS_COMM_REGION_CODE",
-            "COMM_REGION_CODE",
-            "COMM_REGION_NAME"
-        ]
-
-    
-    pcn_map = create_pcn_mappings(ach_date)
-    
-    
-    mapping = pd.merge(mapping, pcn_map, how='left',on=['PRACTICE_CODE','PRACTICE_NAME']).drop_duplicates()
-    mapping.PCN_ODS_CODE.fillna("U", inplace = True)
-    mapping.PCN_NAME.fillna("Unallocated", inplace = True)
-    mapping["PUBLICATION"] = "GP_PRAC_PAT_LIST"
-    mapping["ACH_DATE"] = output_date
-    practices_with_mapping = pd.DataFrame(mapping[mapping_cols])
-
-    ##Ready for export
-    mapping_export = practices_with_mapping.rename(columns={"POSTCODE":"PRACTICE_POSTCODE"})
-
-    
-    # Drop achievement date from mapping file so we don't have duplicate columns when mapping to data
-    practices_with_mapping = practices_with_mapping.drop(columns=["ACH_DATE"])
-        
-    LDHC_with_mappings = pd.merge(practices_with_mapping, dataFrame, on='PRACTICE_CODE')
-    dataFrame = LDHC_with_mappings[headings]
-    return dataFrame
\ No newline at end of file
+        mapping_max = manual_file_mapping(manual_reference_file, ach_date)
+    practice_hierarchy = build_practice_hierarchy(practice_mapping, pcn_map, mapping_max)
+
+    if persist:
+        reference.write_to_snapshot(practice_hierarchy, reference.get_snapshot_path(config_file), hierarchy_name, ach_date, practice_codes)
+    return practice_hierarchy
+
+def manual_file_mapping(manual_reference_file, ach_date):
+    """
+    Loads the geography lookup from the manual reference file in the same form as the 
+    'geography_mapping' reference query
+    """
+    df = pd.read_csv(manual_reference_file)
+    df = df.rename(columns={'NAME':'DH_GEOGRAPHY_NAME', 'ONS_CODE':'GEOGRAPHY_CODE', 'ODS_CODE':'DH_GEOGRAPHY_CODE'})
+    df = df.drop(columns=['GEOGRAPHY'])
+    df['DATE_OF_OPERATION'] = ach_date
+    return df
+
+def build_practice_hierarchy(practice_mapping, pcn_map, mapping_max):
+    """
+    Builds the practice hierarchy table with one row per practice, ordered by practice code
+    as returned by the practice query.
+
+    Every geography level is looked up in one geography table indexed by ODS code, instead of
+    merging the geography table on once per level. Practices with more than one PCN keep the
+    first and a warning is raised. Practices without a PCN are given the code 'U' and name
+    'Unallocated'.
+    """
+    geography = mapping_max.drop_duplicates("DH_GEOGRAPHY_CODE").set_index("DH_GEOGRAPHY_CODE")
+    practice_hierarchy = practice_mapping.drop_duplicates("PRACTICE_CODE").reset_index(drop=True)
+    for code_col, ons_code_col, name_col in GEOGRAPHY_LEVELS:
+        practice_hierarchy[ons_code_col] = practice_hierarchy[code_col].map(geography["GEOGRAPHY_CODE"])
+        practice_hierarchy[name_col] = practice_hierarchy[code_col].map(geography["DH_GEOGRAPHY_NAME"])
+
+    pcn_map = pcn_map[['PRACTICE_NAME','PRACTICE_CODE','PCN_NAME','PCN_ODS_CODE']].drop_duplicates()
+    multiple_pcns = pcn_map.loc[pcn_map.duplicated(['PRACTICE_CODE','PRACTICE_NAME']), 'PRACTICE_CODE'].unique()
+    if len(multiple_pcns) > 0:
+        warnings.warn(f"The following practice(s) are mapped to more than one PCN, the first PCN is being used: {list(multiple_pcns)}")
+    pcn_map = pcn_map.drop_duplicates(['PRACTICE_CODE','PRACTICE_NAME'])
+    practice_hierarchy = practice_hierarchy.merge(pcn_map, how='left', on=['PRACTICE_CODE','PRACTICE_NAME'], validate='one_to_one')
+    practice_hierarchy['PCN_ODS_CODE'] = practice_hierarchy['PCN_ODS_CODE'].fillna("U")
+    practice_hierarchy['PCN_NAME'] = practice_hierarchy['PCN_NAME'].fillna("Unallocated")
+    return practice_hierarchy[HIERARCHY_COLS]
@@ -1,4 +1,48 @@
+import operator
+import re
+import numpy as np
 import pandas as pd
+from ..data import collection_schema as schema
+
+# Default rule set, see suppress_output for the rule language. A different set can be supplied
+# through the optional "Suppression rules" key in the config file.
+DEFAULT_SUPPRESSION_RULES = [
+    {
+        "description": "For all fractional indicators: omit exclusion counts",
+        "action": "drop",
+        "targets": ["Exclusion"]
+    },
+    {
+        "description": "For fractional indicators with 1 PCA: where denominator <2 and PCA > 0, suppress the PCA and the denominator",
+        "PCA_count": "== 1",
+        "conditions": ["Denominator < 2", "max(PCA) > 0"],
+        "action": "suppress",
+        "targets": ["PCA", "Denominator"]
+    },
+    {
+        "description": "For fractional indicators with >1 PCA: where denominator = 0 and one PCA equals the sum of all PCAs, suppress all PCAs",
+        "PCA_count": "> 1",
+        "conditions": ["Denominator == 0", "nonzero(PCA) == 1"],
+        "action": "suppress",
+        "targets": ["PCA"]
+    }
+]
+
+COMPARISON_OPERATORS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "!=": operator.ne
+}
+
+AGGREGATIONS = {"sum": "sum", "max": "max", "min": "min", "count": "sum", "nonzero": "sum"}
+
+# Stands in for a missing practice or indicator code when grouping the rows
+MISSING_KEY = "<missing>"
+
+CONDITION_PATTERN = re.compile(r"^\s*(?:(\w+)\((.+?)\)|(.+?))\s*(<=|>=|==|!=|<|>)\s*(-?\d+(?:\.\d+)?)\s*$")
 
 
 def suppress_output(
@@ -10,351 +54,309 @@ def suppress_output(
     main_table_meas_col_name='MEASURE',
     main_table_value_col_name='VALUE',
     main_table_prac_code_col_name='PRACTICE_CODE',
-    main_table_ind_code_col_name='IND_CODE'
+    main_table_ind_code_col_name='IND_CODE',
+    main_table_suppressed_col_name='SUPPRESSED',
+    suppression_rules=None,
+    collection_schema=None
 ):
     """
-    TO BE UPDATED 
-
-    Applies the following rules to the fully processed dataframe:
+    Applies a set of suppression rules to the fully processed dataframe. By default these are
+    (see DEFAULT_SUPPRESSION_RULES):
 
     1. For all fractional indicators: omit exclusion counts from publications (this is already implemented for LDHC, but would be a change for all other publications e.g. QOF, NCDES, INLIQ...)
 
     2. For fractional indicators with 1 PCA specified: where denominator <2 and PCA > 0, suppress the PCA and the denominator for that indicator
 
     3. For fractional indicators with >1 PCA specified: where denominator = 0 and the sum of all PCAs is equal to the value of any one PCA, suppress all the PCAs for that indicator
-    
-    
+
+    Rules are dicts so the same function can serve other publications by passing a different
+    rule set (argument 'suppression_rules' or the "Suppression rules" config key):
+
+        action:     'suppress' (publish the value as a '*') or 'drop' (remove the row)
+        targets:    measure names or measure types (from the 'Measures' sheet) the action applies to
+        PCA_count:  optional, e.g. '== 1', restricts the rule to indicators with that many PCAs
+        conditions: optional, all must hold for a practice/indicator pair. Either
+                    '<measure name/type> <op> <number>' (true if any such row meets it) or
+                    '<func>(<measure name/type>) <op> <number>' with func one of
+                    sum, max, min, count, nonzero (number of distinct measures with a non-zero value)
+
+    The measure types and PCA counts come from the compiled collection schema (argument 
+    'collection_schema', loaded if not given) rather than from parsing the data dictionary.
+
     Function can be broken down into 4 main parts:
     
     a. Ingestion/pre-processing 
-    b. Dealing with suppression relating to point '2.' above
-    c. Dealing with suppression realting to point '3.' above
-    d. Recombining dataframes
+    b. Compiling the rule set
+    c. Evaluating every rule in one grouped pass over the practice/indicator pairs
+    d. Adding the suppression mask as a column and dropping rows
+
+    The measure types are looked up as a column alongside the table rather than merged into
+    it, and the output is taken from the input in one step (see apply_suppression), so the
+    table is only copied once.
+
+    The values stay numeric, the suppressed rows are flagged in a boolean column 
+    (main_table_suppressed_col_name, 'SUPPRESSED' by default) and the '*' is only put in by 
+    the output writers (see output.output_writers). get_suppressed_view gives the table with 
+    the '*' in place for anything that needs it in that form.
     """
     # -------------------------------------------------- a -------------------------------------------------------- #
-    # Load in measure dictionary
-    root = config_file["root_directory"]
-    path_to_dict = f"{root}\\Data_dictionaries\\LDHC Data Dictionary_Python_only.xlsx"
-    measure_dict = pd.read_excel(path_to_dict, sheet_name=None)['Measures']
-
+    # Measure dictionary from the compiled collection schema
+    if collection_schema is None:
+        collection_schema = schema.load_collection_schema(config_file)
+    measure_dict = collection_schema.measure_dict
     
-    # Merge in measure type data to main table
-    merged_table = pd.merge(
-        main_table, 
-        measure_dict, 
-        left_on=main_table_meas_col_name, 
-        right_on=measure_dict_meas_col_name, 
-        how='left'
+    # Measure type of each row of the main table
+    measure_types = get_measure_types(
+        main_table,
+        measure_dict,
+        measure_dict_meas_col_name=measure_dict_meas_col_name,
+        measure_dict_meas_type_col_name=measure_dict_meas_type_col_name,
+        main_table_meas_col_name=main_table_meas_col_name
     )
 
-    # Split dataframe so different suppression rules can be applied to each split
-    merged_df_1_PCA, merged_df_2_plus_PCA, merged_df_0_PCA = split_dataframe(merged_table,
-                                                                            measure_dict_meas_col_name=measure_dict_meas_col_name,
-                                                                            measure_dict_meas_type_col_name=measure_dict_meas_type_col_name,
-                                                                            main_table_ind_code_col_name=main_table_ind_code_col_name
-                                                                            )
-    
-    # -------------------------------------------------- b -------------------------------------------------------- #
-    # filter relevant merged df according to denominator condition for indicators with one PCA 
-    denom_condition_met_1_PCA = denom_condition_1_PCA(merged_df_1_PCA)
-    # Apply suppression to indicators with one PCA that meet the denominator condition and PCA condition
-    PCA_1_out = suppress_1_PCA(
-        denom_condition_met_1_PCA,
-        merged_df_1_PCA,
-        measure_dict_meas_type_col_name,
-        main_table_value_col_name,
-        main_table_prac_code_col_name,
-        main_table_ind_code_col_name,
-        main_table_meas_col_name
+    # Number of PCAs belonging to each row's indicator, used by the rules' 'PCA_count' restriction
+    PCA_counts = get_PCA_counts(
+        main_table,
+        collection_schema.PCA_counts,
+        main_table_ind_code_col_name=main_table_ind_code_col_name
     )
-
     
+    # -------------------------------------------------- b -------------------------------------------------------- #
+    if suppression_rules is None:
+        suppression_rules = config_file.get("Suppression rules", DEFAULT_SUPPRESSION_RULES)
+    compiled_rules = compile_suppression_rules(suppression_rules)
     
     # -------------------------------------------------- c -------------------------------------------------------- #
-    # filter relevant merged df according to denominator condition for indicators with 2 or more PCAs
-    denom_condition_met_2_plus_PCA = denom_condition_2_plus_PCA(
-        merged_df_2_plus_PCA,
+    suppress_mask, drop_mask = evaluate_suppression_rules(
+        compiled_rules,
+        main_table,
+        measure_types,
+        PCA_counts,
         main_table_meas_col_name=main_table_meas_col_name,
         main_table_value_col_name=main_table_value_col_name,
         main_table_prac_code_col_name=main_table_prac_code_col_name,
         main_table_ind_code_col_name=main_table_ind_code_col_name
     )
     
-    # Filter the above df to only contain PCA values; i.e. isolate PCAs for practice/indicator combinations meeting denominator suppression criterion
-    only_PCAs = denom_condition_met_2_plus_PCA[denom_condition_met_2_plus_PCA[measure_dict_meas_type_col_name] == 'PCA']
-    
-    # Pivot the filtered table so that we can apply summation logic
-    pivoted = pivot_measures_col(
-        only_PCAs,
-        main_table_value_col_name=main_table_value_col_name,
-        main_table_prac_code_col_name=main_table_prac_code_col_name,
-        main_table_ind_code_col_name=main_table_ind_code_col_name,
-        main_table_meas_col_name=main_table_meas_col_name
-    )
-    
-    # Get list of indicators that meet the PCA condition for indicators with more than one PCA (and meet the above
-    # denominator condition)
-    list_of_prac_ind_to_supress = get_problem_practice_indicator_pairs(
-        pivoted,
-        main_table_prac_code_col_name=main_table_prac_code_col_name,
-        main_table_ind_code_col_name=main_table_ind_code_col_name
-    )
-    
-    # Apply suppression to indicators with 2 or more PCAs that meet the denominator condition and PCA condition
-    PCA_2_plus_out = suppress_2_plus_PCA(
-        list_of_prac_ind_to_supress,
-        merged_df_2_plus_PCA,
-        main_table_prac_code_col_name,
-        main_table_ind_code_col_name,
-        measure_dict_meas_type_col_name,
-        measure_dict_meas_col_name,
-        measure_dict_meas_description_col_name,
-        main_table_value_col_name
-    )
-    
     # -------------------------------------------------- d -------------------------------------------------------- #
-    re_merged_df_typed = pd.concat(
-        [PCA_1_out, PCA_2_plus_out, merged_df_0_PCA]
-    ) 
-
-    exclusions_dropped = re_merged_df_typed[re_merged_df_typed[measure_dict_meas_type_col_name] != 'Exclusion']
-    # Drop columns from final output
-    fully_suppressed_df = exclusions_dropped.drop(
-        columns=[measure_dict_meas_description_col_name,measure_dict_meas_type_col_name]
+    fully_suppressed_df = apply_suppression(
+        main_table,
+        PCA_counts,
+        suppress_mask,
+        drop_mask,
+        main_table_suppressed_col_name=main_table_suppressed_col_name
     )
 
     # Print how many rows are being suppressed
-    total_suppressed = len(fully_suppressed_df[fully_suppressed_df.VALUE == '*'])
+    total_suppressed = fully_suppressed_df[main_table_suppressed_col_name].sum()
     print(f"Suppressed {total_suppressed} rows")
     
     return fully_suppressed_df  
 
-def split_dataframe(
-    merged_table,
+def get_measure_types(
+    main_table,
+    measure_dict,
     measure_dict_meas_col_name='MEASURE ID',
-    measure_dict_meas_type_col_name = 'MEASURE_TYPE',
-    main_table_ind_code_col_name='IND_CODE'
+    measure_dict_meas_type_col_name='MEASURE_TYPE',
+    main_table_meas_col_name='MEASURE'
 ):
     """
-    Split dataframe according to how many PCAs each indicator has
+    Looks up the measure type of each row's measure in the measure dictionary
 
     Input:
-        Raw df merged with measure dictionary
+        Raw df, measure dictionary
 
     Output:
-        merged_df_1_PCA: input df containing only indicators/practices with one 1 PCA
-        merged_df_2_or_more_PCA: input df containing only indicators/practices with 2 or more PCAs
-        merged_df_0_PCA: input df containing only indicators/practices with 0 PCAs
+        Series aligned to the input rows holding each row's measure type (missing for 
+        measures that aren't in the dictionary)
     """
+    measure_types = measure_dict.drop_duplicates(measure_dict_meas_col_name).set_index(measure_dict_meas_col_name)
+    return main_table[main_table_meas_col_name].map(measure_types[measure_dict_meas_type_col_name])
 
-    # Create count dict that maps IND to number of PCAs
-    unique_meas_ind_table = merged_table[[main_table_ind_code_col_name, measure_dict_meas_col_name,measure_dict_meas_type_col_name]].drop_duplicates()
-    PCA_count_dict = {}
-    for ind in set(unique_meas_ind_table[main_table_ind_code_col_name]):
-        ind_sub_df = unique_meas_ind_table[unique_meas_ind_table[main_table_ind_code_col_name] == ind]
-        PCA_sum = list(ind_sub_df[measure_dict_meas_type_col_name]).count('PCA')
-        PCA_count_dict[ind] = PCA_sum
-
-    # Split main table into two sub tables depending on which PCA condition the table meets 
-    one_PCA_inds = [key for key, val in PCA_count_dict.items() if val == 1]
-    two_plus_PCA_inds = [key for key, val in PCA_count_dict.items() if val > 1]
-    zero_PCA_inds = [key for key, val in PCA_count_dict.items() if val == 0]
-    
-    merged_df_1_PCA = merged_table[merged_table[main_table_ind_code_col_name].isin(one_PCA_inds)]
-    merged_df_2_plus_PCA = merged_table[merged_table[main_table_ind_code_col_name].isin(two_plus_PCA_inds)]
-    merged_df_0_PCA = merged_table[merged_table[main_table_ind_code_col_name].isin(zero_PCA_inds)]
-    
-    return merged_df_1_PCA, merged_df_2_plus_PCA, merged_df_0_PCA
-
-def denom_condition_1_PCA(
-    merged_df_1_PCA,
-    main_table_meas_col_name='MEASURE',
-    main_table_value_col_name='VALUE',
-    main_table_prac_code_col_name='PRACTICE_CODE',
+def get_PCA_counts(
+    main_table,
+    PCA_counts_per_ind,
     main_table_ind_code_col_name='IND_CODE'
 ):
     """
-    Denominator condition for indicators/practices with one PCA: denominator must be less that <2 
-    
+    Looks up how many distinct PCAs each row's indicator has
+
     Input:
-        merged_df_1_PCA
-    
+        Raw df, PCA counts per indicator from the collection schema
+
     Output:
-        Filtered out all indicators from input that don't meet the denominator condition for indicators with one PCA
-        """
-
-    # Filter out which of these indicators don't meet the denom condition for each practice 
-    denom_condition_met_subset = merged_df_1_PCA[
-        (merged_df_1_PCA[main_table_meas_col_name] == 'Denominator') & (merged_df_1_PCA[main_table_value_col_name] < 2)
-        ]
-    # Merge in above df with input to ensure that we retain other measures and not just denominators 
-    denom_condition_met_whole = pd.merge(
-        merged_df_1_PCA.reset_index(), 
-        denom_condition_met_subset[[main_table_prac_code_col_name, main_table_ind_code_col_name]], 
-        on=[main_table_prac_code_col_name, main_table_ind_code_col_name], 
-        how='inner'
-    )
-    
-    return denom_condition_met_whole
+        Series aligned to the input rows holding the number of PCAs of each row's indicator
+        (0 for indicators that aren't in the indicator to measure map)
+    """
+    PCA_counts = main_table[main_table_ind_code_col_name].astype(object).map(PCA_counts_per_ind)
+    return pd.Series(PCA_counts, dtype=float).fillna(0).astype(int)
 
-def suppress_1_PCA(
-    denom_condition_met_1_PCA,
-    merged_df_1_PCA,
-    measure_dict_meas_type_col_name='MEASURE_TYPE',
-    main_table_value_col_name='VALUE',
-    main_table_prac_code_col_name='PRACTICE_CODE',
-    main_table_ind_code_col_name='IND_CODE',
-    main_table_meas_col_name='MEASURE'    
-):
+def compile_suppression_rules(suppression_rules):
+    """
+    Parses each rule's conditions once so that they can be evaluated together
+
+    Input:
+        List of rule dicts (see suppress_output for the rule language)
+
+    Output:
+        List of compiled rule dicts where each condition (and the PCA_count restriction) is a
+        tuple of (aggregation or None, measure name/type, comparison function, threshold)
+    """
+    compiled_rules = []
+    for rule in suppression_rules:
+        if rule["action"] not in ("suppress", "drop"):
+            raise ValueError(f"Unknown suppression action '{rule['action']}' in rule: {rule}")
+        PCA_count = rule.get("PCA_count")
+        compiled_rules.append({
+            "action": rule["action"],
+            "targets": list(rule["targets"]),
+            "PCA_count": parse_condition(f"PCA_count {PCA_count}") if PCA_count else None,
+            "conditions": [parse_condition(condition) for condition in rule.get("conditions", [])]
+        })
+    return compiled_rules
+
+def parse_condition(condition):
     """
-    Test which indicators have a PCA > 0 in 'denom_condition_met_1_PCA' df and if this condition is met, 
-    suppress the PCAs and their associated denominators 
+    Parses a condition string such as 'Denominator < 2' or 'nonzero(PCA) == 1'
+
+    Output:
+        Tuple of (aggregation or None, measure name/type, comparison function, threshold)
     """
-    # Drop all non-PCA rows
-    PCA_filtered = denom_condition_met_1_PCA[denom_condition_met_1_PCA[measure_dict_meas_type_col_name] == 'PCA']
-    # Get a table with only non-zero PCAs
-    table_for_suppression_a = PCA_filtered[PCA_filtered[main_table_value_col_name] > 0]
-    # Get unique identifier to isolate PCAs that need to be suppressed; list these indicator/PCA combinations and the respective indicator/denominator combinations
-    ZIP = zip(table_for_suppression_a[main_table_prac_code_col_name], table_for_suppression_a[main_table_ind_code_col_name], table_for_suppression_a[main_table_meas_col_name])
-    unique_identifier_a = []
-    for val in ZIP:
-        unique_identifier_a.append(val)
-        unique_identifier_a.append(list(val[0:2]) + ['Denominator'])
-    ## Loop through using unqie identifiers and suppress the PCAs and denominators
-    PCA_1_out = merged_df_1_PCA.copy()
-    for ind in unique_identifier_a:
-        PCA_1_out.loc[(PCA_1_out[main_table_prac_code_col_name] == ind[0]) & (PCA_1_out[main_table_ind_code_col_name] == ind[1]) & (PCA_1_out[main_table_meas_col_name] == ind[2]) , main_table_value_col_name] = '*'
-    return PCA_1_out
-
-def denom_condition_2_plus_PCA(
-    merged_df_2_plus_PCA,
+    match = CONDITION_PATTERN.match(condition)
+    if match is None:
+        raise ValueError(f"Could not parse suppression condition '{condition}'")
+    aggregation, aggregated_measure, measure, comparison, threshold = match.groups()
+    if aggregation is not None and aggregation not in AGGREGATIONS:
+        raise ValueError(f"Unknown aggregation '{aggregation}' in suppression condition '{condition}'")
+    return (aggregation, (aggregated_measure or measure).strip(), COMPARISON_OPERATORS[comparison], float(threshold))
+
+def evaluate_suppression_rules(
+    compiled_rules,
+    main_table,
+    measure_types,
+    PCA_counts,
     main_table_meas_col_name='MEASURE',
     main_table_value_col_name='VALUE',
     main_table_prac_code_col_name='PRACTICE_CODE',
     main_table_ind_code_col_name='IND_CODE'
 ):
     """
-    Denominator condition for indicators/practices with two or more PCAs: Denominator must be equal to 0 
-    
+    Evaluates all compiled rules together. Every row level feature the rules need is built as
+    a column, all of them are aggregated per practice/indicator pair in a single groupby and 
+    the resulting group masks are broadcast back to the rows. Rows with a missing practice or
+    indicator code are grouped together, as a merge on the codes would match them. Rules 
+    without conditions apply to every group.
+
     Input:
-        merged_df_2_plus_PCA
-    
-    Output:
-        Filtered out all indicators from input that don't meet the denominator condition for indicators with 2 or more PCAs
+        Compiled rules, raw df, measure types from get_measure_types, PCA counts from get_PCA_counts
 
-        
+    Output:
+        suppress_mask: Boolean mask of rows whose value should be replaced with a '*'
+        drop_mask: Boolean mask of rows that should be removed from the output
     """
-    # Filter to only get denominator/practice rows that meet the denominator condition 
-    merged_filtered = merged_df_2_plus_PCA[
-        (merged_df_2_plus_PCA[main_table_meas_col_name] == 'Denominator') & (merged_df_2_plus_PCA[main_table_value_col_name] == 0)
-    ]
-    
-    # Merge in above df with input to ensure that all items for practice/indicator combinations that meet the denominator criterion are identified
-    full_table_filtered = pd.merge(
-        merged_df_2_plus_PCA, 
-        merged_filtered[[main_table_prac_code_col_name, main_table_ind_code_col_name]], 
-        on=[main_table_prac_code_col_name, main_table_ind_code_col_name], 
-        how='inner'
+    measures = main_table[main_table_meas_col_name]
+    values = pd.to_numeric(main_table[main_table_value_col_name], errors='coerce')
+    group_keys = main_table[[main_table_prac_code_col_name, main_table_ind_code_col_name]]
+    if group_keys.isna().any().any():
+        group_keys = group_keys.astype(object).fillna(MISSING_KEY)
+    group_ids = group_keys.groupby(list(group_keys.columns), sort=False, observed=True).ngroup().to_numpy()
+    n_groups = group_ids.max() + 1 if len(group_ids) else 0
+    first_row_of_measure = ~main_table.duplicated(
+        [main_table_prac_code_col_name, main_table_ind_code_col_name, main_table_meas_col_name]
     )
 
-    return full_table_filtered
+    def rows_matching(measure):
+        return (measures == measure) | (measure_types == measure)
 
-def pivot_measures_col(
-    only_PCAs,
-    main_table_value_col_name='VALUE',
-    main_table_prac_code_col_name='PRACTICE_CODE',
-    main_table_ind_code_col_name='IND_CODE',
-    main_table_meas_col_name='MEASURE'
-):
-    """
-    Pivot dataframe in preparation for testing the PCA condition for indicators with 2+ PCAs
-    """
-    pivoted = pd.pivot_table(
-                    only_PCAs, 
-                    values = main_table_value_col_name, 
-                    index=[main_table_prac_code_col_name, main_table_ind_code_col_name], 
-                    columns = main_table_meas_col_name
-                    ).reset_index().fillna(0)
-    
+    # Build one feature column per distinct condition across all rules
+    features = {}
+    aggregations = {}
+    for rule in compiled_rules:
+        for condition in rule["conditions"]:
+            aggregation, measure, comparison, threshold = condition
+            if condition in features:
+                continue
+            matching = rows_matching(measure)
+            if aggregation is None:
+                features[condition] = matching & comparison(values, threshold)
+                aggregations[condition] = "max"
+            elif aggregation == "count":
+                features[condition] = matching
+            elif aggregation == "nonzero":
+                features[condition] = matching & first_row_of_measure & (values != 0)
+            elif aggregation == "sum":
+                features[condition] = values.where(matching, 0)
+            else:
+                features[condition] = values.where(matching)
+            aggregations.setdefault(condition, AGGREGATIONS.get(aggregation))
 
-    return pivoted
+    feature_names = {condition: f"feature_{i}" for i, condition in enumerate(features)}
+    if features:
+        group_features = pd.DataFrame(
+            {feature_names[condition]: feature.to_numpy() for condition, feature in features.items()}
+        ).groupby(group_ids).agg({feature_names[condition]: aggregations[condition] for condition in features})
 
-def get_problem_practice_indicator_pairs(
-    pivoted,
-    main_table_prac_code_col_name='PRACTICE_CODE',
-    main_table_ind_code_col_name='IND_CODE'
-):
-    """
-    PCA Condition for indicators with 2+ PCAs: The sum of all PCAs is equal to the value of any one PCA
-    
-    Function iterates through the pivoted dataframe and checks which rows are compliant with the 
-    'PCA Condition for indicators with 2+ PCAs'. It adds the practice code/indicator code combinations 
-    for these rows to a list which it then returns.
-    """
-    list_of_prac_ind_to_supress = []
-    # Iterate through pivoted dataframe rows where each row represents all the PCAs for a practice/indicator
-    # pair that meets the denominator condition
-    for i, row in pivoted.iterrows():
-        # Get temp row with only PCA cols
-        row_reduced = row[2:]
-        # If below is true it means there's only one non-zero PCA for that practice/indicator combination (number of zero count PCAs = number of all PCAs-1)
-        # and therefore one PCA value = sum of PCA values for that practice/indicator combination
-        if Counter(row_reduced)[0.0] == len(row_reduced)-1:
-            # Append problem indicators to the list
-            list_of_prac_ind_to_supress.append(
-                (row[main_table_prac_code_col_name], row[main_table_ind_code_col_name])
-            )
-
-    return list_of_prac_ind_to_supress
-
-def suppress_2_plus_PCA(
-    list_of_prac_ind_to_supress,
-    merged_df_2_plus_PCA,
-    main_table_prac_code_col_name,
-    main_table_ind_code_col_name,
-    measure_dict_meas_type_col_name,
-    measure_dict_meas_col_name,
-    measure_dict_meas_description_col_name,
-    main_table_value_col_name
+    suppress_mask = np.zeros(len(main_table), dtype=bool)
+    drop_mask = np.zeros(len(main_table), dtype=bool)
+    for rule in compiled_rules:
+        group_mask = np.ones(n_groups, dtype=bool)
+        for condition in rule["conditions"]:
+            aggregation, measure, comparison, threshold = condition
+            group_values = group_features[feature_names[condition]].to_numpy()
+            if aggregation is None:
+                group_mask &= group_values.astype(bool)
+            else:
+                group_mask &= comparison(group_values.astype(float), threshold)
+        rule_mask = group_mask[group_ids]
+        if rule["PCA_count"] is not None:
+            _, _, comparison, threshold = rule["PCA_count"]
+            rule_mask &= comparison(PCA_counts.to_numpy(), threshold)
+        target_mask = np.zeros(len(main_table), dtype=bool)
+        for target in rule["targets"]:
+            target_mask |= rows_matching(target).to_numpy()
+        if rule["action"] == "suppress":
+            suppress_mask |= rule_mask & target_mask
+        else:
+            drop_mask |= rule_mask & target_mask
+
+    return suppress_mask, drop_mask
+
+def apply_suppression(
+    main_table,
+    PCA_counts,
+    suppress_mask,
+    drop_mask,
+    main_table_suppressed_col_name='SUPPRESSED'
 ):
     """
-    Retrieves indexes to suppress from the 'get_indexes_to_suppress' fn; uses these to locate the 
-    problem values and inserts a *
+    Flags every suppressed row in a boolean column, removes the dropped rows and orders the 
+    rows as indicators with one PCA, then indicators with 2 or more PCAs, then indicators with 
+    no PCAs. The kept rows are taken from the input in a single step, the values are left as
+    they are.
     """
-    indexes_to_suppress = get_indexes_to_suppress(
-        prac_ind_to_suppress=list_of_prac_ind_to_supress,
-        merged_df_2_plus_PCA=merged_df_2_plus_PCA,
-        main_table_prac_code_col_name=main_table_prac_code_col_name,
-        main_table_ind_code_col_name=main_table_ind_code_col_name,
-        measure_dict_meas_type_col_name=measure_dict_meas_type_col_name
-    )
+    PCA_group_order = PCA_counts.clip(upper=2).map({1: 0, 2: 1, 0: 2}).to_numpy()
+    row_order = np.argsort(PCA_group_order, kind='stable')
+    kept_rows = row_order[~drop_mask[row_order]]
+    suppressed_df = main_table.iloc[kept_rows]
+    return suppressed_df.assign(**{main_table_suppressed_col_name: suppress_mask[kept_rows]})
 
-    
-    merged_df_2_plus_PCA.loc[indexes_to_suppress, main_table_value_col_name] = '*'    
-    return merged_df_2_plus_PCA.drop(columns=[measure_dict_meas_col_name, measure_dict_meas_description_col_name, measure_dict_meas_type_col_name])
-
-def get_indexes_to_suppress(
-    prac_ind_to_suppress,
-    merged_df_2_plus_PCA,
-    main_table_prac_code_col_name,
-    main_table_ind_code_col_name,
-    measure_dict_meas_type_col_name
+def get_suppressed_view(
+    suppressed_df,
+    main_table_value_col_name='VALUE',
+    main_table_suppressed_col_name='SUPPRESSED'
 ):
     """
-    Gets a list of indexes to suppress from the rows that meet the suppression
-    condition 
+    Gives the suppressed table in the form it is published in, with a '*' in place of every 
+    suppressed value and without the suppression mask column. The values become a Python 
+    object column holding numbers and '*'s, so this is only for anything that needs the 
+    table in that form, the pipeline itself keeps the mask.
+
+    Input:
+        Table returned by suppress_output (or the mapped output)
+
+    Output:
+        Copy of the table with the suppressed values replaced with a '*'
     """
-    index_to_suppress = []
-    
-    for practice, indicator in prac_ind_to_suppress:
-        # Retrieves a sub dataframe whose rows meet the conditions for suppression
-        subset_to_suppress = merged_df_2_plus_PCA[
-            (merged_df_2_plus_PCA[main_table_prac_code_col_name] == practice) &
-            (merged_df_2_plus_PCA[main_table_ind_code_col_name] == indicator) &
-            (merged_df_2_plus_PCA[measure_dict_meas_type_col_name] == 'PCA')
-            ]  
-        # Adds the indexes for these rows to a list
-        list_subset_to_suppress = [x for x in subset_to_suppress.index]
-        index_to_suppress.extend(list_subset_to_suppress)
-    
-    return index_to_suppress
\ No newline at end of file
+    values = suppressed_df[main_table_value_col_name].to_numpy(dtype=object, copy=True)
+    values[suppressed_df[main_table_suppressed_col_name].to_numpy(dtype=bool)] = '*'
+    return suppressed_df.drop(columns=main_table_suppressed_col_name).assign(**{main_table_value_col_name: values})
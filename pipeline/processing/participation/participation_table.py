@@ -1,8 +1,11 @@
 import pandas as pd
+import numpy as np
 import datetime
 from pipeline.utils.dates import dates
-from openpyxl import load_workbook
+from pipeline.output import participation_history
 
+PARTICIPATION_DESCRIPTIONS = ['Active practices', 'Participated', 'Data Collected']
+PARTICIPATED_STATUS = 'Approved'
 
 def create_participation_table(Participation_df: pd.DataFrame, LDHC_input_df : pd.DataFrame, config_file: dict) -> pd.DataFrame:
     """Wrapper function for calling sub functions
@@ -12,12 +15,59 @@ def create_participation_table(Participation_df: pd.DataFrame, LDHC_input_df : p
         Participation_df (pd.DataFrame): Original dataframe as read from the input Participation CSV file
         LDHC_input_df (pd.DataFrame):  Original dataframe as read from the input LDHC Monthly CSV file
     """
-    participation = read_participation_table_into_df(Participation_df)
-    unique_practices = get_unique_practices(participation)
-    monthly_participation_totals = create_table(participation, unique_practices, LDHC_input_df )
-    write_to_CSV(monthly_participation_totals, config_file)
+    return create_participation_tables(Participation_df, [LDHC_input_df], config_file)
+
+
+def create_participation_tables(Participation_df: pd.DataFrame, LDHC_input_dfs: list, config_file: dict) -> pd.DataFrame:
+    """Creates the participation totals for the achievement month of each of the LDHC inputs
+       in one pass over the participation status intervals, and adds them to the participation
+       totals store. Months already in the store are only replaced if "Restate participation 
+       totals" is 'True' in the config. The practices are counted as count_practices describes,
+       as at each achievement date if "Participation as at achievement date" is 'True'.
+
+    Args:
+        Participation_df (pd.DataFrame): Original dataframe as read from the input Participation CSV file
+        LDHC_input_dfs (list): Original dataframes as read from the input LDHC Monthly CSV files, one per month
+
+    Returns:
+        monthly_participation_totals (pd.DataFrame): The three counts for each month
+    """
+    monthly_participation_totals = get_participation_totals(
+        Participation_df, 
+        LDHC_input_dfs, 
+        as_at_ach_date=config_file.get("Participation as at achievement date", "False") == "True"
+    )
+    participation_history.write_participation_totals(
+        monthly_participation_totals, 
+        config_file, 
+        restate=config_file.get("Restate participation totals", "False") == "True"
+    )
+    if config_file.get("Export participation totals workbook", "False") == "True":
+        participation_history.export_participation_workbook(config_file)
     return monthly_participation_totals
 
+def get_participation_totals(Participation_df: pd.DataFrame, LDHC_input_dfs: list, as_at_ach_date: bool = False) -> pd.DataFrame:
+    """Creates the participation totals for the achievement month of each of the LDHC inputs
+       without adding them to the participation totals store (see create_participation_tables)
+
+    Args:
+        Participation_df (pd.DataFrame): Original dataframe as read from the input Participation CSV file
+        LDHC_input_dfs (list): Original dataframes as read from the input LDHC Monthly CSV files, one per month
+        as_at_ach_date (bool, optional): Count the practices as at each achievement date (see 
+        count_practices). Defaults to False.
+
+    Returns:
+        monthly_participation_totals (pd.DataFrame): The three counts for each month
+    """
+    participation = read_participation_table_into_df(Participation_df)
+    status_intervals = build_status_intervals(participation)
+    collected_counts = pd.Series({
+        dates.get_achievement_date(LDHC_input_df): LDHC_input_df['ORG_CODE'].nunique()
+        for LDHC_input_df in LDHC_input_dfs
+    })
+    monthly_participation_totals = create_table(status_intervals, collected_counts, as_at_ach_date)
+    print('monthly_participation_totals\n', monthly_participation_totals)
+    return monthly_participation_totals
 
 def read_participation_table_into_df(Participation_df: pd.DataFrame)-> pd.DataFrame:
     """Function to format participation table to contain only the rows with participation data and 
@@ -39,89 +89,107 @@ def read_participation_table_into_df(Participation_df: pd.DataFrame)-> pd.DataFr
     return participation
 
 
-def get_unique_practices(participation: pd.DataFrame)-> pd.DataFrame:
-    """Function to get only the practices that have participated along with their
-       participation dates
+def build_status_intervals(participation: pd.DataFrame) -> pd.DataFrame:
+    """Function that turns the status history of each practice into intervals, each status 
+       being in force from its status date until the practice's next status date
 
     Args:
         participation (pd.DataFrame): Formatted participation dataframe
 
     Returns:
-        unique_practices (pd.DataFrame): Dataframe containing all the unique practices that 
-                                         participated along with their dates
+        status_intervals (pd.DataFrame): One row per status with the columns PRACTICE_CODE, STATUS,
+                                         VALID_FROM and VALID_TO (NaT if it is the latest status),
+                                         sorted by practice and date. Statuses without a valid 
+                                         date are treated as having always been in force.
     """
-    required_cols = ['PRACTICE_CODE','STATUS','STATUS_DATE']
-    unique_practices = participation[required_cols]
-    unique_practices = unique_practices[unique_practices['STATUS'] == 'Approved']\
-                    .sort_values('STATUS_DATE', ascending=False).drop_duplicates(['PRACTICE_CODE'])
-    return unique_practices
+    status_intervals = participation.loc[participation['PRACTICE_CODE'].notna(), ['PRACTICE_CODE', 'STATUS', 'STATUS_DATE']].copy()
+    status_intervals['VALID_FROM'] = pd.to_datetime(status_intervals['STATUS_DATE'], format="%d/%m/%Y", errors="coerce")\
+                                    .fillna(pd.Timestamp.min)
+    status_intervals = status_intervals.sort_values(['PRACTICE_CODE', 'VALID_FROM'], kind='stable')
+    status_intervals['VALID_TO'] = status_intervals.groupby('PRACTICE_CODE')['VALID_FROM'].shift(-1)
+    return status_intervals[['PRACTICE_CODE', 'STATUS', 'VALID_FROM', 'VALID_TO']].reset_index(drop=True)
 
 
-def create_table(participation : pd.DataFrame, unique_practices : pd.DataFrame, 
-                 LDHC_input_df : pd.DataFrame) -> pd.DataFrame :
+def count_practices(status_intervals: pd.DataFrame, ach_dates: pd.DatetimeIndex, as_at_ach_date: bool = False) -> pd.DataFrame:
+    """Function that counts the active and participating practices for each achievement date.
+
+       By default every practice in the status report is active and a practice has participated
+       if it has any 'Approved' status, whatever the status dates, so every date gets the same
+       counts from the report being run. With as_at_ach_date the counts are as at each 
+       achievement date instead, evaluating every date at once: a practice is active once it 
+       has any status and has participated if its status in force on the date is 'Approved'.
+       This only differs when statuses change after the achievement date, e.g. restating past 
+       months from a later report, and isn't what has been published so far.
+
+    Args:
+        status_intervals (pd.DataFrame): Status intervals from build_status_intervals
+        ach_dates (pd.DatetimeIndex): Achievement dates
+        as_at_ach_date (bool, optional): Count the practices as at each achievement date. 
+        Defaults to False.
+
+    Returns:
+        practice_counts (pd.DataFrame): 'Active practices' and 'Participated' counts indexed by achievement date
+    """
+    ach_dates = pd.DatetimeIndex(ach_dates)
+    if not as_at_ach_date:
+        practice_codes = status_intervals['PRACTICE_CODE']
+        return pd.DataFrame({
+            'Active practices': practice_codes.nunique(),
+            'Participated': practice_codes[status_intervals['STATUS'] == PARTICIPATED_STATUS].nunique()
+        }, index=ach_dates)
+    ach_date_values = ach_dates.values[np.newaxis, :]
+    valid_from = status_intervals['VALID_FROM'].values[:, np.newaxis]
+    valid_to = status_intervals['VALID_TO'].fillna(pd.Timestamp.max).values[:, np.newaxis]
+    in_force = (valid_from <= ach_date_values) & (ach_date_values < valid_to)
+    participated = (status_intervals['STATUS'] == PARTICIPATED_STATUS).values[:, np.newaxis]
+    first_status = ~status_intervals['PRACTICE_CODE'].duplicated().values
+    return pd.DataFrame({
+        'Active practices': (valid_from[first_status] <= ach_date_values).sum(axis=0),
+        'Participated': (in_force & participated).sum(axis=0)
+    }, index=ach_dates)
+
+
+def create_table(status_intervals : pd.DataFrame, collected_counts : pd.Series, as_at_ach_date: bool = False) -> pd.DataFrame :
     """Function that creates the final dataframe that summarizes the monthly participation totals 
 
     Args:
-        participation (pd.DataFrame): Formatted participation dataframe
-        unique_practices (pd.DataFrame): Dataframe containing all the unique practices that 
-                                         participated along with their dates
-        LDHC_input_df (pd.DataFrame): Original dataframe as read from the input LDHC Monthly CSV file
+        status_intervals (pd.DataFrame): Status intervals from build_status_intervals
+        collected_counts (pd.Series): The number of practices in the LDHC input, indexed by achievement date
+        as_at_ach_date (bool, optional): Count the practices as at each achievement date (see 
+        count_practices). Defaults to False.
 
     Returns:
         monthly_participation_totals (pd.DataFrame):  Final participation dataframe that contains all the three counts 
-                                                      for the given month that is to be 
-                                                      written to output Participation Totals CSV file
+                                                      for each achievement date 
     """                
-
-    no_active_practices = participation['PRACTICE_CODE'].nunique()
-    no_participated_practices = unique_practices.shape[0]
-    no_collected_practices = LDHC_input_df['ORG_CODE'].nunique()
-    ach_date =  dates.get_achievement_date(LDHC_input_df)
-
-    monthly_participation_totals = pd.DataFrame(columns = ['ACH_DATE', 'Description', 'Count'])
-    monthly_participation_totals = append_and_format_rows(monthly_participation_totals, ach_date, no_active_practices, no_participated_practices, no_collected_practices)
-    
-    print('monthly_participation_totals\n', monthly_participation_totals)
-    return monthly_participation_totals
-
-
-def append_and_format_rows(monthly_participation_totals, ach_date, no_active_practices,
-                no_participated_practices,no_collected_practices)-> pd.DataFrame:
-    """Function that populates the rows of the dataframe for the given month
+    practice_counts = count_practices(status_intervals, collected_counts.index, as_at_ach_date)
+    practice_counts['Data Collected'] = collected_counts.values
+    monthly_participation_totals = practice_counts[PARTICIPATION_DESCRIPTIONS]\
+                                    .rename_axis('ACH_DATE').reset_index()\
+                                    .melt(id_vars='ACH_DATE', var_name='Description', value_name='Count')
+    monthly_participation_totals['Description'] = pd.Categorical(monthly_participation_totals['Description'], PARTICIPATION_DESCRIPTIONS)
+    monthly_participation_totals = monthly_participation_totals.sort_values(['ACH_DATE', 'Description'], kind='stable')\
+                                    .reset_index(drop=True)
+    monthly_participation_totals['Description'] = monthly_participation_totals['Description'].astype(str)
+    return format_rows(monthly_participation_totals)
+
+
+def format_rows(monthly_participation_totals: pd.DataFrame)-> pd.DataFrame:
+    """Function that adds the percentage of active practices to each count ('z' for the active 
+       practice count itself)
 
     Args:
-        monthly_participation_totals 
-        ach_date 
-        no_active_practices 
-        no_participated_practices
-        no_collected_practices
+        monthly_participation_totals (pd.DataFrame): The counts for each achievement date
 
     Returns:
-        monthly_participation_totals (pd.DataFrame): Dataframe that contains all the three counts for the given month
+        monthly_participation_totals (pd.DataFrame): Dataframe that contains all the three counts for each month
     """    
-    monthly_participation_totals['Description'] = ['Active practices', 'Participated','Data Collected']
-    monthly_participation_totals['ACH_DATE'] = ach_date
-    monthly_participation_totals['Count'] = [no_active_practices, no_participated_practices, no_collected_practices]
+    no_active_practices = monthly_participation_totals['ACH_DATE'].map(
+        monthly_participation_totals.loc[monthly_participation_totals['Description'] == 'Active practices']
+                                    .set_index('ACH_DATE')['Count']
+    )
     monthly_participation_totals['Percentage'] = (100*monthly_participation_totals['Count']
-                                                .astype(int)/int(no_active_practices))\
+                                                .astype(int)/no_active_practices.astype(int))\
                                                 .round(decimals=2).apply(str)
-    monthly_participation_totals.at[0, 'Percentage'] = 'z'
+    monthly_participation_totals.loc[monthly_participation_totals['Description'] == 'Active practices', 'Percentage'] = 'z'
     return monthly_participation_totals
-
-def write_to_CSV(monthly_participation_totals: pd.DataFrame, config_file: dict):
-    """This function writes the monthly participation total to the LDHC_participation_totals CSV file
-       if it does not already contain an entry for that achievement date
-
-    Args:
-        monthly_participation_totals (pd.DataFrame): Dataframe that contains all the three counts for the given month
-    """
-    root = config_file["root_directory"]
-    participation_total_filepath = f"{root}\\Checks\\LDHC_participation_totals.xlsx"
-    aggregate_participation_totals = pd.read_excel(participation_total_filepath)
-    ach_date = monthly_participation_totals['ACH_DATE'].iloc[0]
-
-    if (ach_date in aggregate_participation_totals.ACH_DATE.values):
-        print("Data for this month already exists in ldhc-participation-totals.")
-    else:   
-        result = pd.concat([aggregate_participation_totals, monthly_participation_totals], ignore_index=True)
-        result.to_excel(participation_total_filepath, index=False)
\ No newline at end of file
@@ -43,7 +43,7 @@ def register_aggregation(filtered_df: pd.DataFrame) -> pd.DataFrame:
     Returns:
         pd.DataFrame: A dataframe mapping the practice to its associated register account
     """    
-    return filtered_df.groupby("ORG_CODE", as_index=False).sum()[['ORG_CODE', 'VALUE']]
+    return filtered_df.groupby("ORG_CODE", as_index=False, observed=True).sum()[['ORG_CODE', 'VALUE']]
 
 def register_format(aggregated_df: pd.DataFrame, relevant_indicator: str, LDHC_input_df: pd.DataFrame) -> pd.DataFrame:
     """Formats the register dataframe to be in the same form as the LDHC main df
@@ -0,0 +1,155 @@
+import numpy as np
+import pandas as pd
+from . import registers
+from .measure_matrix import MeasureMatrix
+from .DQ_checks import DQ_check_2
+from ..data import collection_schema as schema
+from ..data.collection_schema import CollectionSchema
+
+def run(LDHC_matrix: MeasureMatrix, config_file: dict, collection_schema: CollectionSchema = None) -> dict:
+    """Calculates the 14-17 and 18 and over registers and the results of DQ checks 1, 2 and 3
+    from the practice x measure matrix of the LDHC input.
+
+    The matrix is built from the input in a single pass (see measure_matrix.build). Every 
+    register and DQ rule is then column arithmetic on that matrix rather than a filter and 
+    merge over the full input for each check. The results follow the same contracts as the 
+    individual modules (registers, DQ_check_1, DQ_check_2 and DQ_check_3).
+
+    Args:
+        LDHC_matrix (MeasureMatrix): The practice x measure matrix of the main LDHC input
+        config_file (dict): A dictionary containing all config information
+        collection_schema (CollectionSchema, optional): The compiled collection schema, loaded 
+        if not given
+
+    Returns:
+        dict: A dictionary with the keys "register_14_17_df", "register_18_ov_df", "DQ_flag_1_df",
+        "DQ_flag_2_df" and "DQ_flag_3_practice_series"
+    """    
+    if collection_schema is None:
+        collection_schema = schema.load_collection_schema(config_file)
+    register_dfs = {
+        register_name: get_register_df(LDHC_matrix, relevant_indicator, collection_schema.register_field_names)
+        for register_name, relevant_indicator in collection_schema.register_indicators.items()
+    }
+    return {
+        **register_dfs,
+        "DQ_flag_1_df": get_DQ_1_df(LDHC_matrix),
+        "DQ_flag_2_df": get_DQ_2_df(LDHC_matrix, collection_schema.expected_columns),
+        "DQ_flag_3_practice_series": get_DQ_3_series(
+            LDHC_matrix, 
+            register_dfs["register_14_17_df"], 
+            register_dfs["register_18_ov_df"], 
+            collection_schema.payment_count_indicator
+        )
+    }
+
+def get_register_df(LDHC_matrix: MeasureMatrix, relevant_indicator: str, register_field_names: list) -> pd.DataFrame:
+    """Calculates the register for the chosen age bracket, in the same form as 
+    registers.create_register_df
+
+    Args:
+        LDHC_matrix (MeasureMatrix): The practice x measure matrix of the main LDHC input
+        relevant_indicator (str): The indicator code that relates to the age bracket of interest
+                            ("LDHCMI034" -> 14 to 17)
+                            ("LDHCMI035" -> 18 and over)
+        register_field_names (list): The measures summed to make the register
+
+    Returns:
+        pd.DataFrame: The LDHC register for the chosen age bracket
+    """    
+    register_values = sum(LDHC_matrix.column(relevant_indicator, field) for field in register_field_names)
+    has_register = np.logical_or.reduce(
+        [LDHC_matrix.column_present(relevant_indicator, field) for field in register_field_names]
+    )
+    aggregated_df = pd.DataFrame({
+        "ORG_CODE": np.asarray(LDHC_matrix.practices)[has_register],
+        "VALUE": register_values[has_register]
+    })
+    aggregated_df = aggregated_df.sort_values("ORG_CODE").reset_index(drop=True)
+    return registers.register_format(aggregated_df, relevant_indicator, LDHC_matrix.first_row)
+
+def get_DQ_1_df(LDHC_matrix: MeasureMatrix) -> pd.DataFrame:
+    """Finds the practice/indicator pairs where the Numerator > Denominator (see DQ_check_1)
+
+    Args:
+        LDHC_matrix (MeasureMatrix): The practice x measure matrix of the main LDHC input
+
+    Returns:
+        pd.DataFrame: Dataframe of practice codes and associated indicator codes that violate DQ check 1.
+    """    
+    problem_pairs = []
+    for ind_code in LDHC_matrix.columns.get_level_values("IND_CODE").unique():
+        both_valid = (
+            LDHC_matrix.column_valid(ind_code, "Numerator") & LDHC_matrix.column_valid(ind_code, "Denominator")
+        )
+        problem_mask = both_valid & (
+            LDHC_matrix.column(ind_code, "Numerator") > LDHC_matrix.column(ind_code, "Denominator")
+        )
+        problem_pairs.append(pd.DataFrame({
+            "ORG_CODE": np.asarray(LDHC_matrix.practices)[problem_mask],
+            "IND_CODE": ind_code
+        }))
+    DQ_flag_1_df = pd.concat(problem_pairs, ignore_index=True) if problem_pairs else pd.DataFrame(columns=["ORG_CODE", "IND_CODE"])
+    return DQ_flag_1_df.sort_values(["ORG_CODE", "IND_CODE"]).reset_index(drop=True)
+
+def get_DQ_2_df(LDHC_matrix: MeasureMatrix, expected_columns: pd.MultiIndex) -> pd.DataFrame:
+    """Finds the missing and additional information rows (see DQ_check_2). Missing rows are
+    the empty cells of the expected columns and additional rows are the filled cells of the
+    columns that are not in the indicator to measure map.
+
+    Args:
+        LDHC_matrix (MeasureMatrix): The practice x measure matrix of the main LDHC input
+        expected_columns (pd.MultiIndex): The (IND_CODE, FIELD_NAME) pairs in the indicator to 
+        measure map
+
+    Returns:
+        pd.DataFrame: A dataframe containing only the rows violating one of the DQ2 issues
+    """    
+    column_positions = LDHC_matrix.columns.get_indexer(expected_columns)
+    expected_present = np.zeros((len(LDHC_matrix.practices), len(expected_columns)), dtype=bool)
+    found = column_positions >= 0
+    expected_present[:, found] = LDHC_matrix.present[:, column_positions[found]]
+    additional_positions = np.flatnonzero(~LDHC_matrix.columns.isin(expected_columns))
+
+    problem_rows = []
+    for issue, present, columns in [
+        ("missing", ~expected_present, expected_columns),
+        ("additional", LDHC_matrix.present[:, additional_positions], LDHC_matrix.columns.take(additional_positions))
+    ]:
+        row_codes, col_codes = np.nonzero(present)
+        problem_rows.append(pd.DataFrame({
+            "ORG_CODE": np.asarray(LDHC_matrix.practices).take(row_codes),
+            "IND_CODE": np.asarray(columns.get_level_values("IND_CODE")).take(col_codes),
+            "FIELD_NAME": np.asarray(columns.get_level_values("FIELD_NAME")).take(col_codes),
+            "Type_of_information_issue": issue
+        }))
+    return (
+        pd.concat(problem_rows, ignore_index=True)
+        .sort_values(DQ_check_2.ROW_KEY_COLS)
+        .reset_index(drop=True)
+    )
+
+def get_DQ_3_series(LDHC_matrix: MeasureMatrix, register_14_17_df: pd.DataFrame, register_18_ov_df: pd.DataFrame, payment_count_indicator: str) -> pd.Series:
+    """Finds the practices whose payment count is greater than their total LD register (see DQ_check_3)
+
+    Args:
+        LDHC_matrix (MeasureMatrix): The practice x measure matrix of the main LDHC input
+        register_14_17_df (pd.DataFrame): The LDHC register of people aged 14 to 17 for each practice
+        register_18_ov_df (pd.DataFrame): The LDHC register of people aged 18 and over for each practice
+        payment_count_indicator (str): The indicator holding the payment count
+
+    Returns:
+        pd.Series: Series of practices that violate DQ3 rule.
+    """    
+    total_register = (
+        register_14_17_df.set_index("ORG_CODE")["VALUE"]
+        .add(register_18_ov_df.set_index("ORG_CODE")["VALUE"], fill_value=0)
+        .reindex(LDHC_matrix.practices)
+        .to_numpy()
+    )
+    payment_positions = np.flatnonzero(LDHC_matrix.columns.get_level_values("IND_CODE") == payment_count_indicator)
+    payment_values = np.where(
+        LDHC_matrix.valid[:, payment_positions], LDHC_matrix.values[:, payment_positions], np.iinfo("int64").min
+    )
+    problem_mask = (payment_values > total_register[:, None]).any(axis=1)
+    return pd.Series(np.sort(np.asarray(LDHC_matrix.practices)[problem_mask]), name="ORG_CODE")
@@ -0,0 +1,209 @@
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from .data import load, collection_schema
+from .processing import original_mapping
+from .output import write_LDHC_monthly
+from .utils.scheduler.stages import run_stages
+from . import incremental
+
+# Most rows read from the input csv at a time, fewer are read if the memory budget is small
+CHUNK_ROWS = 500_000
+# Peak memory of processing an input held in memory, as a multiple of its size on disk
+INPUT_MEMORY_FACTOR = 12
+# Memory budget used when "Streaming memory budget (MB)" isn't set in the config
+DEFAULT_MEMORY_BUDGET_MB = 4096
+
+def use_streaming(input_path: str, config_file: dict) -> bool:
+    """Decides whether to stream the LDHC input (see run). "Streaming ingestion" in the config
+    can be 'True' or 'False' to force the choice, by default ('auto') the input is streamed
+    if processing it in memory is estimated to need more than "Streaming memory budget (MB)".
+
+    Args:
+        input_path (str): Path to the LDHC input csv
+        config_file (dict): A dictionary containing all the information from the config
+
+    Returns:
+        bool: True if the input should be streamed
+    """
+    mode = config_file.get("Streaming ingestion", "auto")
+    if mode in ("True", "False"):
+        return mode == "True"
+    if mode != "auto":
+        raise ValueError(f"Unknown 'Streaming ingestion' value '{mode}', expected one of ('auto', 'True', 'False')")
+    return os.path.getsize(input_path) * INPUT_MEMORY_FACTOR > get_memory_budget(config_file)
+
+def get_memory_budget(config_file: dict) -> int:
+    """Gets the memory budget in bytes"""
+    return int(config_file.get("Streaming memory budget (MB)", DEFAULT_MEMORY_BUDGET_MB)) * 2**20
+
+def run(config_file: dict, stages: list, run_report=None) -> pd.DataFrame:
+    """Processes the LDHC input without ever holding all of it in memory, so that extracts
+    covering several months or years can go through the same processing as a monthly input.
+
+    Every processing rule applies to a single practice, so the input is read in chunks and
+    its rows are routed to partitions (csv files in a temporary folder), each holding every
+    row of a set of practices for one achievement date (see partition_input). The practice
+    stages (see incremental.PRACTICE_STAGES) are run on one partition at a time and each
+    partition's output is written to the month's outputs. The DQ results of the partitions
+    are combined and the month stages (DQ history, DQ report and participation) run once per
+    month, as in a full run. A month's outputs are only put in place once its DQ report has
+    passed. The inputs are archived by the caller (see pipeline_wrapper.run).
+
+    Partitions hold consecutive practices of the practice hierarchy, so the output is the same
+    as a full run's. Peak memory is bounded by the size of a partition, which is set from the
+    memory budget (see get_memory_budget), rather than by the size of the input.
+
+    Args:
+        config_file (dict): A dictionary containing all the information from the config
+        stages (list): The processing stages (see pipeline_wrapper.get_processing_stages)
+        run_report (RunReport, optional): Records every stage if given. Defaults to None.
+
+    Returns:
+        pd.DataFrame: The practices (ORG_CODE) and achievement date (ACH_DATE) of the latest
+        month in the input
+    """
+    input_path = load.get_input_path(config_file, "LDHC_monthly")
+    Participation_in = load.load_input_csv(config_file, "Participation")
+    schema = collection_schema.load_collection_schema(config_file)
+    stages_by_name = {stage.name: stage for stage in stages}
+    with tempfile.TemporaryDirectory(prefix="ldhc_partitions_") as partition_folder:
+        months = partition_input(input_path, partition_folder, config_file)
+        for month in months:
+            print(f"Processing {month['ach_date']} in {len(month['partition_paths'])} partitions")
+            process_month(month, Participation_in, schema, config_file, stages_by_name, run_report)
+    return months[-1]["practices"]
+
+def partition_input(input_path: str, partition_folder: str, config_file: dict) -> list:
+    """Splits the LDHC input into partitions of whole practices for each achievement date.
+
+    The input is read twice, a chunk at a time. The first pass only reads the achievement
+    date, practice and value of each row to count each practice's rows, and the practices of
+    each month are then cut into partitions of consecutive practices in practice hierarchy
+    order (practices without a hierarchy entry go last). The second pass appends each chunk's
+    rows to their practice's partition as they appear in the input. Values are copied as
+    text, so reading a partition (see read_partition) gives the types a full load would.
+
+    Args:
+        input_path (str): Path to the LDHC input csv
+        partition_folder (str): Folder to write the partitions to
+        config_file (dict): A dictionary containing all the information from the config
+
+    Returns:
+        list: A dict for each achievement date in the input, in date order, holding the
+        "ach_date" (YYYY-MM-DD), its "practices", its "practice_hierarchy", its 
+        "partition_paths" in hierarchy order and whether it has any blank values
+        ("has_blank_values")
+    """
+    partition_rows = max(1, int(get_memory_budget(config_file) / INPUT_MEMORY_FACTOR / estimate_bytes_per_row(input_path)))
+    chunk_rows = min(CHUNK_ROWS, partition_rows)
+    row_counts = []
+    blank_value_dates = set()
+    for chunk in read_chunks(input_path, chunk_rows, usecols=["ACH_DATE", "ORG_CODE", "VALUE"]):
+        row_counts.append(chunk.groupby(["ACH_DATE", "ORG_CODE"], sort=False).size())
+        blank_value_dates.update(chunk.loc[chunk["VALUE"] == "", "ACH_DATE"].unique())
+    row_counts = pd.concat(row_counts).groupby(level=[0, 1], sort=True).sum()
+
+    months = []
+    partition_keys = []
+    partition_ids = []
+    n_partitions = 0
+    for ach_date_code, practice_row_counts in row_counts.groupby(level=0, sort=True):
+        practice_row_counts = practice_row_counts.droplevel(0)
+        practices = pd.DataFrame({"ORG_CODE": practice_row_counts.index.to_numpy(dtype=object), "ACH_DATE": ach_date_code})
+        reference_data = original_mapping.prefetch_reference_data(practices, config_file)
+        ach_date = pd.to_datetime(ach_date_code, format="%Y%m%d").strftime("%Y-%m-%d")
+        practice_codes = original_mapping.get_practice_filter(practices["ORG_CODE"], config_file)
+        practice_hierarchy = original_mapping.get_practice_hierarchy(ach_date, config_file, reference_data, practice_codes)
+        practice_ranks = pd.Index(practice_hierarchy["PRACTICE_CODE"], dtype=object).get_indexer(practices["ORG_CODE"])
+        practice_order = np.lexsort((practices["ORG_CODE"].to_numpy(), np.where(practice_ranks >= 0, practice_ranks, len(practice_hierarchy))))
+        ordered_row_counts = practice_row_counts.to_numpy()[practice_order]
+        # Practices are put in the partition their first row falls in, counting partition_rows
+        # rows per partition, and partitions left empty by large practices are dropped
+        _, practice_partitions = np.unique((np.cumsum(ordered_row_counts) - ordered_row_counts) // partition_rows, return_inverse=True)
+        first_id = n_partitions
+        n_partitions += practice_partitions.max() + 1
+        partition_keys.extend((ach_date_code, practice) for practice in practices["ORG_CODE"].to_numpy()[practice_order])
+        partition_ids.extend(first_id + practice_partitions)
+        months.append({
+            "ach_date": ach_date,
+            "practices": practices,
+            "practice_hierarchy": practice_hierarchy,
+            "partition_paths": [os.path.join(partition_folder, f"partition_{i}.csv") for i in range(first_id, n_partitions)],
+            "has_blank_values": ach_date_code in blank_value_dates
+        })
+
+    partition_index = pd.MultiIndex.from_tuples(partition_keys)
+    partition_paths = [path for month in months for path in month["partition_paths"]]
+    partition_ids = np.asarray(partition_ids)
+    for chunk in read_chunks(input_path, chunk_rows):
+        chunk_ids = partition_ids[partition_index.get_indexer(pd.MultiIndex.from_arrays([chunk["ACH_DATE"], chunk["ORG_CODE"]]))]
+        for partition_id, rows in chunk.groupby(chunk_ids, sort=False):
+            append_rows(rows, partition_paths[partition_id])
+    return months
+
+def append_rows(rows: pd.DataFrame, path: str) -> None:
+    """Appends rows to a partition, writing the header if the partition is new. pyarrow's csv
+    writer is used if pyarrow is installed as it is much faster than DataFrame.to_csv."""
+    header = not os.path.exists(path)
+    try:
+        import pyarrow
+        import pyarrow.csv
+    except ImportError:
+        rows.to_csv(path, mode="a", header=header, index=False)
+        return
+    with open(path, "ab") as f:
+        pyarrow.csv.write_csv(
+            pyarrow.Table.from_pandas(rows, preserve_index=False), 
+            f, 
+            pyarrow.csv.WriteOptions(include_header=header, quoting_style="needed")
+        )
+
+def read_chunks(input_path: str, chunk_rows: int, usecols: list = None):
+    """Reads the input csv chunk_rows rows at a time, with every value as it appears in the file"""
+    return pd.read_csv(input_path, usecols=usecols, dtype=str, keep_default_na=False, chunksize=chunk_rows)
+
+def estimate_bytes_per_row(input_path: str, sample_bytes: int = 2**20) -> float:
+    """Estimates the average size on disk of a row of the input csv from its first rows"""
+    with open(input_path, "rb") as f:
+        sample = f.read(sample_bytes)
+    return len(sample) / max(sample.count(b"\n"), 1)
+
+def read_partition(partition_path: str, month: dict, config_file: dict) -> pd.DataFrame:
+    """Reads a partition with the types a full load of the input would give (see
+    load.read_input_file). Values are read as floats if any value of the month is blank, as
+    they would be if the whole input was read at once."""
+    partition_df = load.read_input_file(partition_path, "LDHC_monthly", {**config_file, "Use input cache": "False"})
+    if month["has_blank_values"] and pd.api.types.is_integer_dtype(partition_df["VALUE"]):
+        partition_df["VALUE"] = partition_df["VALUE"].astype("float64")
+    return partition_df
+
+def process_month(month: dict, Participation_df: pd.DataFrame, schema, config_file: dict, stages_by_name: dict, run_report=None) -> None:
+    """Processes the partitions of one month, writing their output a partition at a time (see
+    write_LDHC_monthly.open_output_writers), then runs the month stages on the combined DQ
+    results. The outputs are only put in place once the month stages have finished.
+
+    Args:
+        month (dict): The month (see partition_input)
+        Participation_df (pd.DataFrame): The participation input
+        schema (CollectionSchema): The compiled collection schema
+        config_file (dict): A dictionary containing all the information from the config
+        stages_by_name (dict): The processing stages by name
+        run_report (RunReport, optional): Records every stage if given. Defaults to None.
+    """
+    DQ_results = []
+    with write_LDHC_monthly.open_output_writers(month["practices"], config_file) as write_output:
+        for partition_path in month["partition_paths"]:
+            partition_df = read_partition(partition_path, month, config_file)
+            results = incremental.process_practices(partition_df, config_file, stages_by_name, month["practice_hierarchy"], schema, run_report)
+            write_output(results["LDHC_mapped"])
+            DQ_results.append({**results, "LDHC_mapped": results["LDHC_mapped"].iloc[:0]})
+        data = {
+            "LDHC_Monthly_df": month["practices"],
+            "Participation_df": Participation_df,
+            "config_file": config_file,
+            **incremental.concat_practice_results(DQ_results)
+        }
+        run_stages(incremental.get_month_stages(stages_by_name), data, run_report=run_report)
+    return
@@ -0,0 +1,178 @@
+import cProfile
+import datetime
+import json
+import os
+import platform
+import threading
+import time
+import tracemalloc
+from typing import Callable, Optional
+import numpy as np
+import pandas as pd
+
+PROFILE_MODES = ("off", "cprofile", "tracemalloc")
+# Number of allocation sites kept per stage when profiling with tracemalloc
+TOP_ALLOCATIONS = 10
+
+class RunReport:
+    """Collects a record per pipeline stage (see call_stage) and writes them out as a JSON 
+    run report in {root}\\Checks\\run_reports.
+
+    The "Profile stages" config key switches on deeper profiling: 'cprofile' dumps a .prof 
+    file per stage next to the report and 'tracemalloc' traces allocations, adding each 
+    stage's peak traced memory, the change in traced memory over the stage and top 
+    allocation sites to its record. DataFrame memory 
+    usage is only measured deeply (including the contents of object columns) when profiling.
+    """
+    def __init__(self, config_file: dict):
+        self.profile = config_file.get("Profile stages", "off")
+        if self.profile not in PROFILE_MODES:
+            raise ValueError(f"Unknown 'Profile stages' value '{self.profile}', expected one of {PROFILE_MODES}")
+        self.started = datetime.datetime.now()
+        self.run_id = self.started.strftime("%Y%m%d_%H%M%S")
+        root = config_file["root_directory"]
+        self.report_folder = config_file.get("Path to run reports", f"{root}\\Checks\\run_reports")
+        self.profile_dir = os.path.join(self.report_folder, f"run_{self.run_id}_profiles") if self.profile == "cprofile" else None
+        self.metadata = {}
+        self.stages = []
+        self._lock = threading.Lock()
+        self._start_time = time.perf_counter()
+        self._start_cpu_time = time.process_time()
+        if self.profile == "cprofile":
+            os.makedirs(self.profile_dir, exist_ok=True)
+        elif self.profile == "tracemalloc" and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def measure(self, stage_name: str, function: Callable, **kwargs):
+        """Calls function with kwargs in this thread, recording it as a stage"""
+        result, record = call_stage(stage_name, function, kwargs, self.profile, self.profile_dir)
+        self.add_stage(record)
+        return result
+
+    def add_stage(self, record: dict) -> None:
+        """Adds a stage record"""
+        with self._lock:
+            self.stages.append(record)
+
+    def write(self, status: str = "succeeded", error: Optional[str] = None) -> str:
+        """Writes the run report
+
+        Args:
+            status (str, optional): 'succeeded' or 'failed'. Defaults to "succeeded".
+            error (Optional[str], optional): The error a failed run raised. Defaults to None.
+
+        Returns:
+            str: Path of the run report
+        """        
+        report = {
+            "run_id": self.run_id,
+            "status": status,
+            "error": error,
+            "started_at": self.started.isoformat(timespec="seconds"),
+            "wall_time_s": round(time.perf_counter() - self._start_time, 6),
+            "cpu_time_s": round(time.process_time() - self._start_cpu_time, 6),
+            "profile": self.profile,
+            "profile_dir": self.profile_dir,
+            "python_version": platform.python_version(),
+            "pandas_version": pd.__version__,
+            **self.metadata,
+            "stages": sorted(self.stages, key=lambda record: record["started_at"])
+        }
+        if self.profile == "tracemalloc":
+            report["peak_traced_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        os.makedirs(self.report_folder, exist_ok=True)
+        report_path = os.path.join(self.report_folder, f"run_report_{self.run_id}.json")
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+        return report_path
+
+def create_run_report(config_file: dict) -> Optional[RunReport]:
+    """Creates a RunReport if "Write run report" is 'True' in the config, otherwise None"""
+    if config_file.get("Write run report", "False") != "True":
+        return None
+    return RunReport(config_file)
+
+def measure(run_report: Optional[RunReport], stage_name: str, function: Callable, **kwargs):
+    """Calls function with kwargs, recording it as a stage if there is a run report"""
+    if run_report is None:
+        return function(**kwargs)
+    return run_report.measure(stage_name, function, **kwargs)
+
+def call_stage(stage_name: str, function: Callable, kwargs: dict, profile: str = "off", profile_dir: Optional[str] = None) -> tuple:
+    """Calls a stage function and records its wall time, CPU time (of the thread it runs 
+    in), the rows and memory of its inputs and outputs and, when profiling, its cProfile 
+    stats or peak traced memory and top allocation sites. 
+
+    This is a module level function so that it can run stages on a process pool. Peak 
+    traced memory is process wide, so stages running concurrently in threads share it. The 
+    peak is only reset for each stage from Python 3.9 (tracemalloc.reset_peak), before that 
+    it is the peak since tracing started, so the change in traced memory over the stage is 
+    recorded too.
+
+    Args:
+        stage_name (str): Name of the stage
+        function (Callable): The stage function
+        kwargs (dict): The stage function's arguments
+        profile (str, optional): One of PROFILE_MODES. Defaults to "off".
+        profile_dir (Optional[str], optional): Folder cProfile stats are dumped to. Defaults to None.
+
+    Returns:
+        tuple: The stage function's result and the stage record
+    """    
+    deep = profile != "off"
+    record = {
+        "stage": stage_name,
+        "pid": os.getpid(),
+        "thread": threading.current_thread().name,
+        "inputs": describe_values(kwargs, deep)
+    }
+    profiler = cProfile.Profile() if profile == "cprofile" else None
+    if profile == "tracemalloc":
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        start_traced_memory = tracemalloc.get_traced_memory()[0]
+    record["started_at"] = datetime.datetime.now().isoformat(timespec="microseconds")
+    start_time = time.perf_counter()
+    start_cpu_time = time.thread_time()
+    if profiler is not None:
+        result = profiler.runcall(function, **kwargs)
+    else:
+        result = function(**kwargs)
+    record["wall_time_s"] = round(time.perf_counter() - start_time, 6)
+    record["cpu_time_s"] = round(time.thread_time() - start_cpu_time, 6)
+    if profiler is not None and profile_dir is not None:
+        record["profile_file"] = os.path.join(profile_dir, f"{stage_name}.prof")
+        profiler.dump_stats(record["profile_file"])
+    if profile == "tracemalloc":
+        traced_memory, peak_traced_memory = tracemalloc.get_traced_memory()
+        record["peak_traced_memory_bytes"] = peak_traced_memory
+        record["traced_memory_change_bytes"] = traced_memory - start_traced_memory
+        record["top_allocations"] = [
+            {"location": str(stat.traceback), "size_bytes": stat.size, "count": stat.count}
+            for stat in tracemalloc.take_snapshot().statistics("lineno")[:TOP_ALLOCATIONS]
+        ]
+    record["outputs"] = describe_value(result, deep)
+    return result, record
+
+def describe_values(values: dict, deep: bool = False) -> dict:
+    """Describes each value of a dict that holds tabular data (see describe_value)"""
+    descriptions = {name: describe_value(value, deep) for name, value in values.items()}
+    return {name: description for name, description in descriptions.items() if description is not None}
+
+def describe_value(value, deep: bool = False):
+    """Gets the type, row count and memory usage of a DataFrame, Series or array, the 
+    description of each field of a dict or named tuple holding them, or None for anything else"""
+    if isinstance(value, pd.DataFrame):
+        return {"type": "DataFrame", "rows": len(value), "columns": value.shape[1], "memory_bytes": int(value.memory_usage(deep=deep).sum())}
+    if isinstance(value, pd.Series):
+        return {"type": "Series", "rows": len(value), "memory_bytes": int(value.memory_usage(deep=deep))}
+    if isinstance(value, np.ndarray):
+        return {"type": "ndarray", "rows": value.shape[0] if value.ndim else 1, "memory_bytes": int(value.nbytes)}
+    if isinstance(value, dict):
+        return describe_values(value, deep) or None
+    if isinstance(value, tuple) and hasattr(value, "_fields"):
+        return describe_values(value._asdict(), deep) or None
+    return None
@@ -0,0 +1,171 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from typing import Callable, Dict, List, NamedTuple
+from ..instrumentation.run_report import RunReport, call_stage
+
+STAGE_KINDS = ("io", "cpu")
+
+class Stage(NamedTuple):
+    """A pipeline stage
+
+    name:     Unique name of the stage
+    function: Called with the stage's inputs as keyword arguments. Must be picklable (a 
+              module level function or a functools.partial of one) if it may run in a process
+    inputs:   Maps each of the function's arguments to the name of the data passed to it
+    outputs:  Names the function's result is stored under. With more than one output the 
+              function must return a dict holding each of them
+    after:    Stages that must have finished first even though none of their outputs are used
+    kind:     'io' stages run in a thread, 'cpu' stages in a process if a process pool is used
+    """
+    name: str
+    function: Callable
+    inputs: Dict[str, str]
+    outputs: List[str] = []
+    after: List[str] = []
+    kind: str = "io"
+
+def get_stage_dependencies(stages: List[Stage], available: set) -> Dict[str, set]:
+    """Works out which stages each stage has to wait for, checking that the graph is complete 
+    and acyclic
+
+    Args:
+        stages (List[Stage]): The stages of the graph
+        available (set): Names of the data available before any stage runs
+
+    Raises:
+        ValueError: If a stage name or output is declared twice, an input is never produced, 
+        an 'after' stage doesn't exist, a kind is unknown or the stages form a cycle
+
+    Returns:
+        Dict[str, set]: Maps each stage name to the names of the stages it depends on
+    """    
+    producers = {}
+    for stage in stages:
+        if stage.kind not in STAGE_KINDS:
+            raise ValueError(f"Stage '{stage.name}' has unknown kind '{stage.kind}', expected one of {STAGE_KINDS}")
+        for output in stage.outputs:
+            if output in producers or output in available:
+                raise ValueError(f"'{output}' is produced by more than one stage")
+            producers[output] = stage.name
+    stage_names = [stage.name for stage in stages]
+    if len(set(stage_names)) != len(stage_names):
+        raise ValueError(f"Stage names must be unique: {stage_names}")
+
+    dependencies = {}
+    for stage in stages:
+        stage_dependencies = set()
+        for data_name in stage.inputs.values():
+            if data_name in producers:
+                stage_dependencies.add(producers[data_name])
+            elif data_name not in available:
+                raise ValueError(f"Input '{data_name}' of stage '{stage.name}' isn't produced by any stage")
+        for stage_name in stage.after:
+            if stage_name not in stage_names:
+                raise ValueError(f"Stage '{stage.name}' runs after unknown stage '{stage_name}'")
+            stage_dependencies.add(stage_name)
+        dependencies[stage.name] = stage_dependencies
+
+    # Kahn's algorithm, any stage left unvisited is on a cycle
+    remaining = {name: set(stage_dependencies) for name, stage_dependencies in dependencies.items()}
+    ready = [name for name, stage_dependencies in remaining.items() if not stage_dependencies]
+    while ready:
+        finished = ready.pop()
+        del remaining[finished]
+        for name, stage_dependencies in remaining.items():
+            if finished in stage_dependencies:
+                stage_dependencies.discard(finished)
+                if not stage_dependencies:
+                    ready.append(name)
+    if remaining:
+        raise ValueError(f"The following stages form a cycle: {sorted(remaining)}")
+    return dependencies
+
+def run_stages(stages: List[Stage], data: dict, max_workers: int = None, use_process_pool: bool = False, run_report: RunReport = None, keep: List[str] = None) -> dict:
+    """Runs a graph of stages, starting each stage as soon as the stages it depends on have
+    finished so that independent stages run concurrently. 'io' stages run on a thread pool 
+    and 'cpu' stages too unless use_process_pool is True, in which case they run on a 
+    process pool.
+
+    If a stage raises, no further stages are started and the exception is raised once the 
+    stages already running have finished, so a stage that must not run after a failure 
+    (e.g. one that writes outputs) only needs to depend on the stage that checks for it.
+
+    If keep is given, every stage output that isn't in it is released as soon as the last
+    stage using it has finished, so that the intermediate tables of a run don't all stay in
+    memory until the end.
+
+    Args:
+        stages (List[Stage]): The stages to run
+        data (dict): The data available before any stage runs, e.g. the inputs and config
+        max_workers (int, optional): Size of each pool. Defaults to the executors' default.
+        use_process_pool (bool, optional): Run 'cpu' stages in processes. Defaults to False.
+        run_report (RunReport, optional): Records each stage (see run_report.call_stage) if given. 
+        Defaults to None.
+        keep (List[str], optional): The stage outputs to return. Defaults to None, every output
+        is returned.
+
+    Returns:
+        dict: The given data plus every stage output (or the outputs in keep)
+    """    
+    dependencies = get_stage_dependencies(stages, set(data))
+    # Number of stages still to run that use each stage output
+    remaining_uses = {output: 0 for stage in stages for output in stage.outputs}
+    for stage in stages:
+        for data_name in set(stage.inputs.values()) & set(remaining_uses):
+            remaining_uses[data_name] += 1
+    stages_by_name = {stage.name: stage for stage in stages}
+    results = dict(data)
+    finished = set()
+    pending = [stage.name for stage in stages]
+    running: Dict[Future, Stage] = {}
+    use_process_pool = use_process_pool and any(stage.kind == "cpu" for stage in stages)
+    with ThreadPoolExecutor(max_workers=max_workers) as thread_pool, \
+            (ProcessPoolExecutor(max_workers=max_workers) if use_process_pool else nullcontext()) as process_pool:
+        while pending or running:
+            for name in [name for name in pending if dependencies[name] <= finished]:
+                stage = stages_by_name[name]
+                pool = process_pool if (use_process_pool and stage.kind == "cpu") else thread_pool
+                kwargs = {argument: results[data_name] for argument, data_name in stage.inputs.items()}
+                if run_report is None:
+                    running[pool.submit(stage.function, **kwargs)] = stage
+                else:
+                    running[pool.submit(call_stage, stage.name, stage.function, kwargs, run_report.profile, run_report.profile_dir)] = stage
+                pending.remove(name)
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                try:
+                    result = future.result()
+                except BaseException:
+                    for other_future in running:
+                        other_future.cancel()
+                    raise
+                if run_report is not None:
+                    result, record = result
+                    record["kind"] = stage.kind
+                    record["executor"] = "process" if (use_process_pool and stage.kind == "cpu") else "thread"
+                    run_report.add_stage(record)
+                results.update(get_stage_outputs(stage, result))
+                finished.add(stage.name)
+                if keep is not None:
+                    release_outputs(stage, results, remaining_uses, keep)
+    return results
+
+def release_outputs(finished_stage: Stage, results: dict, remaining_uses: dict, keep: List[str]) -> None:
+    """Releases the stage outputs no stage still to run uses, once a stage has finished"""
+    for data_name in set(finished_stage.inputs.values()) & set(remaining_uses):
+        remaining_uses[data_name] -= 1
+    for data_name in set(finished_stage.inputs.values()) | set(finished_stage.outputs):
+        if remaining_uses.get(data_name) == 0 and data_name not in keep:
+            results.pop(data_name, None)
+
+def get_stage_outputs(stage: Stage, result) -> dict:
+    """Maps a stage's result onto its declared outputs"""
+    if len(stage.outputs) == 0:
+        return {}
+    if len(stage.outputs) == 1:
+        return {stage.outputs[0]: result}
+    missing_outputs = [output for output in stage.outputs if output not in result]
+    if missing_outputs:
+        raise ValueError(f"Stage '{stage.name}' didn't return the outputs {missing_outputs}")
+    return {output: result[output] for output in stage.outputs}
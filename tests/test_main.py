@@ -0,0 +1,32 @@
+import json
+import pandas as pd
+import pytest
+import main
+from pipeline.output import participation_history
+
+def write_config(tmp_path) -> str:
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps({
+        "root_directory": str(tmp_path),
+        "Path to DQ history store": str(tmp_path / "DQ_check_history.sqlite"),
+        "Path to participation totals store": str(tmp_path / "LDHC_participation_totals.sqlite")
+    }))
+    return str(config_path)
+
+def test_export_participation_writes_the_store_out(tmp_path):
+    config_path = write_config(tmp_path)
+    participation_totals = pd.DataFrame({
+        "ACH_DATE": ["2022-05-31"] * 3,
+        "Description": ["Active practices", "Participated", "Data Collected"],
+        "Count": [10, 4, 2],
+        "Percentage": ["z", "40.0", "20.0"]
+    })
+    participation_history.write_participation_totals(participation_totals, json.loads(open(config_path).read()))
+    output_path = tmp_path / "LDHC_participation_totals.xlsx"
+    assert main.main(["export-participation", "--config", config_path, "--output", str(output_path)]) == 0
+    exported = pd.read_excel(output_path)
+    assert exported[["Description", "Count"]].values.tolist() == [["Active practices", 10], ["Participated", 4], ["Data Collected", 2]]
+
+def test_export_dq_needs_a_store(tmp_path):
+    with pytest.raises(SystemExit):
+        main.main(["export-dq", "--config", write_config(tmp_path)])
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+from pipeline.processing import measure_matrix, single_pass_checks
+
+REGISTER_FIELD_NAMES = ["Denominator", "HLTHCHKDEC"]
+
+def make_input(rows: list) -> pd.DataFrame:
+    """Builds an LDHC input table from (ORG_CODE, IND_CODE, FIELD_NAME, VALUE) rows"""
+    input_df = pd.DataFrame(rows, columns=["ORG_CODE", "IND_CODE", "FIELD_NAME", "VALUE"])
+    input_df.insert(0, "QUALITY_SERVICE", "LDHC")
+    input_df.insert(2, "ACH_DATE", "20220430")
+    input_df["APPROVED"] = "Y"
+    return input_df
+
+def test_blank_values_are_skipped():
+    LDHC_input_df = make_input([
+        ("P1", "LDHCMI035", "Denominator", np.nan),
+        ("P1", "LDHC001", "Numerator", 5),
+        ("P1", "LDHC001", "Denominator", np.nan),
+        ("P1", "LDHC021", "Count", np.nan),
+        ("P2", "LDHCMI035", "Denominator", 10),
+        ("P2", "LDHCMI035", "HLTHCHKDEC", np.nan),
+        ("P2", "LDHC001", "Numerator", 5),
+        ("P2", "LDHC001", "Denominator", 3),
+        ("P2", "LDHC021", "Count", 20),
+    ])
+    LDHC_matrix = measure_matrix.build(LDHC_input_df)
+
+    # A cell holding only blanks sums to 0, as the groupby sum the registers were built with did
+    assert LDHC_matrix.values.min() >= 0
+    register_df = single_pass_checks.get_register_df(LDHC_matrix, "LDHCMI035", REGISTER_FIELD_NAMES)
+    assert register_df[["ORG_CODE", "VALUE"]].values.tolist() == [["P1", 0], ["P2", 10]]
+
+    # Comparisons with a blank are false, so P1 isn't flagged by DQ 1 or DQ 3
+    DQ_flag_1_df = single_pass_checks.get_DQ_1_df(LDHC_matrix)
+    assert DQ_flag_1_df.values.tolist() == [["P2", "LDHC001"]]
+    register_14_17_df = single_pass_checks.get_register_df(LDHC_matrix, "LDHCMI034", REGISTER_FIELD_NAMES)
+    DQ_flag_3_series = single_pass_checks.get_DQ_3_series(LDHC_matrix, register_14_17_df, register_df, "LDHC021")
+    assert DQ_flag_3_series.tolist() == ["P2"]
+
+def test_to_long_keeps_blank_values():
+    LDHC_input_df = make_input([
+        ("P1", "LDHC001", "Numerator", 5),
+        ("P1", "LDHC001", "Denominator", np.nan),
+        ("P2", "LDHC001", "Numerator", 2),
+    ])
+    long_df = measure_matrix.to_long(measure_matrix.build(LDHC_input_df))
+    pd.testing.assert_frame_equal(long_df, LDHC_input_df, check_dtype=False)
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+from pipeline.processing import original_suppression
+
+def make_table(rows: list) -> pd.DataFrame:
+    """Builds a formatted LDHC table from (PRACTICE_CODE, IND_CODE, MEASURE, VALUE) rows"""
+    return pd.DataFrame(rows, columns=["PRACTICE_CODE", "IND_CODE", "MEASURE", "VALUE"])
+
+def evaluate(suppression_rules: list, main_table: pd.DataFrame, measure_types: list, PCA_counts: list) -> tuple:
+    return original_suppression.evaluate_suppression_rules(
+        original_suppression.compile_suppression_rules(suppression_rules),
+        main_table,
+        pd.Series(measure_types, index=main_table.index),
+        pd.Series(PCA_counts, index=main_table.index)
+    )
+
+def test_rules_without_conditions():
+    main_table = make_table([
+        ("P1", "LDHC001", "Exclusions", 1),
+        ("P1", "LDHC001", "Denominator", 5),
+        ("P2", "LDHC001", "Exclusions", 0)
+    ])
+    suppress_mask, drop_mask = evaluate(
+        [{"action": "drop", "targets": ["Exclusion"]}],
+        main_table, ["Exclusion", "Denominator", "Exclusion"], [1, 1, 1]
+    )
+    assert drop_mask.tolist() == [True, False, True]
+    assert not suppress_mask.any()
+
+def test_missing_codes_are_grouped_together():
+    main_table = make_table([
+        ("P1", "LDHC001", "Denominator", 1),
+        ("P1", "LDHC001", "PCA", 1),
+        (np.nan, "LDHC001", "Denominator", 5),
+        (np.nan, "LDHC001", "PCA", 1),
+        ("P2", np.nan, "Denominator", 0),
+        ("P2", np.nan, "PCA", 3)
+    ])
+    suppress_mask, drop_mask = evaluate(
+        original_suppression.DEFAULT_SUPPRESSION_RULES,
+        main_table, ["Denominator", "PCA"] * 3, [1] * 6
+    )
+    assert suppress_mask.tolist() == [True, True, False, False, True, True]
+    assert not drop_mask.any()
@@ -0,0 +1,32 @@
+import pandas as pd
+import pytest
+from pipeline.output import output_writers
+
+@pytest.mark.parametrize("pandas_version, line_terminator_arg", [("1.2.0", "line_terminator"), ("1.5.3", "lineterminator")])
+def test_to_csv_bytes_line_terminator_argument(monkeypatch, pandas_version, line_terminator_arg):
+    to_csv_kwargs = {}
+    def to_csv(self, **kwargs):
+        to_csv_kwargs.update(kwargs)
+        return ""
+    monkeypatch.setattr(pd, "__version__", pandas_version)
+    monkeypatch.setattr(pd.DataFrame, "to_csv", to_csv)
+    output_writers.to_csv_bytes(pd.DataFrame({"A": [1]}), header=True)
+    assert to_csv_kwargs[line_terminator_arg] == output_writers.CSV_LINE_TERMINATOR
+
+@pytest.mark.parametrize("line_terminator", ["\n", "\r\n"])
+def test_encoders_write_the_same_csv(monkeypatch, line_terminator):
+    monkeypatch.setattr(output_writers, "CSV_LINE_TERMINATOR", line_terminator)
+    LDHC_output_df = pd.DataFrame({
+        "PRACTICE_CODE": ["A10001", "A10002", "A10003"],
+        "MEASURE": ["Count", "Numerator, scaled", "Count"],
+        "VALUE": [3, 1, 0],
+        "SUPPRESSED": [False, True, False]
+    })
+    encoded = {
+        encoder: b"".join(output_writers.encode_csv(output_writers.get_published_values(LDHC_output_df), True, encoder))
+        for encoder in ("arrow", "pandas")
+    }
+    assert encoded["arrow"] == encoded["pandas"]
+    assert encoded["pandas"].decode().split(line_terminator) == [
+        "PRACTICE_CODE,MEASURE,VALUE", "A10001,Count,3", 'A10002,"Numerator, scaled",*', "A10003,Count,0", ""
+    ]
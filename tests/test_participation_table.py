@@ -0,0 +1,24 @@
+import pandas as pd
+from pipeline.processing.participation import participation_table
+
+PARTICIPATION_PATH = "public_metadata/synthetic-LDHC_QS Part Status-LDHC.csv"
+
+def make_LDHC_input(ach_date: str, practice_codes: list) -> pd.DataFrame:
+    return pd.DataFrame({"ACH_DATE": ach_date, "ORG_CODE": practice_codes})
+
+def test_totals_match_published_definition():
+    # The sample report has 10 practices, 4 of them Approved (3 of those after May 2022)
+    monthly_participation_totals = participation_table.get_participation_totals(
+        pd.read_csv(PARTICIPATION_PATH), [make_LDHC_input("20220531", ["A10001", "A10010"])]
+    )
+    assert monthly_participation_totals[["Description", "Count", "Percentage"]].values.tolist() == [
+        ["Active practices", 10, "z"],
+        ["Participated", 4, "40.0"],
+        ["Data Collected", 2, "20.0"]
+    ]
+
+def test_totals_as_at_achievement_date():
+    monthly_participation_totals = participation_table.get_participation_totals(
+        pd.read_csv(PARTICIPATION_PATH), [make_LDHC_input("20220531", ["A10001", "A10010"])], as_at_ach_date=True
+    )
+    assert monthly_participation_totals["Count"].tolist() == [6, 1, 2]
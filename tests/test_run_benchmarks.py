@@ -0,0 +1,14 @@
+import pandas as pd
+from pipeline.benchmarks import run_benchmarks
+
+def test_timings_table_keeps_run_order():
+    results_df = pd.DataFrame({
+        "N_PRACTICES": [500, 500, 500, 100, 100, 100],
+        "STAGE": ["registers", "registers", "DQ_1"] * 2,
+        "VARIANT": ["matrix", "legacy", "legacy"] * 2,
+        "SECONDS": [1.0, 2.0, None, 4.0, 5.0, None]
+    })
+    timings_df = run_benchmarks.get_timings_table(results_df)
+    assert timings_df.index.tolist() == [("registers", "matrix"), ("registers", "legacy")]
+    assert timings_df.columns.tolist() == [500, 100]
+    assert timings_df.values.tolist() == [[1.0, 4.0], [2.0, 5.0]]
@@ -0,0 +1,14 @@
+import tracemalloc
+import numpy as np
+from pipeline.utils.instrumentation import run_report
+
+def test_tracemalloc_profiling_without_reset_peak(monkeypatch):
+    # tracemalloc.reset_peak is only available from Python 3.9
+    monkeypatch.delattr(tracemalloc, "reset_peak", raising=False)
+    try:
+        result, record = run_report.call_stage("stage", lambda size: np.ones(size), {"size": 100_000}, profile="tracemalloc")
+    finally:
+        tracemalloc.stop()
+    assert len(result) == 100_000
+    assert record["traced_memory_change_bytes"] >= result.nbytes
+    assert record["peak_traced_memory_bytes"] >= record["traced_memory_change_bytes"]
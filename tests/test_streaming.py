@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pipeline import streaming
+from pipeline.data import load
+from pipeline.processing import measure_matrix, single_pass_checks
+from tests.test_measure_matrix import make_input, REGISTER_FIELD_NAMES
+
+def get_DQ_results(LDHC_input_df: pd.DataFrame) -> tuple:
+    LDHC_matrix = measure_matrix.build(LDHC_input_df)
+    register_df = single_pass_checks.get_register_df(LDHC_matrix, "LDHCMI035", REGISTER_FIELD_NAMES)
+    return register_df[["ORG_CODE", "VALUE"]].values.tolist(), single_pass_checks.get_DQ_1_df(LDHC_matrix).values.tolist()
+
+@pytest.mark.parametrize("typed_input_loading", ["True", "False"])
+def test_partitions_with_blank_values_match_a_full_load(tmp_path, typed_input_loading):
+    config_file = {"Typed input loading": typed_input_loading, "Use input cache": "False"}
+    input_path = str(tmp_path / "input.csv")
+    make_input([
+        ("P1", "LDHCMI035", "Denominator", np.nan),
+        ("P1", "LDHC001", "Numerator", 5),
+        ("P1", "LDHC001", "Denominator", np.nan),
+        ("P2", "LDHCMI035", "Denominator", 10),
+        ("P2", "LDHC001", "Numerator", 5),
+        ("P2", "LDHC001", "Denominator", 3),
+    ]).to_csv(input_path, index=False)
+    full_df = load.read_input_file(input_path, "LDHC_monthly", config_file)
+
+    # Each practice in its own partition, copied as text as partition_input does
+    partition_dfs = []
+    for practice, rows in next(streaming.read_chunks(input_path, 100)).groupby("ORG_CODE", sort=True):
+        partition_path = str(tmp_path / f"partition_{practice}.csv")
+        streaming.append_rows(rows, partition_path)
+        partition_dfs.append(streaming.read_partition(partition_path, {"has_blank_values": True}, config_file))
+
+    # P2's partition has no blanks but is read as floats, as the full load is
+    assert all(partition_df["VALUE"].dtype == full_df["VALUE"].dtype for partition_df in partition_dfs)
+    partition_results = [get_DQ_results(partition_df) for partition_df in partition_dfs]
+    assert get_DQ_results(full_df) == (
+        [row for register, _ in partition_results for row in register],
+        [row for _, DQ_flag_1 in partition_results for row in DQ_flag_1]
+    )
+    assert get_DQ_results(full_df) == ([["P1", 0], ["P2", 10]], [["P2", "LDHC001"]])
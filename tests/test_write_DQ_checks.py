@@ -0,0 +1,30 @@
+import pandas as pd
+import pytest
+from pipeline.output import write_DQ_checks
+from pipeline.processing.DQ_checks import report_dq_check_results
+
+LDHC_INPUT_DF = pd.DataFrame({"ACH_DATE": ["20220430"], "ORG_CODE": ["A10001"]})
+
+def get_DQ_flags(DQ_1_issues: list) -> tuple:
+    DQ_flag_1_df = pd.DataFrame(DQ_1_issues, columns=["ORG_CODE", "IND_CODE"])
+    DQ_flag_2_df = pd.DataFrame(columns=["ORG_CODE", "IND_CODE", "FIELD_NAME", "Type_of_information_issue"])
+    DQ_flag_3_practice_series = pd.Series([], dtype=object, name="ORG_CODE")
+    return DQ_flag_1_df, DQ_flag_2_df, DQ_flag_3_practice_series
+
+def test_DQ_results_leave_the_DQ_flags_as_they_are():
+    DQ_flags = get_DQ_flags([])
+    DQ_results = write_DQ_checks.get_DQ_results(*DQ_flags, LDHC_INPUT_DF)
+    assert [len(DQ_flag) for DQ_flag in DQ_flags] == [0, 0, 0]
+    assert list(DQ_flags[0].columns) == ["ORG_CODE", "IND_CODE"]
+    assert DQ_results["DQ_1"].values.tolist()[0][:2] == ["No issues found", "No issues found"]
+    assert DQ_results["DQ_3"]["ORG_CODE"].tolist() == ["No issues found"]
+
+@pytest.mark.parametrize("DQ_1_issues, failed", [([], False), ([["A10001", "LDHC001"]], True)])
+def test_report_reads_the_DQ_results(tmp_path, DQ_1_issues, failed):
+    config_file = {"root_directory": str(tmp_path), "Raise exception if DQ issues found": "True"}
+    DQ_results = write_DQ_checks.get_DQ_results(*get_DQ_flags(DQ_1_issues), LDHC_INPUT_DF)
+    if failed:
+        with pytest.raises(Exception, match=r"\['DQ_1'\]"):
+            report_dq_check_results.report(DQ_results, config_file)
+    else:
+        report_dq_check_results.report(DQ_results, config_file)